@@ -0,0 +1,20 @@
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import Receive, Scope, Send
+
+
+class StreamingAwareGZipMiddleware(GZipMiddleware):
+    """
+    GZip compression that leaves server-sent event streams alone
+
+    The gzip encoder holds small writes back until its buffer fills, which
+    would delay streamed tokens until the end of the response.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            headers = Headers(scope=scope)
+            if scope["path"].endswith("/stream") or "text/event-stream" in headers.get("accept", ""):
+                await self.app(scope, receive, send)
+                return
+        await super().__call__(scope, receive, send)
@@ -2,6 +2,7 @@ from fastapi import FastAPI, Request, status
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from sqlalchemy.exc import SQLAlchemyError
+from app.core.ai_agents.shared.llm_scheduler import LLMQuotaExceededError
 import logging
 
 logger = logging.getLogger(__name__)
@@ -26,6 +27,15 @@ def setup_exception_handlers(app: FastAPI):
             content={"detail": "Database error occurred"}
         )
     
+    @app.exception_handler(LLMQuotaExceededError)
+    async def llm_quota_exception_handler(request: Request, exc: LLMQuotaExceededError):
+        logger.warning(f"LLM quota exceeded: {exc}")
+        return JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            content={"detail": str(exc)},
+            headers={"Retry-After": str(int(exc.retry_after))}
+        )
+    
     @app.exception_handler(Exception)
     async def general_exception_handler(request: Request, exc: Exception):
         logger.error(f"Unexpected error: {exc}")
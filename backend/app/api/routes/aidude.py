@@ -5,29 +5,22 @@ router = APIRouter()
 # AI Dude endpoints will be implemented later
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from app.db.base import get_db
+from app.db.base import SessionLocal, get_db
 from app.api.deps import get_current_user
 from app.db.models.user import User
 from app.db.repositories.project_repository import ProjectRepository
 from app.db.repositories.conversation_repository import ConversationRepository
 from app.schemas.aidude_schemas import AIDudeQueryRequest, AIDudeQueryResponse
 from app.core.ai_agents.ai_dude.aidude_main_agent import aidude_agent
+from app.utils.sse_helpers import sse_response
 
 router = APIRouter()
 
 
-@router.post("/query", response_model=AIDudeQueryResponse)
-async def aidude_query(
-    request: AIDudeQueryRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """
-    Query AI Dude for explanations and guidance
-    """
-    # Verify project ownership
+def _check_project_access(db: Session, project_id: int, current_user: User):
+    """Raise 404/403 unless the user owns the project"""
     project_repo = ProjectRepository(db)
-    project = project_repo.get_by_id(request.project_id)
+    project = project_repo.get_by_id(project_id)
     
     if not project:
         raise HTTPException(
@@ -40,31 +33,87 @@ async def aidude_query(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to access this project"
         )
-    
-    # Get AI response
-    result = await aidude_agent.query(
-        user_question=request.question,
-        code_context=request.code_context
-    )
-    
-    # Save conversation
+
+
+def _save_conversation(db: Session, project_id: int, question: str, answer: str):
+    """Store the user's question and AI Dude's answer"""
     conv_repo = ConversationRepository(db)
     
     # Save user question
     conv_repo.create(
-        project_id=request.project_id,
+        project_id=project_id,
         message_role="user",
-        message_content=request.question
+        message_content=question
     )
     
     # Save AI response
     conv_repo.create(
-        project_id=request.project_id,
+        project_id=project_id,
         message_role="ai_dude",
-        message_content=result["answer"]
+        message_content=answer
     )
+
+
+@router.post("/query", response_model=AIDudeQueryResponse)
+async def aidude_query(
+    request: AIDudeQueryRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Query AI Dude for explanations and guidance
+    """
+    # Verify project ownership
+    _check_project_access(db, request.project_id, current_user)
+    
+    # Get AI response
+    result = await aidude_agent.query(
+        user_question=request.question,
+        code_context=request.code_context
+    )
+    
+    # Save conversation
+    _save_conversation(db, request.project_id, request.question, result["answer"])
     
     return AIDudeQueryResponse(
         answer=result["answer"],
         manual_grounded=result["manual_grounded"]
-    )
\ No newline at end of file
+    )
+
+
+@router.post("/query/stream")
+async def aidude_query_stream(
+    request: AIDudeQueryRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Query AI Dude, streamed as server-sent events: "token" events carry
+    answer text as it is generated, the final "result" event the same
+    body /query returns
+    """
+    _check_project_access(db, request.project_id, current_user)
+    
+    async def events():
+        async for event in aidude_agent.query_stream(
+            user_question=request.question,
+            code_context=request.code_context
+        ):
+            if event["type"] == "token":
+                yield "token", {"text": event["text"]}
+                continue
+            
+            result = event["result"]
+            # The request's session is closed once the response starts streaming
+            stream_db = SessionLocal()
+            try:
+                _save_conversation(stream_db, request.project_id, request.question, result["answer"])
+            finally:
+                stream_db.close()
+            
+            yield "result", AIDudeQueryResponse(
+                answer=result["answer"],
+                manual_grounded=result["manual_grounded"]
+            )
+    
+    return sse_response(events())
@@ -1,33 +1,28 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.db.base import get_db
+from app.db.base import SessionLocal, get_db
 from app.api.deps import get_current_user
 from app.db.models.user import User
 from app.db.repositories.stage_repository import StageRepository
 from app.db.repositories.project_repository import ProjectRepository
 from app.db.repositories.code_repository import CodeRepository
 from app.schemas.code_schemas import GenerateCodeRequest, GeneratedCodeResponse, UpdateCodeRequest, UpdateCodeResponse
+from app.core.ai_agents.shared.llm_scheduler import LLMQuotaExceededError
 from app.core.code_generation.structured_text_generator import st_generator
 from app.services.version_history_service import VersionHistoryService
 from app.core.code_generation.labels_csv_exporter import labels_csv_exporter
 from app.services.global_labels_service import GlobalLabelsService
+from app.utils.sse_helpers import sse_response
 
 router = APIRouter()
 
 
-@router.post("/generate", response_model=GeneratedCodeResponse)
-async def generate_code(
-    request: GenerateCodeRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """
-    Generate Structured Text code for ALL stages (requires all stages to be validated)
-    """
+def _get_project_stages(db: Session, stage_id: int, current_user: User):
+    """The requested stage and all stages of its project; every stage must be validated"""
     # Get stage
     stage_repo = StageRepository(db)
-    stage = stage_repo.get_by_id(request.stage_id)
+    stage = stage_repo.get_by_id(stage_id)
     
     if not stage:
         raise HTTPException(
@@ -57,100 +52,139 @@ async def generate_code(
             detail=f"All stages must be validated before generating code. Unvalidated stages: {stage_names}"
         )
     
-    # Initialize services
+    return stage, all_stages
+
+
+def _stage_data(stg) -> dict:
+    """Stage fields the code generator needs"""
+    return {
+        "id": stg.id,
+        "project_id": stg.project_id,
+        "stage_number": stg.stage_number,
+        "stage_name": stg.stage_name,
+        "stage_type": stg.stage_type,
+        "description": stg.description,
+        "original_logic": stg.original_logic,
+        "edited_logic": stg.edited_logic
+    }
+
+
+def _store_generated_code(
+    db: Session,
+    requested_stage_id: int,
+    generated_results: list,
+    user_id: int
+) -> GeneratedCodeResponse:
+    """
+    Save the code of every stage with one merged set of global labels and
+    return the requested stage's code
+
+    Args:
+        generated_results: (stage data, generator result) per stage
+    """
     global_labels_service = GlobalLabelsService(db)
     code_repo = CodeRepository(db)
     version_service = VersionHistoryService(db)
     
+    # Collect all global labels from all stages
+    all_global_labels = []
+    for _, result in generated_results:
+        all_global_labels.extend(result.get('global_labels', []))
+    
+    # Merge all global labels (deduplicate)
+    merged_global_labels = global_labels_service.merge_global_labels([], all_global_labels)
+    
+    # Save code for ALL stages with unified global labels
+    for stg, result in generated_results:
+        # Delete existing code for this stage
+        code_repo.delete_by_stage(stg["id"])
+        
+        # Create new code with unified global labels
+        new_code = code_repo.create(
+            project_id=stg["project_id"],
+            stage_id=stg["id"],
+            global_labels=merged_global_labels,  # Same for all stages
+            local_labels=result.get('local_labels', []),
+            program_body=result.get('program_body', ''),
+            program_name=result['metadata'].get('program_name', ''),
+            execution_type=result['metadata'].get('execution_type', 'Scan'),
+            metadata=result['metadata'],
+            program_blocks=result.get('program_blocks', []),
+            functions=result.get('functions', []),
+            function_blocks=result.get('function_blocks', [])
+        )
+        
+        # Track version history
+        version_service.create_version_entry(
+            code_id=new_code.id,
+            stage_id=stg["id"],
+            user_id=user_id,
+            action_type="generate_code",
+            new_data={
+                "program_body": result.get('program_body', ''),
+                "global_labels_count": len(merged_global_labels),
+                "local_labels_count": len(result.get('local_labels', [])),
+                "program_blocks_count": len(result.get('program_blocks', [])),
+                "functions_count": len(result.get('functions', [])),
+                "function_blocks_count": len(result.get('function_blocks', []))
+            },
+            metadata={
+                "description": "Code generated for all stages",
+                "program_name": result['metadata'].get('program_name', '')
+            }
+        )
+    
+    # Return the result for the requested stage
+    requested_stage_result = next((r for s, r in generated_results if s["id"] == requested_stage_id), None)
+    
+    if not requested_stage_result:
+        raise Exception("Could not find result for requested stage")
+    
+    return GeneratedCodeResponse(
+        success=True,
+        stage_id=requested_stage_result['stage_id'],
+        stage_name=requested_stage_result['stage_name'],
+        global_labels=merged_global_labels,
+        local_labels=requested_stage_result.get('local_labels', []),
+        program_body=requested_stage_result.get('program_body', ''),
+        metadata=requested_stage_result['metadata'],
+        program_blocks=requested_stage_result.get('program_blocks', []),
+        functions=requested_stage_result.get('functions', []),
+        function_blocks=requested_stage_result.get('function_blocks', [])
+    )
+
+
+@router.post("/generate", response_model=GeneratedCodeResponse)
+async def generate_code(
+    request: GenerateCodeRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Generate Structured Text code for ALL stages (requires all stages to be validated)
+    """
+    stage, all_stages = _get_project_stages(db, request.stage_id, current_user)
+    
     # Generate code for ALL stages
     generated_results = []
-    all_global_labels = []
     
     try:
         for stg in all_stages:
-            # Prepare stage data
-            stage_data = {
-                "id": stg.id,
-                "stage_number": stg.stage_number,
-                "stage_name": stg.stage_name,
-                "stage_type": stg.stage_type,
-                "description": stg.description,
-                "original_logic": stg.original_logic,
-                "edited_logic": stg.edited_logic
-            }
+            stage_data = _stage_data(stg)
             
             # Generate code for this stage
-            result = await st_generator.generate_code(stage_data)
+            result = await st_generator.generate_code(stage_data, use_cache=request.use_cache)
             
             if result['success']:
-                # Collect all global labels from all stages
-                all_global_labels.extend(result.get('global_labels', []))
-                generated_results.append((stg, result))
+                generated_results.append((stage_data, result))
             else:
                 raise Exception(f"Failed to generate code for stage: {stg.stage_name}")
         
-        # Merge all global labels (deduplicate)
-        merged_global_labels = global_labels_service.merge_global_labels([], all_global_labels)
-        
-        # Save code for ALL stages with unified global labels
-        for stg, result in generated_results:
-            # Delete existing code for this stage
-            code_repo.delete_by_stage(stg.id)
-            
-            # Create new code with unified global labels
-            new_code = code_repo.create(
-                project_id=stg.project_id,
-                stage_id=stg.id,
-                global_labels=merged_global_labels,  # Same for all stages
-                local_labels=result.get('local_labels', []),
-                program_body=result.get('program_body', ''),
-                program_name=result['metadata'].get('program_name', ''),
-                execution_type=result['metadata'].get('execution_type', 'Scan'),
-                metadata=result['metadata'],
-                program_blocks=result.get('program_blocks', []),
-                functions=result.get('functions', []),
-                function_blocks=result.get('function_blocks', [])
-            )
-            
-            # Track version history
-            version_service.create_version_entry(
-                code_id=new_code.id,
-                stage_id=stg.id,
-                user_id=current_user.id,
-                action_type="generate_code",
-                new_data={
-                    "program_body": result.get('program_body', ''),
-                    "global_labels_count": len(merged_global_labels),
-                    "local_labels_count": len(result.get('local_labels', [])),
-                    "program_blocks_count": len(result.get('program_blocks', [])),
-                    "functions_count": len(result.get('functions', [])),
-                    "function_blocks_count": len(result.get('function_blocks', []))
-                },
-                metadata={
-                    "description": "Code generated for all stages",
-                    "program_name": result['metadata'].get('program_name', '')
-                }
-            )
-        
-        # Return the result for the requested stage
-        requested_stage_result = next((r for s, r in generated_results if s.id == stage.id), None)
-        
-        if requested_stage_result:
-            return GeneratedCodeResponse(
-                success=True,
-                stage_id=requested_stage_result['stage_id'],
-                stage_name=requested_stage_result['stage_name'],
-                global_labels=merged_global_labels,
-                local_labels=requested_stage_result.get('local_labels', []),
-                program_body=requested_stage_result.get('program_body', ''),
-                metadata=requested_stage_result['metadata'],
-                program_blocks=requested_stage_result.get('program_blocks', []),
-                functions=requested_stage_result.get('functions', []),
-                function_blocks=requested_stage_result.get('function_blocks', [])
-            )
-        else:
-            raise Exception("Could not find result for requested stage")
+        return _store_generated_code(db, stage.id, generated_results, current_user.id)
             
+    except LLMQuotaExceededError:
+        # Answered as 429 with Retry-After by the exception handler
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -160,6 +194,51 @@ async def generate_code(
         )
 
 
+@router.post("/generate/stream")
+async def generate_code_stream(
+    request: GenerateCodeRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Generate code for ALL stages, streamed as server-sent events: a "stage"
+    event as each stage starts, "token" events with its code as it is
+    written, and a final "result" event with the same body /generate returns
+    """
+    stage, all_stages = _get_project_stages(db, request.stage_id, current_user)
+    requested_stage_id = stage.id
+    user_id = current_user.id
+    stages_data = [_stage_data(stg) for stg in all_stages]
+    
+    async def events():
+        generated_results = []
+        for index, stage_data in enumerate(stages_data):
+            yield "stage", {
+                "stage_id": stage_data["id"],
+                "stage_name": stage_data["stage_name"],
+                "index": index + 1,
+                "total": len(stages_data)
+            }
+            
+            async for event in st_generator.generate_code_stream(stage_data, use_cache=request.use_cache):
+                if event["type"] == "token":
+                    yield "token", {"stage_id": stage_data["id"], "text": event["text"]}
+                elif event["result"]['success']:
+                    generated_results.append((stage_data, event["result"]))
+                else:
+                    raise Exception(f"Failed to generate code for stage: {stage_data['stage_name']}")
+        
+        # The request's session is closed once the response starts streaming
+        stream_db = SessionLocal()
+        try:
+            response = _store_generated_code(stream_db, requested_stage_id, generated_results, user_id)
+        finally:
+            stream_db.close()
+        yield "result", response
+    
+    return sse_response(events())
+
+
 @router.get("/stage/{stage_id}")
 async def get_stage_code(
     stage_id: int,
@@ -1,5 +1,73 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from app.db.base import get_db
+from app.api.deps import get_current_user
+from app.db.models.user import User
+from app.db.repositories.project_repository import ProjectRepository
+from app.schemas.knowledge_schemas import KnowledgeSearchRequest, KnowledgeSearchResponse
+from app.services.retrieval_service import FEDERATED_SOURCES, retrieval_service
 
 router = APIRouter()
 
-# Knowledge endpoints will be implemented later
\ No newline at end of file
+
+@router.post("/search", response_model=KnowledgeSearchResponse)
+async def search_knowledge(
+    request: KnowledgeSearchRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Search the manuals, the default safety manuals and a project's safety
+    manual in one call
+    """
+    sources = request.sources
+    if not sources:
+        # Everything, except a project safety manual when no project is given
+        sources = [
+            source for source in FEDERATED_SOURCES
+            if source != "project_safety" or request.project_id is not None
+        ]
+    
+    if request.project_id is not None:
+        project = ProjectRepository(db).get_by_id(request.project_id)
+        
+        if not project:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Project not found"
+            )
+        
+        if project.owner_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to access this project"
+            )
+    
+    try:
+        results = await retrieval_service.federated_search(
+            request.query,
+            sources=sources,
+            project_id=request.project_id,
+            top_k=request.top_k,
+            filter_type=request.filter_type
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    return {
+        "query": request.query,
+        "sources": sources,
+        "results": [
+            {
+                "rank": hit["rank"],
+                "source_index": hit["source_index"],
+                "similarity": hit["similarity"],
+                "content": hit["content"],
+                "metadata": hit.get("metadata", {})
+            }
+            for hit in results
+        ]
+    }
@@ -5,29 +5,22 @@ router = APIRouter()
 # Nexus AI endpoints will be implemented later
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from app.db.base import get_db
+from app.db.base import SessionLocal, get_db
 from app.api.deps import get_current_user
 from app.db.models.user import User
 from app.db.repositories.project_repository import ProjectRepository
 from app.db.repositories.conversation_repository import ConversationRepository
 from app.schemas.nexus_schemas import NexusChatRequest, NexusChatResponse
 from app.core.ai_agents.nexus_ai.nexus_main_agent import nexus_agent
+from app.utils.sse_helpers import sse_response
 
 router = APIRouter()
 
 
-@router.post("/chat", response_model=NexusChatResponse)
-async def nexus_chat(
-    request: NexusChatRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """
-    Chat with Nexus AI for PLC code generation
-    """
-    # Verify project ownership
+def _check_project_access(db: Session, project_id: int, current_user: User):
+    """Raise 404/403 unless the user owns the project"""
     project_repo = ProjectRepository(db)
-    project = project_repo.get_by_id(request.project_id)
+    project = project_repo.get_by_id(project_id)
     
     if not project:
         raise HTTPException(
@@ -40,32 +33,86 @@ async def nexus_chat(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to access this project"
         )
-    
-    # Get AI response
-    result = await nexus_agent.chat(
-        user_message=request.message,
-        project_context=None  # Will add stage context later
-    )
-    
-    # Save conversation to database
+
+
+def _save_conversation(db: Session, project_id: int, user_message: str, ai_message: str):
+    """Store the user's message and Nexus AI's reply"""
     conv_repo = ConversationRepository(db)
     
     # Save user message
     conv_repo.create(
-        project_id=request.project_id,
+        project_id=project_id,
         message_role="user",
-        message_content=request.message
+        message_content=user_message
     )
     
     # Save AI response
     conv_repo.create(
-        project_id=request.project_id,
+        project_id=project_id,
         message_role="nexus_ai",
-        message_content=result["message"]
+        message_content=ai_message
     )
+
+
+@router.post("/chat", response_model=NexusChatResponse)
+async def nexus_chat(
+    request: NexusChatRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Chat with Nexus AI for PLC code generation
+    """
+    # Verify project ownership
+    _check_project_access(db, request.project_id, current_user)
+    
+    # Get AI response
+    result = await nexus_agent.chat(
+        user_message=request.message,
+        project_context=None  # Will add stage context later
+    )
+    
+    # Save conversation to database
+    _save_conversation(db, request.project_id, request.message, result["message"])
     
     return NexusChatResponse(
         response=result["message"],
         phase=result["phase"],
         manual_context_used=result["manual_context_used"]
-    )
\ No newline at end of file
+    )
+
+
+@router.post("/chat/stream")
+async def nexus_chat_stream(
+    request: NexusChatRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Chat with Nexus AI, streamed as server-sent events: "token" events
+    carry reply text as it is generated, the final "result" event the
+    same body /chat returns
+    """
+    _check_project_access(db, request.project_id, current_user)
+    
+    async def events():
+        async for event in nexus_agent.chat_stream(user_message=request.message, project_context=None):
+            if event["type"] == "token":
+                yield "token", {"text": event["text"]}
+                continue
+            
+            result = event["result"]
+            # The request's session is closed once the response starts streaming
+            stream_db = SessionLocal()
+            try:
+                _save_conversation(stream_db, request.project_id, request.message, result["message"])
+            finally:
+                stream_db.close()
+            
+            yield "result", NexusChatResponse(
+                response=result["message"],
+                phase=result["phase"],
+                manual_context_used=result["manual_context_used"]
+            )
+    
+    return sse_response(events())
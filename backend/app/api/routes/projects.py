@@ -7,6 +7,7 @@ from app.schemas.project_schemas import ProjectCreate, ProjectResponse
 from app.db.repositories.project_repository import ProjectRepository
 from app.db.repositories.project_share_repository import ProjectShareRepository
 from app.db.models.user import User, UserRole
+from app.core.ra_system.safety_retrieval_engine import safety_retrieval_engine
 
 router = APIRouter()
 
@@ -117,5 +118,6 @@ def delete_project(
     
     # Hard delete (cascades to all related data due to relationships)
     project_repo.hard_delete(project_id)
+    safety_retrieval_engine.forget(project_id)
     
     return None
\ No newline at end of file
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from pathlib import Path
 import shutil
@@ -14,8 +15,9 @@ from app.schemas.ra_schemas import InterrogateCodeRequest, SafetyAssessmentRespo
 from app.core.ra_system.safety_manual_processor import safety_manual_processor
 from app.core.ra_system.ra_interrogator import ra_interrogator
 from app.config import settings
-# from app.core.ra_system.default_safety_checker import default_safety_checker  # Disabled: network issue
-# from app.core.ra_system.default_safety_processor import default_safety_processor  # Disabled: network issue loading HuggingFace model
+from app.core.ra_system.default_safety_checker import default_safety_checker
+from app.core.ra_system.default_safety_processor import default_safety_processor
+from app.core.ra_system.default_safety_retrieval import default_safety_retrieval
 from app.services.version_history_service import VersionHistoryService
 
 router = APIRouter()
@@ -122,13 +124,11 @@ async def get_default_safety_status(
     """
     Check if default safety manuals are loaded
     """
-    # is_ready = default_safety_processor.is_default_index_ready()
-    is_ready = False  # Disabled temporarily
+    is_ready = default_safety_processor.is_default_index_ready()
     
     if not is_ready:
         # Try to get available manuals
-        # manuals = default_safety_processor.get_default_manuals()
-        manuals = []  # Disabled
+        manuals = default_safety_processor.get_default_manuals()
         
         return {
             "ready": False,
@@ -138,8 +138,8 @@ async def get_default_safety_status(
         }
     
     # Get metadata
-    from app.core.ra_system.default_safety_retrieval import default_safety_retrieval
-    default_safety_retrieval.load_default_safety_manual()
+    from app.services.retrieval_service import retrieval_service
+    await retrieval_service.load_default_safety_manual()
     metadata = default_safety_retrieval.get_metadata()
     
     return {
@@ -160,8 +160,8 @@ async def process_default_manuals(
     (Admin function - can be restricted)
     """
     try:
-        # result = default_safety_processor.process_default_manuals()
-        result = {'success': False, 'message': 'Disabled: network issue'}  # Disabled
+        # Encoding the manuals takes a while; keep it off the event loop
+        result = await run_in_threadpool(default_safety_processor.process_default_manuals)
         
         if not result['success']:
             raise HTTPException(
@@ -169,6 +169,8 @@ async def process_default_manuals(
                 detail=result.get('error', 'Failed to process default safety manuals')
             )
         
+        default_safety_retrieval.unload()
+        
         return {
             "success": True,
             "message": "Default safety manuals processed successfully",
@@ -3,7 +3,7 @@ from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 from datetime import datetime
 from pathlib import Path
-from app.db.base import get_db
+from app.db.base import SessionLocal, get_db
 from app.api.deps import get_current_user
 from app.db.models.user import User
 from app.db.repositories.stage_repository import StageRepository
@@ -14,10 +14,12 @@ from app.schemas.stage_schemas import (
     FinalizeStageRequest,
     ValidationResponse
 )
+from app.core.ai_agents.shared.llm_scheduler import LLMQuotaExceededError
 from app.core.validation.stage_validator import stage_validator
 from app.services.version_history_service import VersionHistoryService
 from app.db.repositories.code_repository import CodeRepository
 from app.core.reports.pdf_version_history_generator import PDFVersionHistoryGenerator
+from app.utils.sse_helpers import sse_response
 
 router = APIRouter()
 
@@ -76,18 +78,11 @@ async def update_stage_logic(
     }
 
 
-@router.post("/validate", response_model=ValidationResponse)
-async def validate_stage(
-    request: ValidateStageRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """
-    Validate stage logic
-    """
+def _get_stage_data(db: Session, stage_id: int, current_user: User):
+    """Load a stage the user owns (404/403 otherwise) and the data the validator needs"""
     # Get stage
     stage_repo = StageRepository(db)
-    stage = stage_repo.get_by_id(request.stage_id)
+    stage = stage_repo.get_by_id(stage_id)
     
     if not stage:
         raise HTTPException(
@@ -114,64 +109,126 @@ async def validate_stage(
         "original_logic": stage.original_logic,
         "edited_logic": stage.edited_logic
     }
+    return stage, stage_data
+
+
+def _record_validation(db: Session, stage_id: int, result: dict, user_id: int) -> ValidationResponse:
+    """Mark a passed stage as validated, track it in the version history and build the response"""
+    # If validation passed, mark stage as validated
+    if result['valid']:
+        StageRepository(db).mark_validated(stage_id)
+        
+        # Track version history
+        code_repo = CodeRepository(db)
+        code = code_repo.get_by_stage(stage_id)
+        if code:
+            version_service = VersionHistoryService(db)
+            version_service.create_version_entry(
+                code_id=code.id,
+                stage_id=stage_id,
+                user_id=user_id,
+                action_type="validate",
+                metadata={
+                    "description": "Stage validated",
+                    "validation_status": result['status'],
+                    "valid": result['valid']
+                }
+            )
+    
+    return ValidationResponse(
+        success=True,
+        valid=result['valid'],
+        status=result['status'],
+        semantic_analysis=result.get('semantic_analysis', ''),
+        logical_consistency=result.get('logical_consistency', ''),
+        safety_compliance=result.get('safety_compliance', ''),
+        issues=result.get('issues', []),
+        recommendations=result.get('recommendations', []),
+        categorized_issues=result.get('categorized_issues', [])
+    )
+
+
+def _validation_error_response(stage_id: int, e: Exception) -> ValidationResponse:
+    import logging
+    logger = logging.getLogger(__name__)
+    logger.error(f"Validation failed for stage {stage_id}: {str(e)}", exc_info=True)
+    return ValidationResponse(
+        success=False,
+        valid=False,
+        status="ERROR",
+        semantic_analysis=f"Validation error occurred: {str(e)}",
+        logical_consistency="Unable to perform validation due to error",
+        safety_compliance="Unable to perform validation due to error",
+        issues=["Validation system error occurred"],
+        recommendations=["Please check backend logs and try again"],
+        categorized_issues=[{
+            'severity': 'critical',
+            'title': 'Validation System Error',
+            'description': 'An error occurred during validation',
+            'recommended_logic': f'Please check backend logs. Error: {str(e)}'
+        }],
+        error=str(e)
+    )
+
+
+@router.post("/validate", response_model=ValidationResponse)
+async def validate_stage(
+    request: ValidateStageRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Validate stage logic
+    """
+    stage, stage_data = _get_stage_data(db, request.stage_id, current_user)
     
     # Validate
     try:
-        result = await stage_validator.validate_stage(stage_data)
-        
-        # If validation passed, mark stage as validated
-        if result['valid']:
-            stage_repo.mark_validated(stage.id)
-            
-            # Track version history
-            code_repo = CodeRepository(db)
-            code = code_repo.get_by_stage(stage.id)
-            if code:
-                version_service = VersionHistoryService(db)
-                version_service.create_version_entry(
-                    code_id=code.id,
-                    stage_id=stage.id,
-                    user_id=current_user.id,
-                    action_type="validate",
-                    metadata={
-                        "description": "Stage validated",
-                        "validation_status": result['status'],
-                        "valid": result['valid']
-                    }
-                )
-        
-        return ValidationResponse(
-            success=True,
-            valid=result['valid'],
-            status=result['status'],
-            semantic_analysis=result.get('semantic_analysis', ''),
-            logical_consistency=result.get('logical_consistency', ''),
-            safety_compliance=result.get('safety_compliance', ''),
-            issues=result.get('issues', []),
-            recommendations=result.get('recommendations', []),
-            categorized_issues=result.get('categorized_issues', [])
-        )
+        result = await stage_validator.validate_stage(stage_data, use_cache=request.use_cache)
+        return _record_validation(db, stage.id, result, current_user.id)
+    except LLMQuotaExceededError:
+        # Answered as 429 with Retry-After by the exception handler
+        raise
     except Exception as e:
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.error(f"Validation failed for stage {stage.id}: {str(e)}", exc_info=True)
-        return ValidationResponse(
-            success=False,
-            valid=False,
-            status="ERROR",
-            semantic_analysis=f"Validation error occurred: {str(e)}",
-            logical_consistency="Unable to perform validation due to error",
-            safety_compliance="Unable to perform validation due to error",
-            issues=["Validation system error occurred"],
-            recommendations=["Please check backend logs and try again"],
-            categorized_issues=[{
-                'severity': 'critical',
-                'title': 'Validation System Error',
-                'description': 'An error occurred during validation',
-                'recommended_logic': f'Please check backend logs. Error: {str(e)}'
-            }],
-            error=str(e)
-        )
+        return _validation_error_response(stage.id, e)
+
+
+@router.post("/validate/stream")
+async def validate_stage_stream(
+    request: ValidateStageRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Validate stage logic, streamed as server-sent events: "token" events
+    carry the analysis as it is generated, the final "result" event the
+    same body /validate returns
+    """
+    stage, stage_data = _get_stage_data(db, request.stage_id, current_user)
+    stage_id = stage.id
+    user_id = current_user.id
+    
+    async def events():
+        try:
+            async for event in stage_validator.validate_stage_stream(stage_data, use_cache=request.use_cache):
+                if event["type"] == "token":
+                    yield "token", {"text": event["text"]}
+                    continue
+                
+                # The request's session is closed once the response starts streaming
+                stream_db = SessionLocal()
+                try:
+                    response = _record_validation(stream_db, stage_id, event["result"], user_id)
+                finally:
+                    stream_db.close()
+                yield "result", response
+        except LLMQuotaExceededError:
+            # Sent as an "error" event carrying retry_after
+            raise
+        except Exception as e:
+            yield "result", _validation_error_response(stage_id, e)
+    
+    return sse_response(events())
 
 
 @router.post("/finalize")
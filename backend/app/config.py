@@ -54,9 +54,67 @@ class Settings(BaseSettings):
     GEMINI_CODEGEN_API_KEY: Optional[str] = None  # For Code Generation (separate quota)
     GEMINI_API_URL: str = "https://generativelanguage.googleapis.com"
     
+    # LLM HTTP client (one pooled, keep-alive client per worker)
+    LLM_HTTP2: bool = True  # Multiplex requests over one connection (needs the h2 package)
+    LLM_MAX_CONNECTIONS: int = 20
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    LLM_KEEPALIVE_EXPIRY_SECONDS: float = 60.0  # Idle connections are closed after this
+    LLM_TIMEOUT_SECONDS: float = 60.0
+    LLM_CONNECT_TIMEOUT_SECONDS: float = 10.0
+    
+    # LLM response cache (SQLite, shared by all workers)
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_MAX_TEMPERATURE: float = 0.2  # Calls at or below this temperature are cached by default
+    LLM_CACHE_TTL_SECONDS: int = 604800  # 7 days
+    LLM_CACHE_MAX_MB: float = 256.0  # Least recently used responses are evicted beyond this
+    
+    # LLM request scheduling (rate and concurrency limits are per worker)
+    LLM_MAX_CONCURRENT_REQUESTS: int = 4  # Gemini requests in flight at once
+    LLM_RATE_LIMIT_PER_MINUTE: float = 15.0  # Per API key (0 = unlimited)
+    LLM_RATE_BURST: int = 3  # Requests a key may send back to back
+    LLM_DAILY_QUOTA: int = 1500  # Requests per API key per day, counted across workers (0 = unlimited)
+    LLM_QUOTA_RESET_UTC_HOUR: int = 8  # Gemini quotas reset at midnight Pacific time
+    LLM_BATCH_QUOTA_RESERVE: float = 0.1  # Share of the daily quota batch code generation may not use
+    LLM_RETRY_MAX_ATTEMPTS: int = 4  # Attempts per request on 429 / 5xx / network errors
+    LLM_RETRY_BASE_DELAY_SECONDS: float = 1.0  # Backoff doubles from this, with jitter
+    LLM_RETRY_MAX_DELAY_SECONDS: float = 30.0  # Longer server-requested waits fail the request instead
+    
     # OpenAI
     OPENAI_API_KEY: str
-    
+
+    # Embeddings (one shared model per worker)
+    EMBEDDING_MODEL_NAME: str = "all-MiniLM-L6-v2"
+    EMBEDDING_DIMENSION: int = 384
+    EMBEDDING_CACHE_ENABLED: bool = True  # Persistent chunk embedding cache
+    EMBEDDING_CACHE_DTYPE: str = "float16"  # float16 or float32
+    EMBEDDING_LOCAL_FILES_ONLY: bool = True  # Load the model only from the bundle in data/models, never from HuggingFace
+    EMBEDDING_VERIFY_BUNDLE: bool = True  # Check bundle checksums before loading
+    EMBEDDING_BACKEND: str = "torch"  # torch, onnx or onnx_int8 (ONNX Runtime on CPU)
+    EMBEDDING_ONNX_THREADS: int = 0  # ONNX Runtime intra-op threads (0 = one per core)
+
+    # RAG retrieval
+    RAG_QUERY_CACHE_MAX_ENTRIES: int = 1024
+    RAG_QUERY_CACHE_TTL_SECONDS: int = 3600
+    RAG_IVF_NPROBE: int = 8  # IVF cells visited per query
+    RAG_HNSW_EF_SEARCH: int = 64  # HNSW search beam width
+    RAG_INDEX_MMAP: bool = True  # Memory-map index data instead of reading it into each worker
+    RAG_EXECUTOR_WORKERS: int = 2  # Threads for encode + search, off the event loop
+    RAG_BATCH_WINDOW_MS: float = 3.0  # Queries arriving within this window share one encode/search
+    RAG_MAX_BATCH_SIZE: int = 64
+    RAG_INDEX_POLL_SECONDS: float = 5.0  # How often to look for a newly published index version
+    RAG_INDEX_KEEP_VERSIONS: int = 3  # Published index versions kept on disk
+    RAG_CONTEXT_TOKEN_BUDGET: int = 1500  # Manual context tokens for callers that do not set their own budget
+
+    # Per-project safety manual indices
+    SAFETY_INDEX_CACHE_MAX_MB: int = 512  # Memory budget for cached indices per worker
+    SAFETY_INDEX_PRELOAD_COUNT: int = 0  # Most recently updated indices to load at startup
+    SAFETY_INDEX_STORAGE: str = "flat"  # flat, sq_fp16, sq_int8 or pq
+    SAFETY_INDEX_PCA_DIM: int = 0  # Reduce vectors to this dimension before storing (0 = off)
+    SAFETY_INDEX_PQ_M: int = 16  # PQ sub-quantizers (must divide the stored dimension)
+    RA_QUERY_BLOCK_TOKENS: int = 0  # Largest program block embedded as one safety query, in encoder tokens (0 = the encoder's max_seq_length)
+    RA_MAX_QUERY_BLOCKS: int = 64  # Program blocks searched per safety check (fused by reciprocal rank)
+    RA_RRF_K: int = 60  # Reciprocal-rank fusion constant
+
 
     # Voice Recognition
     VOICE_RECOGNITION_SERVICE: str = "google"
@@ -74,6 +132,18 @@ class Settings(BaseSettings):
     def EMBEDDINGS_PATH(self) -> str:
         return str(ROOT_DIR / "data" / "embeddings")
     
+    @property
+    def MODELS_PATH(self) -> str:
+        return str(ROOT_DIR / "data" / "models")
+    
+    @property
+    def LLM_CACHE_PATH(self) -> str:
+        return str(ROOT_DIR / "data" / "cache" / "llm_responses.sqlite")
+    
+    @property
+    def LLM_QUOTA_PATH(self) -> str:
+        return str(ROOT_DIR / "data" / "cache" / "llm_quota.sqlite")
+    
     @property
     def UPLOADS_PATH(self) -> str:
         return str(ROOT_DIR / "data" / "uploads")
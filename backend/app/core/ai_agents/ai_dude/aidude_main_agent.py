@@ -1,13 +1,17 @@
-from typing import Dict, Optional
+from typing import AsyncIterator, Dict, Optional, Tuple
+from app.core.ai_agents.shared.llm_scheduler import LLMPriority
 from app.core.ai_agents.shared.perplexity_api_client import perplexity_client
-from app.core.rag.semantic_retrieval_engine import retrieval_engine
+from app.services.retrieval_service import retrieval_service
 from app.core.orchestration.system_prompt_manager import prompt_manager
 
+# Manual context per answer: room for the 3 whole chunks the agent retrieves
+AGENT_CONTEXT_TOKEN_BUDGET = 2250
+
 
 class AIDudeAgent:
     def __init__(self):
         self.perplexity = perplexity_client
-        self.retrieval = retrieval_engine
+        self.retrieval = retrieval_service
         self.conversation_history = []
     
     def reset_conversation(self):
@@ -31,11 +35,62 @@ class AIDudeAgent:
         Returns:
             Response dict with answer
         """
+        messages, manual_context = await self._prepare(user_question, code_context, stage_context)
+        
+        # Call Perplexity API
+        response = await self.perplexity.chat_completion(
+            messages=messages,
+            temperature=0.2,  # Very focused, concise responses
+            max_tokens=1500,
+            priority=LLMPriority.INTERACTIVE
+        )
+        
+        # Extract response
+        answer = self.perplexity.extract_response_text(response)
+        
+        return self._finish(user_question, answer, manual_context)
+    
+    async def query_stream(
+        self,
+        user_question: str,
+        code_context: Optional[str] = None,
+        stage_context: Optional[Dict] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        Streaming variant of query
+        
+        Yields {"type": "token", "text": ...} events as the answer is
+        generated, then {"type": "result", "result": ...} with the dict
+        query returns.
+        """
+        messages, manual_context = await self._prepare(user_question, code_context, stage_context)
+        
+        parts = []
+        async for text in self.perplexity.stream_completion(
+            messages=messages,
+            temperature=0.2,
+            max_tokens=1500,
+            priority=LLMPriority.INTERACTIVE
+        ):
+            parts.append(text)
+            yield {"type": "token", "text": text}
+        
+        yield {"type": "result", "result": self._finish(user_question, "".join(parts), manual_context)}
+    
+    async def _prepare(
+        self,
+        user_question: str,
+        code_context: Optional[str],
+        stage_context: Optional[Dict]
+    ) -> Tuple[list, str]:
+        """Messages for the API and the manual context they include"""
         # Get system prompt
         system_prompt = prompt_manager.get_aidude_prompt()
         
         # Retrieve relevant manual context
-        manual_context = retrieval_engine.retrieve_context(user_question, max_chunks=3)
+        manual_context = await self.retrieval.retrieve_packed_context(
+            [user_question], token_budget=AGENT_CONTEXT_TOKEN_BUDGET, max_chunks=3
+        )
         
         # Build messages
         messages = self._build_messages(
@@ -45,17 +100,10 @@ class AIDudeAgent:
             code_context=code_context,
             stage_context=stage_context
         )
-        
-        # Call Perplexity API
-        response = await self.perplexity.chat_completion(
-            messages=messages,
-            temperature=0.2,  # Very focused, concise responses
-            max_tokens=1500
-        )
-        
-        # Extract response
-        answer = self.perplexity.extract_response_text(response)
-        
+        return messages, manual_context
+    
+    def _finish(self, user_question: str, answer: str, manual_context: str) -> Dict:
+        """Record the exchange in the conversation history and build the response"""
         # Update history
         self.conversation_history.append({
             "role": "user",
@@ -1,13 +1,17 @@
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from app.core.ai_agents.shared.llm_scheduler import LLMPriority
 from app.core.ai_agents.shared.perplexity_api_client import perplexity_client
-from app.core.rag.semantic_retrieval_engine import retrieval_engine
+from app.services.retrieval_service import retrieval_service
 from app.core.orchestration.system_prompt_manager import prompt_manager
 
+# Manual context per answer: room for the 3 whole chunks the agent retrieves
+AGENT_CONTEXT_TOKEN_BUDGET = 2250
+
 
 class NexusAIAgent:
     def __init__(self):
         self.perplexity = perplexity_client
-        self.retrieval = retrieval_engine
+        self.retrieval = retrieval_service
         self.conversation_history = []
         self.current_phase = "idle"
         
@@ -27,11 +31,56 @@ class NexusAIAgent:
         Returns:
             Response dict with message and metadata
         """
+        messages, manual_context = await self._prepare(user_message, project_context)
+        
+        # Call Perplexity API
+        response = await self.perplexity.chat_completion(
+            messages=messages,
+            temperature=0.3,  # Lower temperature for more focused responses
+            max_tokens=3000,
+            priority=LLMPriority.INTERACTIVE
+        )
+        
+        # Extract response
+        assistant_message = self.perplexity.extract_response_text(response)
+        
+        return self._finish(user_message, assistant_message, manual_context)
+    
+    async def chat_stream(
+        self,
+        user_message: str,
+        project_context: Optional[Dict] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        Streaming variant of chat
+        
+        Yields {"type": "token", "text": ...} events as the reply is
+        generated, then {"type": "result", "result": ...} with the dict
+        chat returns.
+        """
+        messages, manual_context = await self._prepare(user_message, project_context)
+        
+        parts = []
+        async for text in self.perplexity.stream_completion(
+            messages=messages,
+            temperature=0.3,
+            max_tokens=3000,
+            priority=LLMPriority.INTERACTIVE
+        ):
+            parts.append(text)
+            yield {"type": "token", "text": text}
+        
+        yield {"type": "result", "result": self._finish(user_message, "".join(parts), manual_context)}
+    
+    async def _prepare(self, user_message: str, project_context: Optional[Dict]) -> Tuple[List[Dict], str]:
+        """Messages for the API and the manual context they include"""
         # Get system prompt
         system_prompt = prompt_manager.get_nexus_prompt()
         
         # Retrieve relevant manual context
-        manual_context = retrieval_engine.retrieve_context(user_message, max_chunks=3)
+        manual_context = await self.retrieval.retrieve_packed_context(
+            [user_message], token_budget=AGENT_CONTEXT_TOKEN_BUDGET, max_chunks=3
+        )
         
         # Build messages for Perplexity
         messages = self._build_messages(
@@ -40,17 +89,10 @@ class NexusAIAgent:
             manual_context=manual_context,
             project_context=project_context
         )
-        
-        # Call Perplexity API
-        response = await self.perplexity.chat_completion(
-            messages=messages,
-            temperature=0.3,  # Lower temperature for more focused responses
-            max_tokens=3000
-        )
-        
-        # Extract response
-        assistant_message = self.perplexity.extract_response_text(response)
-        
+        return messages, manual_context
+    
+    def _finish(self, user_message: str, assistant_message: str, manual_context: str) -> Dict:
+        """Record the exchange in the conversation history and build the response"""
         # Update conversation history
         self.conversation_history.append({
             "role": "user",
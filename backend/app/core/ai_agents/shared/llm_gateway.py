@@ -0,0 +1,233 @@
+"""
+LLM Gateway
+The single path every Gemini chat completion takes: response cache
+lookup, coalescing with an identical request already in flight,
+admission by the request scheduler (rate limits, quota, priority,
+retries), request over the pooled HTTP client, conversion to the
+OpenAI-like format and cache store. Both API clients delegate to
+generate() or, for token streaming, generate_stream().
+"""
+import asyncio
+import copy
+from typing import AsyncIterator, Dict, List, Optional
+from app.config import settings
+from app.core.ai_agents.shared.llm_http_client import llm_http_client
+from app.core.ai_agents.shared.llm_response_cache import llm_response_cache, request_key
+from app.core.ai_agents.shared.llm_scheduler import LLMPriority, LLMQuotaExceededError, llm_scheduler
+from app.core.ai_agents.shared.llm_single_flight import llm_single_flight
+from app.core.ai_agents.shared.prompt_builder import build_gemini_payload, gemini_endpoint
+from app.core.ai_agents.shared.response_parser import candidate_text, convert_gemini_response, extract_response_text
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of an upstream stream in generate_stream's queue
+_STREAM_END = object()
+
+
+def should_cache(temperature: float, use_cache: Optional[bool] = None) -> bool:
+    """
+    Whether a call goes through the response cache
+
+    Args:
+        temperature: Sampling temperature of the call
+        use_cache: Per-call override; None caches only near-deterministic calls
+    """
+    if not settings.LLM_CACHE_ENABLED or use_cache is False:
+        return False
+    return use_cache is True or temperature <= settings.LLM_CACHE_MAX_TEMPERATURE
+
+
+async def generate(
+    api_key: str,
+    api_url: str,
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: int,
+    prompt_version: Optional[str] = None,
+    use_cache: Optional[bool] = None,
+    priority: LLMPriority = LLMPriority.STANDARD
+) -> Dict:
+    """
+    Run a Gemini chat completion
+
+    Args:
+        api_key: Gemini API key the call is billed to
+        api_url: Gemini API base URL
+        model: Model name
+        messages: List of message dicts with 'role' and 'content'
+        temperature: Sampling temperature
+        max_tokens: Maximum tokens to generate
+        prompt_version: Version of the caller's prompt template (part of the cache key)
+        use_cache: True/False to force or skip the response cache
+        priority: Scheduling class of the call
+
+    Returns:
+        API response dict in the OpenAI-like format; cache hits carry "cached": True
+    """
+    key = _cache_key(model, messages, temperature, max_tokens, prompt_version, use_cache)
+    cached = await _cache_get(key)
+    if cached is not None:
+        return {**cached, "cached": True}
+
+    async def fetch() -> Dict:
+        payload = build_gemini_payload(messages, temperature, max_tokens)
+
+        # Gemini uses API key as query parameter; the pooled client reuses connections
+        gemini_response = await llm_scheduler.run(
+            api_key,
+            lambda: llm_http_client.post_json(
+                gemini_endpoint(api_url, model),
+                payload,
+                params={"key": api_key}
+            ),
+            priority
+        )
+
+        # Convert Gemini response to expected format (OpenAI-like)
+        # This maintains compatibility with downstream code
+        response = convert_gemini_response(gemini_response, model)
+
+        await _cache_put(key, model, response)
+        return response
+
+    # Only calls whose answer could come from the cache anyway are shared; a
+    # caller that skips the cache or samples at a higher temperature gets its own
+    if key is None or temperature > settings.LLM_CACHE_MAX_TEMPERATURE:
+        return await fetch()
+
+    # Concurrent identical requests billed to the same API key share one
+    # upstream call; each caller gets its own copy
+    flight_key = f"{key}:{llm_scheduler.key_id(api_key)}"
+    response = await llm_single_flight.run(flight_key, fetch)
+    return copy.deepcopy(response)
+
+
+async def generate_stream(
+    api_key: str,
+    api_url: str,
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: int,
+    prompt_version: Optional[str] = None,
+    use_cache: Optional[bool] = None,
+    priority: LLMPriority = LLMPriority.STANDARD
+) -> AsyncIterator[str]:
+    """
+    Run a Gemini chat completion with streamGenerateContent, yielding text
+    as the model produces it. Arguments are the same as generate().
+
+    A cached response is yielded as a single piece. The upstream response
+    is read by its own task into a queue, so the scheduler slot is released
+    as soon as Gemini has finished, however slowly the client reads. Once
+    complete, the response is cached like a generate() response (unless
+    the caller stops reading before then, which cancels it). Failures are
+    retried only until the first text has arrived.
+    """
+    key = _cache_key(model, messages, temperature, max_tokens, prompt_version, use_cache)
+    cached = await _cache_get(key)
+    if cached is not None:
+        yield extract_response_text(cached)
+        return
+
+    payload = build_gemini_payload(messages, temperature, max_tokens)
+    pieces: asyncio.Queue = asyncio.Queue()
+
+    async def read_upstream():
+        parts = []
+        last_event = {}
+        attempt = 0
+        try:
+            while True:
+                attempt += 1
+                try:
+                    async with llm_scheduler.slot(api_key, priority):
+                        async for event in llm_http_client.stream_sse(
+                            gemini_endpoint(api_url, model, "streamGenerateContent"),
+                            payload,
+                            params={"key": api_key, "alt": "sse"}
+                        ):
+                            last_event = event
+                            text = candidate_text(event)
+                            if text:
+                                parts.append(text)
+                                pieces.put_nowait(text)
+                    break
+                except LLMQuotaExceededError:
+                    raise
+                except Exception as e:
+                    if parts or not await llm_scheduler.backoff(api_key, e, attempt):
+                        raise
+
+            # Rebuild the complete response so it is cached in the same form as generate()'s
+            response = convert_gemini_response({
+                "candidates": [{"content": {"parts": [{"text": "".join(parts)}]}}],
+                "modelVersion": last_event.get('modelVersion', model),
+                "usageMetadata": last_event.get('usageMetadata', {})
+            }, model)
+            await _cache_put(key, model, response)
+        except Exception as e:
+            pieces.put_nowait(e)
+        else:
+            pieces.put_nowait(_STREAM_END)
+
+    reader = asyncio.create_task(read_upstream())
+    try:
+        while True:
+            piece = await pieces.get()
+            if piece is _STREAM_END:
+                return
+            if isinstance(piece, Exception):
+                raise piece
+            yield piece
+    finally:
+        # The caller stopped early: close the upstream request and free the slot
+        if not reader.done():
+            reader.cancel()
+
+
+def _cache_key(
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: int,
+    prompt_version: Optional[str],
+    use_cache: Optional[bool]
+) -> Optional[str]:
+    if not should_cache(temperature, use_cache):
+        return None
+    return request_key(model, messages, temperature, max_tokens, prompt_version)
+
+
+async def _cache_get(key: Optional[str]) -> Optional[Dict]:
+    if key is None:
+        return None
+    try:
+        cached = await asyncio.to_thread(llm_response_cache.get, key)
+    except Exception as e:
+        logger.warning(f"LLM response cache unavailable: {e}")
+        return None
+    if cached is not None:
+        logger.info(f"LLM response cache hit ({key[:12]})")
+    return cached
+
+
+async def _cache_put(key: Optional[str], model: str, response: Dict):
+    # Empty answers (safety blocks, truncation) are retried next time rather than cached
+    if key is None or not extract_response_text(response):
+        return
+    try:
+        await asyncio.to_thread(llm_response_cache.put, key, model, response)
+    except Exception as e:
+        logger.warning(f"Could not cache LLM response: {e}")
+
+
+def get_stats() -> Dict:
+    return {
+        "http": llm_http_client.get_stats(),
+        "scheduler": llm_scheduler.get_stats(),
+        "single_flight": llm_single_flight.get_stats(),
+        "cache": {"enabled": settings.LLM_CACHE_ENABLED, **llm_response_cache.get_stats()}
+    }
@@ -0,0 +1,114 @@
+"""
+LLM HTTP Client
+One pooled, keep-alive httpx client per worker, shared by every LLM API
+client. Connections (and their TLS sessions) are reused across requests
+instead of being set up for each call; with HTTP/2 concurrent requests
+are multiplexed over a single connection.
+
+The client is opened and closed by the FastAPI lifespan; outside the app
+(scripts) it is created on first use.
+"""
+import json
+from typing import AsyncIterator, Dict, Optional
+import httpx
+from app.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LLMHttpClient:
+    """Application-lifetime httpx.AsyncClient"""
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self.requests = 0
+        self.streams = 0
+
+    def _create(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY_SECONDS
+        )
+        timeout = httpx.Timeout(
+            settings.LLM_TIMEOUT_SECONDS,
+            connect=settings.LLM_CONNECT_TIMEOUT_SECONDS
+        )
+        try:
+            return httpx.AsyncClient(http2=settings.LLM_HTTP2, limits=limits, timeout=timeout)
+        except ImportError:
+            # http2=True needs the h2 package
+            logger.warning("h2 is not installed; LLM requests use HTTP/1.1 keep-alive")
+            return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = self._create()
+        return self._client
+
+    async def start(self):
+        """Open the connection pool (FastAPI lifespan startup)"""
+        _ = self.client
+        logger.info(
+            f"LLM HTTP client ready (HTTP/2: {settings.LLM_HTTP2}, "
+            f"max connections: {settings.LLM_MAX_CONNECTIONS})"
+        )
+
+    async def close(self):
+        """Close all pooled connections (FastAPI lifespan shutdown)"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def post_json(self, url: str, payload: Dict, params: Optional[Dict] = None) -> Dict:
+        """
+        POST a JSON payload and return the decoded JSON response
+
+        Raises:
+            httpx.HTTPStatusError: Non-200 response
+        """
+        self.requests += 1
+        response = await self.client.post(url, params=params, json=payload)
+
+        if response.status_code != 200:
+            logger.error(f"LLM API Error ({response.status_code}): {response.text}")
+            response.raise_for_status()
+
+        return response.json()
+
+    async def stream_sse(self, url: str, payload: Dict, params: Optional[Dict] = None) -> AsyncIterator[Dict]:
+        """
+        POST a JSON payload and yield the decoded JSON of each server-sent
+        event as it arrives
+
+        Raises:
+            httpx.HTTPStatusError: Non-200 response
+        """
+        self.requests += 1
+        self.streams += 1
+        async with self.client.stream("POST", url, params=params, json=payload) as response:
+            if response.status_code != 200:
+                await response.aread()
+                logger.error(f"LLM API Error ({response.status_code}): {response.text}")
+                response.raise_for_status()
+
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data:
+                    yield json.loads(data)
+
+    def get_stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "streams": self.streams,
+            "open": self._client is not None and not self._client.is_closed,
+            "http2": settings.LLM_HTTP2
+        }
+
+
+# Global instance
+llm_http_client = LLMHttpClient()
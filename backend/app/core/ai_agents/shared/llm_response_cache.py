@@ -0,0 +1,196 @@
+"""
+LLM Response Cache
+Persistent, content-addressed cache of LLM responses keyed by
+(model, canonicalized messages, temperature, max_tokens, prompt version).
+
+Low-temperature calls such as stage validation and code generation are
+often re-run on an unchanged prompt; a cache hit answers them from a
+local SQLite file instead of a round trip that also counts against the
+daily API quota. Entries expire after a TTL and the least recently used
+ones are evicted once the file grows past its size budget.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from app.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Expired entries are swept every this many stores
+_PURGE_EVERY = 100
+
+
+def canonicalize_messages(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """
+    Messages reduced to what changes the model's answer: role and content,
+    with line endings and trailing whitespace normalized
+    """
+    canonical = []
+    for msg in messages:
+        content = str(msg.get('content', '')).replace('\r\n', '\n').replace('\r', '\n')
+        content = "\n".join(line.rstrip() for line in content.split("\n")).strip()
+        canonical.append({"role": msg.get('role', 'user').strip().lower(), "content": content})
+    return canonical
+
+
+def request_key(
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: int,
+    prompt_version: Optional[str] = None
+) -> str:
+    """SHA-256 identifying an LLM request"""
+    material = json.dumps(
+        {
+            "model": model,
+            "messages": canonicalize_messages(messages),
+            "temperature": round(float(temperature), 4),
+            "max_tokens": int(max_tokens),
+            "prompt_version": prompt_version or ""
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False
+    )
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """SQLite store of converted LLM responses with TTL and LRU size eviction"""
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        ttl_seconds: Optional[int] = None,
+        max_mb: Optional[float] = None
+    ):
+        self.db_path = Path(db_path or settings.LLM_CACHE_PATH)
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.LLM_CACHE_TTL_SECONDS
+        self.max_bytes = int((max_mb if max_mb is not None else settings.LLM_CACHE_MAX_MB) * 1024 * 1024)
+
+        self._lock = threading.Lock()
+        self._initialized = False
+        self._stores_since_purge = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            with sqlite3.connect(str(self.db_path), timeout=30) as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, model TEXT NOT NULL, response TEXT NOT NULL, "
+                    "size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)"
+                )
+            self._initialized = True
+        return sqlite3.connect(str(self.db_path), timeout=30)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Cached response for a request key, or None if absent or expired"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                row = None
+            if row is not None:
+                conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                conn.commit()
+        finally:
+            conn.close()
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, model: str, response: Dict):
+        """Store a response, then evict expired and least recently used entries"""
+        body = json.dumps(response, ensure_ascii=False)
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, body, len(body.encode('utf-8')), now, now)
+            )
+            with self._lock:
+                self.stores += 1
+                self._stores_since_purge += 1
+                purge = self._stores_since_purge >= _PURGE_EVERY
+                if purge:
+                    self._stores_since_purge = 0
+            evicted = self._evict(conn, now, purge)
+            conn.commit()
+        finally:
+            conn.close()
+
+        if evicted:
+            with self._lock:
+                self.evictions += evicted
+
+    def _evict(self, conn: sqlite3.Connection, now: float, purge_expired: bool) -> int:
+        evicted = 0
+        if purge_expired:
+            evicted += conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+            ).rowcount
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return evicted
+
+        # Drop the least recently used entries until the cache fits its budget
+        excess = total - self.max_bytes
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        return evicted + len(victims)
+
+    def clear(self):
+        """Remove every cached response"""
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "path": str(self.db_path),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+# Global instance
+llm_response_cache = LLMResponseCache()
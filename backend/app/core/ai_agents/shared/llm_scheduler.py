@@ -0,0 +1,402 @@
+"""
+LLM Request Scheduler
+Sits between the API clients and the HTTP client and decides when each
+Gemini request may go out:
+
+- a token bucket per API key keeps each key under its per-minute limit
+- a daily quota tracker (SQLite, shared by all workers) stops a key
+  before Google starts rejecting it, keeping a reserve for non-batch work
+- at most LLM_MAX_CONCURRENT_REQUESTS requests are in flight per worker
+- waiting requests are served by priority: interactive chat first, then
+  standard calls (validation, planning, RA), then batch code generation
+- 429, 5xx and network errors are retried with jittered exponential
+  backoff, honouring the server's Retry-After / retryDelay
+"""
+import asyncio
+import hashlib
+import heapq
+import itertools
+import random
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+import httpx
+from app.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class LLMPriority(IntEnum):
+    """Scheduling class of an LLM call (lower is served first)"""
+    INTERACTIVE = 0  # A user is waiting on a chat reply
+    STANDARD = 1  # Validation, planning, risk assessment
+    BATCH = 2  # Code generation for whole projects
+
+
+class LLMQuotaExceededError(RuntimeError):
+    """The API key has used up its daily request quota, or Gemini rate limits it for longer than a retry waits"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PrioritySemaphore:
+    """asyncio semaphore that hands free slots to the highest-priority waiter (FIFO within a priority)"""
+
+    def __init__(self, value: int):
+        self._value = value
+        self._waiters = []  # heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority: int = 0):
+        if self._value > 0 and not self.waiting:
+            self._value -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over as the waiter was cancelled; pass it on
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._value += 1
+
+
+class TokenBucket:
+    """Per-minute request limit with bursts; waiters take tokens in priority order"""
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._gate = PrioritySemaphore(1)
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, priority: int = 0):
+        if self.rate <= 0:
+            return
+
+        await self._gate.acquire(priority)
+        try:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                await asyncio.sleep(wait)
+        finally:
+            self._gate.release()
+
+    def pause(self, seconds: float):
+        """Hold every request for this key (after a 429) and restart from an empty bucket"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    @property
+    def waiting(self) -> int:
+        return self._gate.waiting
+
+
+class DailyQuotaTracker:
+    """Requests sent per API key and quota day, counted in SQLite across workers"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = Path(db_path or settings.LLM_QUOTA_PATH)
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            with sqlite3.connect(str(self.db_path), timeout=30) as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS usage "
+                    "(key_id TEXT NOT NULL, day TEXT NOT NULL, requests INTEGER NOT NULL, "
+                    "PRIMARY KEY (key_id, day))"
+                )
+            self._initialized = True
+        return sqlite3.connect(str(self.db_path), timeout=30)
+
+    @staticmethod
+    def quota_day(now: Optional[datetime] = None) -> str:
+        """Quota day of a moment (days start at LLM_QUOTA_RESET_UTC_HOUR UTC)"""
+        now = now or datetime.now(timezone.utc)
+        return (now - timedelta(hours=settings.LLM_QUOTA_RESET_UTC_HOUR)).date().isoformat()
+
+    @staticmethod
+    def seconds_until_reset(now: Optional[datetime] = None) -> float:
+        now = now or datetime.now(timezone.utc)
+        reset = now.replace(hour=settings.LLM_QUOTA_RESET_UTC_HOUR, minute=0, second=0, microsecond=0)
+        if reset <= now:
+            reset += timedelta(days=1)
+        return (reset - now).total_seconds()
+
+    def used(self, key_id: str) -> int:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT requests FROM usage WHERE key_id = ? AND day = ?",
+                (key_id, self.quota_day())
+            ).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else 0
+
+    def record(self, key_id: str) -> int:
+        """Count one request and return the key's total for today"""
+        day = self.quota_day()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO usage (key_id, day, requests) VALUES (?, ?, 1) "
+                "ON CONFLICT (key_id, day) DO UPDATE SET requests = requests + 1",
+                (key_id, day)
+            )
+            conn.execute("DELETE FROM usage WHERE day < ?", (day,))
+            conn.commit()
+            return conn.execute(
+                "SELECT requests FROM usage WHERE key_id = ? AND day = ?", (key_id, day)
+            ).fetchone()[0]
+        finally:
+            conn.close()
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Delay the server asked for, from Retry-After or Gemini's RetryInfo detail"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+
+    header = response.headers.get("retry-after")
+    if header:
+        try:
+            return max(float(header), 0.0)
+        except ValueError:
+            try:
+                return max((parsedate_to_datetime(header) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+            except (TypeError, ValueError):
+                pass
+
+    # Gemini reports the delay in the error body, e.g. {"retryDelay": "17s"}
+    try:
+        body = response.json()
+    except ValueError:
+        return None
+    error = body.get("error") if isinstance(body, dict) else None
+    details = error.get("details") if isinstance(error, dict) else None
+    if not isinstance(details, list):
+        return None
+    for detail in details:
+        if not isinstance(detail, dict):
+            continue
+        delay = str(detail.get("retryDelay", ""))
+        if delay.endswith("s"):
+            try:
+                return float(delay[:-1])
+            except ValueError:
+                pass
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError))
+
+
+class LLMScheduler:
+    """Admission control for all Gemini requests of this worker"""
+
+    def __init__(self):
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._slots = PrioritySemaphore(max(1, settings.LLM_MAX_CONCURRENT_REQUESTS))
+        self.quota = DailyQuotaTracker()
+        self.in_flight = 0
+        self.requests = 0
+        self.retries = 0
+        self.quota_rejections = 0
+
+    @staticmethod
+    def key_id(api_key: str) -> str:
+        """Stable identifier of an API key that does not reveal it"""
+        return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+    def _bucket(self, key_id: str) -> TokenBucket:
+        bucket = self._buckets.get(key_id)
+        if bucket is None:
+            bucket = TokenBucket(settings.LLM_RATE_LIMIT_PER_MINUTE, settings.LLM_RATE_BURST)
+            self._buckets[key_id] = bucket
+        return bucket
+
+    async def _check_quota(self, key_id: str, priority: LLMPriority):
+        limit = settings.LLM_DAILY_QUOTA
+        if limit <= 0:
+            return
+
+        # Batch work stops early so chat and validation keep working for the rest of the day
+        if priority >= LLMPriority.BATCH:
+            limit = int(limit * (1 - settings.LLM_BATCH_QUOTA_RESERVE))
+
+        used = await asyncio.to_thread(self.quota.used, key_id)
+        if used >= limit:
+            self.quota_rejections += 1
+            retry_after = self.quota.seconds_until_reset()
+            raise LLMQuotaExceededError(
+                f"Daily LLM quota reached for this API key ({used}/{settings.LLM_DAILY_QUOTA} requests"
+                f"{', batch reserve kept' if limit < settings.LLM_DAILY_QUOTA else ''}); "
+                f"resets in {retry_after / 3600:.1f} h",
+                retry_after
+            )
+
+    @asynccontextmanager
+    async def slot(self, api_key: str, priority: LLMPriority = LLMPriority.STANDARD):
+        """
+        Wait until a request for this key may be sent and hold a concurrency
+        slot while it runs
+
+        Raises:
+            LLMQuotaExceededError: The key's daily quota is used up
+        """
+        key_id = self.key_id(api_key)
+        await self._check_quota(key_id, priority)
+        await self._bucket(key_id).acquire(priority)
+        await self._slots.acquire(priority)
+        self.in_flight += 1
+        try:
+            self.requests += 1
+            try:
+                await asyncio.to_thread(self.quota.record, key_id)
+            except Exception as e:
+                logger.warning(f"Could not record LLM quota usage: {e}")
+            yield
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    async def backoff(self, api_key: str, error: Exception, attempt: int) -> bool:
+        """
+        Wait before retrying a failed request
+
+        Args:
+            api_key: Key the request used
+            error: What the attempt raised
+            attempt: Number of attempts made so far
+
+        Returns:
+            False if the error is not retryable or the attempts are used up
+
+        Raises:
+            LLMQuotaExceededError: Gemini rate limited the key (429) for
+                longer than LLM_RETRY_MAX_DELAY_SECONDS, or through every attempt
+        """
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+        server_delay = retry_after_seconds(error)
+        max_delay = settings.LLM_RETRY_MAX_DELAY_SECONDS
+
+        if status_code == 429 and (
+            attempt >= settings.LLM_RETRY_MAX_ATTEMPTS
+            or (server_delay is not None and server_delay > max_delay)
+        ):
+            # e.g. a daily limit on Google's side; waiting would not help this
+            # request, so the client gets a 429 with Retry-After instead
+            retry_after = server_delay if server_delay is not None else max_delay
+            raise LLMQuotaExceededError(
+                f"Gemini rate limit reached, retry in {retry_after:.0f} s",
+                retry_after
+            ) from error
+
+        if attempt >= settings.LLM_RETRY_MAX_ATTEMPTS or not is_retryable(error):
+            return False
+
+        backoff = min(max_delay, settings.LLM_RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1))
+        delay = random.uniform(backoff / 2, backoff)
+        if server_delay is not None:
+            delay = server_delay + random.uniform(0, settings.LLM_RETRY_BASE_DELAY_SECONDS)
+
+        if status_code == 429:
+            # Everyone using this key waits, not just the request that hit the limit
+            self._bucket(self.key_id(api_key)).pause(delay)
+
+        self.retries += 1
+        logger.warning(
+            f"LLM request failed ({status_code or type(error).__name__}), "
+            f"retry {attempt}/{settings.LLM_RETRY_MAX_ATTEMPTS - 1} in {delay:.1f}s"
+        )
+        await asyncio.sleep(delay)
+        return True
+
+    async def run(
+        self,
+        api_key: str,
+        call: Callable[[], Awaitable[T]],
+        priority: LLMPriority = LLMPriority.STANDARD
+    ) -> T:
+        """
+        Run a request when the scheduler admits it, retrying transient failures
+
+        Args:
+            api_key: Key the request is billed to
+            call: Sends the request (called once per attempt)
+            priority: Scheduling class
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                async with self.slot(api_key, priority):
+                    return await call()
+            except LLMQuotaExceededError:
+                raise
+            except Exception as e:
+                if not await self.backoff(api_key, e, attempt):
+                    raise
+
+    def get_stats(self) -> Dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self._slots.waiting,
+            "requests": self.requests,
+            "retries": self.retries,
+            "quota_rejections": self.quota_rejections,
+            "keys": {
+                key_id: {"tokens": round(bucket.tokens, 2), "waiting": bucket.waiting}
+                for key_id, bucket in self._buckets.items()
+            }
+        }
+
+
+# Global instance
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,84 @@
+"""
+LLM Single Flight
+Coalesces identical LLM requests that are in flight at the same time:
+the first caller starts the upstream call and later callers with the
+same request key await the same result instead of sending their own.
+
+The shared call runs as its own task, so one caller being cancelled (a
+closed browser tab) does not cancel it for the others; it is cancelled
+only once every caller waiting on it has gone. An error reaches every
+caller.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, TypeVar
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """In-flight deduplication of async calls by key"""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def run(self, key: str, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Await call(), or the result of an identical call already in flight
+
+        Args:
+            key: Canonical request key; equal keys share one call
+            call: Starts the request (only run by the first caller)
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(call()))
+            flight.task.add_done_callback(lambda task: self._finish(key, flight))
+            self._flights[key] = flight
+            self.calls += 1
+        else:
+            self.coalesced += 1
+            logger.info(f"Joined in-flight LLM request ({key[:12]}, {flight.waiters + 1} waiting)")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                # Nobody else is waiting for the answer; later callers start afresh
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _finish(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Mark a failure as retrieved even if every waiter was cancelled
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def get_stats(self) -> Dict:
+        return {
+            "in_flight": len(self._flights),
+            "upstream_calls": self.calls,
+            "requests_saved": self.coalesced
+        }
+
+
+# Global instance
+llm_single_flight = SingleFlight()
@@ -1,6 +1,8 @@
-import httpx
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional
 from app.config import settings
+from app.core.ai_agents.shared import llm_gateway
+from app.core.ai_agents.shared.llm_scheduler import LLMPriority
+from app.core.ai_agents.shared.response_parser import extract_response_text
 import logging
 
 logger = logging.getLogger(__name__)
@@ -26,7 +28,10 @@ class PerplexityAPIClient:
         messages: List[Dict[str, str]],
         model: str = None,
         temperature: float = 0.3,
-        max_tokens: int = 2000
+        max_tokens: int = 2000,
+        prompt_version: Optional[str] = None,
+        use_cache: Optional[bool] = None,
+        priority: LLMPriority = LLMPriority.STANDARD
     ) -> Dict:
         """
         Send chat completion request to Google Gemini API
@@ -36,6 +41,10 @@ class PerplexityAPIClient:
             model: Model to use (if None, uses default)
             temperature: Sampling temperature
             max_tokens: Maximum tokens to generate
+            prompt_version: Caller's prompt template version (part of the cache key)
+            use_cache: True/False to force or skip the response cache
+                (default: cache low-temperature calls)
+            priority: Scheduling class (INTERACTIVE for chat a user is waiting on)
         
         Returns:
             API response dict (converted to match expected format)
@@ -44,125 +53,58 @@ class PerplexityAPIClient:
         if model is None:
             model = self.default_model
         
-        # Build Gemini API endpoint
-        endpoint = f"{self.api_url}/v1beta/models/{model}:generateContent"
-        
         logger.info(f"Making Gemini API call with key: {self.api_key[:10]}...{self.api_key[-5:]}")
-        logger.info(f"API URL: {endpoint}")
         logger.info(f"Model: {model}")
         
-        # Convert messages to Gemini format
-        # Gemini uses "contents" array with "parts" structure
-        contents = []
-        system_instruction = None
-        
-        for msg in messages:
-            role = msg.get('role', 'user')
-            content = msg.get('content', '')
-            
-            if role == 'system':
-                system_instruction = content
-            elif role == 'user':
-                contents.append({
-                    "role": "user",
-                    "parts": [{"text": content}]
-                })
-            elif role == 'assistant':
-                contents.append({
-                    "role": "model",
-                    "parts": [{"text": content}]
-                })
-        
-        # Build Gemini request payload
-        payload = {
-            "contents": contents,
-            "generationConfig": {
-                "temperature": temperature,
-                "maxOutputTokens": max_tokens
-            }
-        }
-        
-        # Add system instruction if present (v1beta feature)
-        if system_instruction:
-            payload["system_instruction"] = {
-                "parts": [{"text": system_instruction}]
-            }
-        
-        # Gemini uses API key as query parameter
-        params = {"key": self.api_key}
-        
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                endpoint,
-                params=params,
-                json=payload
-            )
-            
-            if response.status_code != 200:
-                error_detail = response.text
-                logger.error(f"Gemini API Error ({response.status_code}): {error_detail}")
-                logger.error(f"Request payload: {payload}")
-                response.raise_for_status()
-            
-            gemini_response = response.json()
-            
-            # Convert Gemini response to expected format (OpenAI-like)
-            # This maintains compatibility with downstream code
-            converted_response = self._convert_gemini_response(gemini_response)
-            return converted_response
+        return await llm_gateway.generate(
+            self.api_key,
+            self.api_url,
+            model,
+            messages,
+            temperature,
+            max_tokens,
+            prompt_version=prompt_version,
+            use_cache=use_cache,
+            priority=priority
+        )
     
-    def _convert_gemini_response(self, gemini_response: Dict) -> Dict:
+    async def stream_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        temperature: float = 0.3,
+        max_tokens: int = 2000,
+        prompt_version: Optional[str] = None,
+        use_cache: Optional[bool] = None,
+        priority: LLMPriority = LLMPriority.STANDARD
+    ) -> AsyncIterator[str]:
         """
-        Convert Gemini API response to OpenAI-compatible format
-        to maintain compatibility with existing code
+        Stream a chat completion from Google Gemini (streamGenerateContent)
+        
+        Takes the same arguments as chat_completion and yields the response
+        text piece by piece as it is generated.
         """
-        try:
-            # Extract text from Gemini response
-            candidates = gemini_response.get('candidates', [])
-            if candidates:
-                content = candidates[0].get('content', {})
-                parts = content.get('parts', [])
-                if parts:
-                    text = parts[0].get('text', '')
-                else:
-                    text = ''
-            else:
-                text = ''
-            
-            # Convert to OpenAI-like format
-            return {
-                'choices': [{
-                    'message': {
-                        'content': text,
-                        'role': 'assistant'
-                    },
-                    'finish_reason': 'stop',
-                    'index': 0
-                }],
-                'model': gemini_response.get('modelVersion', self.default_model),
-                'usage': gemini_response.get('usageMetadata', {})
-            }
-        except Exception as e:
-            logger.error(f"Error converting Gemini response: {e}")
-            logger.error(f"Original response: {gemini_response}")
-            # Return minimal valid response
-            return {
-                'choices': [{
-                    'message': {
-                        'content': '',
-                        'role': 'assistant'
-                    },
-                    'finish_reason': 'error',
-                    'index': 0
-                }]
-            }
+        if model is None:
+            model = self.default_model
+        
+        logger.info(f"Streaming Gemini API call, model: {model}")
+        
+        async for text in llm_gateway.generate_stream(
+            self.api_key,
+            self.api_url,
+            model,
+            messages,
+            temperature,
+            max_tokens,
+            prompt_version=prompt_version,
+            use_cache=use_cache,
+            priority=priority
+        ):
+            yield text
     
     def extract_response_text(self, response: Dict) -> str:
         """Extract text from API response (works with converted format)"""
-        try:
-            return response['choices'][0]['message']['content']
-        except (KeyError, IndexError):
-            return ""
+        return extract_response_text(response)
 
 
 # Global instance
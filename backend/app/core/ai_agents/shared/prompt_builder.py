@@ -0,0 +1,58 @@
+"""
+Prompt Builder
+Converts OpenAI-style chat messages into Gemini generateContent payloads
+"""
+from typing import Dict, List
+
+
+def build_gemini_payload(
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: int
+) -> Dict:
+    """
+    Build a Gemini request payload
+
+    Gemini uses a "contents" array with "parts"; the assistant role is
+    called "model" and system messages become the system instruction.
+
+    Args:
+        messages: List of message dicts with 'role' and 'content'
+        temperature: Sampling temperature
+        max_tokens: Maximum tokens to generate
+
+    Returns:
+        generateContent request body
+    """
+    contents = []
+    system_instruction = None
+
+    for msg in messages:
+        role = msg.get('role', 'user')
+        content = msg.get('content', '')
+
+        if role == 'system':
+            system_instruction = content
+        elif role == 'user':
+            contents.append({"role": "user", "parts": [{"text": content}]})
+        elif role == 'assistant':
+            contents.append({"role": "model", "parts": [{"text": content}]})
+
+    payload = {
+        "contents": contents,
+        "generationConfig": {
+            "temperature": temperature,
+            "maxOutputTokens": max_tokens
+        }
+    }
+
+    # Add system instruction if present (v1beta feature)
+    if system_instruction:
+        payload["system_instruction"] = {"parts": [{"text": system_instruction}]}
+
+    return payload
+
+
+def gemini_endpoint(api_url: str, model: str, method: str = "generateContent") -> str:
+    """Gemini v1beta endpoint for a model"""
+    return f"{api_url}/v1beta/models/{model}:{method}"
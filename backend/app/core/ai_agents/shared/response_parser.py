@@ -0,0 +1,59 @@
+"""
+Response Parser
+Converts Gemini responses to the OpenAI-like format used by the agents
+"""
+from typing import Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def candidate_text(gemini_response: Dict) -> str:
+    """Text of the first candidate of a Gemini response ('' if none)"""
+    candidates = gemini_response.get('candidates', [])
+    if not candidates:
+        return ''
+    parts = candidates[0].get('content', {}).get('parts', [])
+    return parts[0].get('text', '') if parts else ''
+
+
+def convert_gemini_response(gemini_response: Dict, default_model: str) -> Dict:
+    """
+    Convert a Gemini API response to OpenAI-compatible format
+    to maintain compatibility with existing code
+    """
+    try:
+        return {
+            'choices': [{
+                'message': {
+                    'content': candidate_text(gemini_response),
+                    'role': 'assistant'
+                },
+                'finish_reason': 'stop',
+                'index': 0
+            }],
+            'model': gemini_response.get('modelVersion', default_model),
+            'usage': gemini_response.get('usageMetadata', {})
+        }
+    except Exception as e:
+        logger.error(f"Error converting Gemini response: {e}")
+        logger.error(f"Original response: {gemini_response}")
+        # Return minimal valid response
+        return {
+            'choices': [{
+                'message': {
+                    'content': '',
+                    'role': 'assistant'
+                },
+                'finish_reason': 'error',
+                'index': 0
+            }]
+        }
+
+
+def extract_response_text(response: Dict) -> str:
+    """Extract text from API response (works with converted format)"""
+    try:
+        return response['choices'][0]['message']['content']
+    except (KeyError, IndexError):
+        return ""
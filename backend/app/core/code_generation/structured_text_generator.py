@@ -1,11 +1,19 @@
-from typing import Dict, List, Optional
-from app.core.rag.semantic_retrieval_engine import retrieval_engine
+from typing import AsyncIterator, Dict, List, Optional
+from app.services.retrieval_service import retrieval_service
 from app.config import settings
-import httpx
+from app.core.ai_agents.shared import llm_gateway
+from app.core.ai_agents.shared.llm_scheduler import LLMPriority
+from app.core.ai_agents.shared.response_parser import extract_response_text
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Bump when the generation prompt or its parsing changes so cached responses are not reused
+CODEGEN_PROMPT_VERSION = "1"
+
+# Manual context for the generation prompt: room for its 3 queries x 2 whole chunks
+CODEGEN_CONTEXT_TOKEN_BUDGET = 4500
+
 
 class CodeGenAPIClient:
     """Separate API client for code generation with dedicated API key"""
@@ -21,70 +29,40 @@ class CodeGenAPIClient:
         
         logger.info(f"Code generation using dedicated API key: {self.api_key[:10]}...")
     
-    async def chat_completion(self, messages, temperature=0.1, max_tokens=4000):
-        """Send request to Gemini API"""
-        endpoint = f"{self.api_url}/v1beta/models/{self.model}:generateContent"
-        
-        # Convert messages to Gemini format
-        contents = []
-        system_instruction = None
-        
-        for msg in messages:
-            role = msg.get('role', 'user')
-            content = msg.get('content', '')
-            
-            if role == 'system':
-                system_instruction = content
-            elif role == 'user':
-                contents.append({"role": "user", "parts": [{"text": content}]})
-            elif role == 'assistant':
-                contents.append({"role": "model", "parts": [{"text": content}]})
-        
-        payload = {
-            "contents": contents,
-            "generationConfig": {
-                "temperature": temperature,
-                "maxOutputTokens": max_tokens
-            }
-        }
-        
-        if system_instruction:
-            payload["system_instruction"] = {"parts": [{"text": system_instruction}]}
-        
-        params = {"key": self.api_key}
-        
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(endpoint, params=params, json=payload)
-            
-            if response.status_code != 200:
-                logger.error(f"Gemini API Error ({response.status_code}): {response.text}")
-                response.raise_for_status()
-            
-            gemini_response = response.json()
-            
-            # Convert to OpenAI-like format
-            candidates = gemini_response.get('candidates', [])
-            if candidates:
-                content = candidates[0].get('content', {})
-                parts = content.get('parts', [])
-                text = parts[0].get('text', '') if parts else ''
-            else:
-                text = ''
-            
-            return {
-                'choices': [{
-                    'message': {'content': text, 'role': 'assistant'},
-                    'finish_reason': 'stop',
-                    'index': 0
-                }]
-            }
+    async def chat_completion(self, messages, temperature=0.1, max_tokens=4000,
+                              prompt_version=None, use_cache=None, priority=LLMPriority.BATCH):
+        """Send request to Gemini API (through the response cache and scheduler)"""
+        return await llm_gateway.generate(
+            self.api_key,
+            self.api_url,
+            self.model,
+            messages,
+            temperature,
+            max_tokens,
+            prompt_version=prompt_version,
+            use_cache=use_cache,
+            priority=priority
+        )
+    
+    async def stream_completion(self, messages, temperature=0.1, max_tokens=4000,
+                                prompt_version=None, use_cache=None, priority=LLMPriority.BATCH):
+        """Stream response text from Gemini API as it is generated"""
+        async for text in llm_gateway.generate_stream(
+            self.api_key,
+            self.api_url,
+            self.model,
+            messages,
+            temperature,
+            max_tokens,
+            prompt_version=prompt_version,
+            use_cache=use_cache,
+            priority=priority
+        ):
+            yield text
     
     def extract_response_text(self, response):
         """Extract text from response"""
-        try:
-            return response['choices'][0]['message']['content']
-        except (KeyError, IndexError):
-            return ""
+        return extract_response_text(response)
 
 
 # Create dedicated code generation client
@@ -96,12 +74,13 @@ class StructuredTextGenerator:
     
     def __init__(self):
         self.perplexity = codegen_client  # Use dedicated code generation client
-        self.retrieval = retrieval_engine
+        self.retrieval = retrieval_service
     
     async def generate_code(
         self,
         stage: Dict,
-        project_context: Optional[Dict] = None
+        project_context: Optional[Dict] = None,
+        use_cache: bool = True
     ) -> Dict:
         """
         Generate Structured Text code for a stage
@@ -109,77 +88,117 @@ class StructuredTextGenerator:
         Args:
             stage: Stage information (name, logic, type, etc.)
             project_context: Additional project context
+            use_cache: Reuse the cached answer for an unchanged prompt
         
         Returns:
             Dict with generated code components
         """
-        import logging
-        logger = logging.getLogger(__name__)
-        
         try:
-            # Get code generation rules from manuals
-            manual_context = self._get_code_generation_context()
-            
-            # Build system prompt
-            system_prompt = self._build_code_generation_prompt(manual_context)
-            
-            # Build user request
-            user_request = self._build_generation_request(stage, project_context)
-            
-            # Call Perplexity
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_request}
-            ]
+            messages = await self._build_messages(stage, project_context)
             
             logger.info(f"Generating code for stage: {stage.get('stage_name')}")
             response = await self.perplexity.chat_completion(
                 messages=messages,
                 temperature=0.1,  # Very deterministic for code
-                max_tokens=8000  # Increased for full code generation
+                max_tokens=8000,  # Increased for full code generation
+                prompt_version=CODEGEN_PROMPT_VERSION,
+                use_cache=use_cache
             )
             
             # Extract response
             code_text = self.perplexity.extract_response_text(response)
             
-            if not code_text:
-                logger.error("Empty response from Perplexity API")
-                raise ValueError("No response received from code generation service")
-            
-            # Log the raw response for debugging
-            logger.info(f"Raw code response (first 500 chars): {code_text[:500]}")
-            
-            # DEBUGGING: Save full response to file
-            import os
-            debug_file = os.path.join(os.path.dirname(__file__), f"debug_response_{stage.get('stage_number', 0)}.txt")
-            with open(debug_file, 'w', encoding='utf-8') as f:
-                f.write(code_text)
-            logger.info(f"Full response saved to: {debug_file}")
+            return self._build_result(stage, code_text)
+        except Exception as e:
+            logger.error(f"Code generation failed: {str(e)}", exc_info=True)
+            raise
+    
+    async def generate_code_stream(
+        self,
+        stage: Dict,
+        project_context: Optional[Dict] = None,
+        use_cache: bool = True
+    ) -> AsyncIterator[Dict]:
+        """
+        Generate Structured Text code for a stage, streaming the model output
+        
+        Yields {"type": "token", "text": ...} events as the code is written,
+        then {"type": "result", "result": ...} with the same dict generate_code
+        returns.
+        """
+        try:
+            messages = await self._build_messages(stage, project_context)
             
-            # Parse the generated code
-            parsed_code = self._parse_generated_code(code_text)
+            logger.info(f"Streaming code generation for stage: {stage.get('stage_name')}")
+            parts = []
+            async for text in self.perplexity.stream_completion(
+                messages=messages,
+                temperature=0.1,
+                max_tokens=8000,
+                prompt_version=CODEGEN_PROMPT_VERSION,
+                use_cache=use_cache
+            ):
+                parts.append(text)
+                yield {"type": "token", "text": text}
             
-            return {
-                "success": True,
-                "stage_id": stage.get('id'),
-                "stage_name": stage.get('stage_name'),
-                "global_labels": parsed_code.get('global_labels', []),
-                "local_labels": parsed_code.get('local_labels', []),
-                "program_body": parsed_code.get('program_body', ''),
-                "program_blocks": parsed_code.get('program_blocks', []),
-                "functions": parsed_code.get('functions', []),
-                "function_blocks": parsed_code.get('function_blocks', []),
-                "metadata": {
-                    "program_name": f"STAGE_{stage.get('stage_number', 0)}",
-                    "execution_type": self._determine_execution_type(stage.get('stage_type')),
-                    "generated_at": "timestamp"
-                }
-            }
+            yield {"type": "result", "result": self._build_result(stage, "".join(parts))}
         except Exception as e:
             logger.error(f"Code generation failed: {str(e)}", exc_info=True)
             raise
     
-    def _get_code_generation_context(self) -> str:
+    async def _build_messages(self, stage: Dict, project_context: Optional[Dict]) -> List[Dict]:
+        """System prompt (with manual context) and generation request for a stage"""
+        # Get code generation rules from manuals
+        manual_context = await self._get_code_generation_context()
+        
+        # Build system prompt
+        system_prompt = self._build_code_generation_prompt(manual_context)
+        
+        # Build user request
+        user_request = self._build_generation_request(stage, project_context)
+        
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_request}
+        ]
+    
+    def _build_result(self, stage: Dict, code_text: str) -> Dict:
+        """Parse the model's answer into the generated code components"""
+        if not code_text:
+            logger.error("Empty response from Perplexity API")
+            raise ValueError("No response received from code generation service")
+        
+        # Log the raw response for debugging
+        logger.info(f"Raw code response (first 500 chars): {code_text[:500]}")
+        
+        # DEBUGGING: Save full response to file
+        import os
+        debug_file = os.path.join(os.path.dirname(__file__), f"debug_response_{stage.get('stage_number', 0)}.txt")
+        with open(debug_file, 'w', encoding='utf-8') as f:
+            f.write(code_text)
+        logger.info(f"Full response saved to: {debug_file}")
+        
+        # Parse the generated code
+        parsed_code = self._parse_generated_code(code_text)
+        
+        return {
+            "success": True,
+            "stage_id": stage.get('id'),
+            "stage_name": stage.get('stage_name'),
+            "global_labels": parsed_code.get('global_labels', []),
+            "local_labels": parsed_code.get('local_labels', []),
+            "program_body": parsed_code.get('program_body', ''),
+            "program_blocks": parsed_code.get('program_blocks', []),
+            "functions": parsed_code.get('functions', []),
+            "function_blocks": parsed_code.get('function_blocks', []),
+            "metadata": {
+                "program_name": f"STAGE_{stage.get('stage_number', 0)}",
+                "execution_type": self._determine_execution_type(stage.get('stage_type')),
+                "generated_at": "timestamp"
+            }
+        }
+    
+    async def _get_code_generation_context(self) -> str:
         """Retrieve relevant manual context for code generation"""
         queries = [
             "FX5U Structured Text syntax rules",
@@ -187,13 +206,10 @@ class StructuredTextGenerator:
             "GX Works3 program structure global local labels"
         ]
         
-        contexts = []
-        for query in queries:
-            context = self.retrieval.retrieve_context(query, max_chunks=2)
-            if context:
-                contexts.append(context)
-        
-        return "\n\n".join(contexts)
+        # One batched encode + search for all queries, packed into the token budget
+        return await self.retrieval.retrieve_packed_context(
+            queries, token_budget=CODEGEN_CONTEXT_TOKEN_BUDGET, max_chunks=2
+        )
     
     def _build_code_generation_prompt(self, manual_context: str) -> str:
         """Build system prompt for code generation"""
@@ -1,6 +1,6 @@
 from typing import Dict, List
 from app.core.ai_agents.shared.perplexity_api_client import perplexity_client
-from app.core.rag.semantic_retrieval_engine import retrieval_engine
+from app.services.retrieval_service import retrieval_service
 
 
 class StageSegregator:
@@ -8,7 +8,7 @@ class StageSegregator:
     
     def __init__(self):
         self.perplexity = perplexity_client
-        self.retrieval = retrieval_engine
+        self.retrieval = retrieval_service
     
     async def segregate(self, control_logic: str, analysis: Dict) -> Dict:
         """
@@ -25,7 +25,7 @@ class StageSegregator:
         system_prompt = self._build_segregation_prompt()
         
         # Get manual context about stages
-        manual_context = retrieval_engine.retrieve_context(
+        manual_context = await self.retrieval.retrieve_context(
             "PLC stage programming control flow stages",
             max_chunks=2
         )
@@ -0,0 +1,139 @@
+"""
+Code Query Splitter
+Splits a Structured Text program body into retrieval queries. The
+embedding model truncates its input after a few hundred tokens, so a long
+program embedded as one query is represented by its first lines only;
+embedding each IF / CASE / loop block and each run of plain statements
+separately lets every part of the program influence retrieval.
+"""
+import re
+from typing import Callable, List, Optional, Tuple
+
+_BLOCK_OPEN = re.compile(r'\b(IF|CASE|FOR|WHILE|REPEAT)\b', re.IGNORECASE)
+_BLOCK_CLOSE = re.compile(r'\bEND_(IF|CASE|FOR|WHILE|REPEAT)\b', re.IGNORECASE)
+# Comments (block comments may span lines) and string literals, whichever starts first
+_NON_CODE = re.compile(r"\(\*.*?\*\)|//[^\n]*|'[^'\n]*'|\"[^\"\n]*\"", re.DOTALL)
+
+# Sizes of a list of lines, e.g. encoder token counts
+LineMeasure = Callable[[List[str]], List[int]]
+
+
+def _line_lengths(lines: List[str]) -> List[int]:
+    """Characters per line, counting its newline"""
+    return [len(line) + 1 for line in lines]
+
+
+def _code_only(program_body: str) -> str:
+    """The body with comments and strings blanked out, keeping its line breaks"""
+    return _NON_CODE.sub(lambda match: "\n" * match.group().count("\n") or " ", program_body)
+
+
+def _control_depth_change(code_line: str):
+    """(opened, closed) control blocks on a line with comments and strings removed"""
+    return len(_BLOCK_OPEN.findall(code_line)), len(_BLOCK_CLOSE.findall(code_line))
+
+
+def _split_blocks(program_body: str) -> List[str]:
+    """Top-level control blocks and runs of statements between them"""
+    program_body = program_body.replace("\r\n", "\n").replace("\r", "\n")
+    code_lines = _code_only(program_body).split("\n")
+
+    blocks = []
+    current: List[str] = []
+    depth = 0
+
+    def close():
+        text = "\n".join(current).strip()
+        if text:
+            blocks.append(text)
+        current.clear()
+
+    for line, code_line in zip(program_body.split("\n"), code_lines):
+        opened, closed = _control_depth_change(code_line)
+
+        if depth == 0:
+            if opened > 0:
+                # A control block starts (possibly ending on the same line,
+                # "IF a THEN b := 1; END_IF;"): the statements before it are one block
+                close()
+            elif not line.strip():
+                # Blank lines separate runs of plain statements
+                close()
+                continue
+
+        in_block = depth > 0 or opened > 0
+        current.append(line)
+        depth = max(depth + opened - closed, 0)
+
+        if in_block and depth == 0:
+            # The control block ended on this line
+            close()
+
+    close()
+    return blocks
+
+
+def _split_long(lines: List[str], sizes: List[int], max_size: int) -> List[Tuple[str, int]]:
+    """Cut a block larger than max_size at line boundaries, as (text, size) pieces"""
+    pieces, piece_lines, piece_size = [], [], 0
+    for line, size in zip(lines, sizes):
+        if piece_lines and piece_size + size > max_size:
+            pieces.append(("\n".join(piece_lines), piece_size))
+            piece_lines, piece_size = [], 0
+        piece_lines.append(line)
+        piece_size += size
+    if piece_lines:
+        pieces.append(("\n".join(piece_lines), piece_size))
+    return pieces
+
+
+def split_program_blocks(
+    program_body: str,
+    max_size: int = 500,
+    max_blocks: int = 64,
+    measure: Optional[LineMeasure] = None
+) -> List[str]:
+    """
+    Split a program body into queries that each fit the embedding model
+
+    Small neighbouring blocks are packed together up to max_size, so a
+    short program stays a single query. Pass the encoder's token counter
+    as measure and its sequence limit as max_size so that no query is
+    truncated; by default sizes are in characters.
+
+    Args:
+        program_body: Structured Text program body
+        max_size: Largest query, in the units of measure
+        max_blocks: Most queries returned; beyond this, evenly spaced
+            blocks are kept
+        measure: Sizes of a list of lines; a query's size is the sum over
+            its lines (a single line larger than max_size stays whole)
+
+    Returns:
+        Queries in program order (the body itself if it has no code)
+    """
+    blocks = _split_blocks(program_body)
+    if not blocks:
+        return [program_body]
+
+    # Measure every line once, in one call (one tokenizer batch)
+    block_lines = [block.split("\n") for block in blocks]
+    sizes = iter((measure or _line_lengths)([line for lines in block_lines for line in lines]))
+
+    pieces = []
+    for lines in block_lines:
+        pieces.extend(_split_long(lines, [next(sizes) for _ in lines], max_size))
+
+    queries = [pieces[0]]
+    for text, size in pieces[1:]:
+        last_text, last_size = queries[-1]
+        if last_size + size <= max_size:
+            queries[-1] = (f"{last_text}\n{text}", last_size + size)
+        else:
+            queries.append((text, size))
+
+    if len(queries) > max_blocks:
+        step = len(queries) / max_blocks
+        queries = [queries[int(i * step)] for i in range(max_blocks)]
+
+    return [text for text, _ in queries]
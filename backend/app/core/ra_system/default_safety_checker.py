@@ -1,6 +1,7 @@
 from typing import Dict, List
 from app.core.ai_agents.shared.perplexity_api_client import perplexity_client
 from app.core.ra_system.default_safety_retrieval import default_safety_retrieval
+from app.services.retrieval_service import retrieval_service
 
 
 class DefaultSafetyChecker:
@@ -21,7 +22,7 @@ class DefaultSafetyChecker:
             Safety check result
         """
         # Load default safety manual
-        loaded = self.retrieval.load_default_safety_manual()
+        loaded = await retrieval_service.load_default_safety_manual()
         
         if not loaded:
             return {
@@ -29,9 +30,9 @@ class DefaultSafetyChecker:
                 "error": "No default safety manuals found. Please add safety manuals to data/manuals/user_safety_manuals/"
             }
         
-        # Get relevant safety rules
-        code_text = code.get('program_body', '')
-        safety_context = self.retrieval.retrieve_context(code_text, max_chunks=5)
+        # Get relevant safety rules for every block of the program
+        code_blocks = await retrieval_service.split_program_queries(code.get('program_body', ''))
+        safety_context = await retrieval_service.retrieve_default_safety_fused_context(code_blocks, max_chunks=5)
         
         # Get metadata
         metadata = self.retrieval.get_metadata()
@@ -1,12 +1,11 @@
 from pathlib import Path
 from typing import Dict, List
-import PyPDF2
-from docx import Document
-from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
 import pickle
 import json
+from app.core.rag.document_chunking_service import DocumentChunker
+from app.services.embedding_model_service import embedding_model_service
 from app.config import settings
 
 
@@ -14,74 +13,15 @@ class DefaultSafetyProcessor:
     """Process and embed default safety manuals from project folder"""
     
     def __init__(self):
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.dimension = 384
+        self.model = embedding_model_service
+        self.dimension = settings.EMBEDDING_DIMENSION
+        self.chunker = DocumentChunker(chunk_size=300, overlap=50)
         self.default_manuals_dir = Path(settings.ROOT_DIR) / "data" / "manuals" / "user_safety_manuals"
         self.embeddings_dir = Path(settings.EMBEDDINGS_PATH) / "default_safety_manuals"
     
-    def extract_text_from_pdf(self, file_path: str) -> str:
-        """Extract text from PDF"""
-        try:
-            text = ""
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-            return text.strip()
-        except Exception as e:
-            raise Exception(f"Failed to extract PDF: {str(e)}")
-    
-    def extract_text_from_docx(self, file_path: str) -> str:
-        """Extract text from Word document"""
-        try:
-            doc = Document(file_path)
-            text = []
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    text.append(paragraph.text)
-            return "\n".join(text)
-        except Exception as e:
-            raise Exception(f"Failed to extract DOCX: {str(e)}")
-    
-    def extract_text_from_txt(self, file_path: str) -> str:
-        """Extract text from TXT file"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
-        except Exception as e:
-            raise Exception(f"Failed to extract TXT: {str(e)}")
-    
-    def extract_text(self, file_path: str) -> str:
-        """Extract text from any supported format"""
-        path = Path(file_path)
-        extension = path.suffix.lower()
-        
-        if extension == '.pdf':
-            return self.extract_text_from_pdf(file_path)
-        elif extension in ['.docx', '.doc']:
-            return self.extract_text_from_docx(file_path)
-        elif extension == '.txt':
-            return self.extract_text_from_txt(file_path)
-        else:
-            raise Exception(f"Unsupported file type: {extension}")
-    
-    def chunk_text(self, text: str, chunk_size: int = 300, overlap: int = 50) -> List[str]:
-        """Split text into overlapping chunks"""
-        words = text.split()
-        chunks = []
-        
-        for i in range(0, len(words), chunk_size - overlap):
-            chunk = ' '.join(words[i:i + chunk_size])
-            if chunk.strip():
-                chunks.append(chunk)
-        
-        return chunks
-    
     def create_embeddings(self, chunks: List[str]) -> np.ndarray:
         """Create embeddings for chunks"""
-        return self.model.encode(chunks, show_progress_bar=False)
+        return self.model.encode_documents(chunks, show_progress_bar=False)
     
     def create_faiss_index(self, embeddings: np.ndarray) -> faiss.Index:
         """Create FAISS index"""
@@ -118,31 +58,35 @@ class DefaultSafetyProcessor:
                 "error": "No default safety manuals found in data/manuals/user_safety_manuals/"
             }
         
-        # Extract text from all manuals
-        all_text = []
+        # Chunk each manual page by page (chunks never span two manuals)
+        chunks = []
+        chunk_locations = []
         manual_sources = []
+        word_count = 0
         
         for manual_path in manuals:
+            stats = {}
+            manual_chunks, manual_locations = [], []
             try:
-                text = self.extract_text(str(manual_path))
-                if text and len(text) > 100:
-                    all_text.append(text)
-                    manual_sources.append(manual_path.name)
+                for chunk, location in self.chunker.chunk_file(str(manual_path), stats):
+                    manual_chunks.append(chunk)
+                    manual_locations.append({"source": manual_path.name, **location})
             except Exception as e:
                 print(f"Failed to process {manual_path.name}: {str(e)}")
-        
-        if not all_text:
+                continue
+            
+            if stats["chars"] > 100:
+                chunks.extend(manual_chunks)
+                chunk_locations.extend(manual_locations)
+                manual_sources.append(manual_path.name)
+                word_count += stats["words"]
+        
+        if not manual_sources:
             return {
                 "success": False,
                 "error": "Failed to extract text from default safety manuals"
             }
         
-        # Combine all text
-        combined_text = "\n\n=== MANUAL SEPARATOR ===\n\n".join(all_text)
-        
-        # Chunk combined text
-        chunks = self.chunk_text(combined_text)
-        
         if not chunks:
             return {
                 "success": False,
@@ -172,7 +116,9 @@ class DefaultSafetyProcessor:
             "total_chunks": len(chunks),
             "total_manuals": len(manual_sources),
             "manual_sources": manual_sources,
-            "word_count": len(combined_text.split())
+            "word_count": word_count,
+            # Source / page location of each chunk, for citations
+            "chunks": chunk_locations
         }
         metadata_file = self.embeddings_dir / "default_safety_metadata.json"
         with open(metadata_file, 'w') as f:
@@ -183,7 +129,7 @@ class DefaultSafetyProcessor:
             "chunks_count": len(chunks),
             "manuals_processed": len(manual_sources),
             "manual_sources": manual_sources,
-            "word_count": len(combined_text.split()),
+            "word_count": word_count,
             "index_path": str(index_file),
             "chunks_path": str(chunks_file),
             "metadata_path": str(metadata_file)
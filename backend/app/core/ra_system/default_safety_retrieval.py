@@ -1,9 +1,11 @@
 from pathlib import Path
 from typing import List, Dict
 import faiss
+import numpy as np
 import pickle
 import json
-from sentence_transformers import SentenceTransformer
+from app.core.rag.document_chunking_service import format_page_citation
+from app.services.embedding_model_service import embedding_model_service
 from app.config import settings
 
 
@@ -11,7 +13,7 @@ class DefaultSafetyRetrieval:
     """Retrieve safety rules from default preloaded manuals"""
     
     def __init__(self):
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.model = embedding_model_service
         self.embeddings_dir = Path(settings.EMBEDDINGS_PATH) / "default_safety_manuals"
         self.cache = None
     
@@ -57,29 +59,65 @@ class DefaultSafetyRetrieval:
         Returns:
             List of relevant safety rules
         """
-        if self.cache is None:
-            return []
+        return self.retrieve_many([query], top_k=top_k)[0]
+    
+    def retrieve_many(self, queries: List[str], top_k: int = 5) -> List[List[Dict]]:
+        """
+        Retrieve safety rules for several queries with one encode and one search
+        
+        Args:
+            queries: Query texts
+            top_k: Number of results per query
+        
+        Returns:
+            One result list per query, in the same order as queries
+        """
+        if self.cache is None or not queries:
+            return [[] for _ in queries]
+        
+        # Create all query embeddings in a single batch
+        query_embeddings = self.model.encode(queries)
+        return self.search_vectors(query_embeddings, top_k=top_k)
+    
+    def search_vectors(self, query_embeddings: np.ndarray, top_k: int = 5) -> List[List[Dict]]:
+        """
+        Search the default safety manuals with query embeddings that were
+        already computed (e.g. shared with other indices)
+        
+        Args:
+            query_embeddings: (n, dimension) float32 query matrix
+            top_k: Number of results per query
+        
+        Returns:
+            One result list per query row
+        """
+        if self.cache is None or len(query_embeddings) == 0:
+            return [[] for _ in query_embeddings]
         
         index = self.cache["index"]
         chunks = self.cache["chunks"]
-        
-        # Create query embedding
-        query_embedding = self.model.encode([query])
+        # Per-chunk page locations (manuals processed before page-aware chunking have none)
+        locations = self.cache["metadata"].get("chunks", [])
         
         # Search
-        distances, indices = index.search(query_embedding.astype('float32'), top_k)
+        distances, indices = index.search(query_embeddings, top_k)
         
         # Prepare results
-        results = []
-        for i, (distance, idx) in enumerate(zip(distances[0], indices[0])):
-            if idx < len(chunks):
-                results.append({
-                    "rank": i + 1,
-                    "content": chunks[idx],
-                    "score": float(distance)
-                })
-        
-        return results
+        all_results = []
+        for row_distances, row_indices in zip(distances, indices):
+            results = []
+            for i, (distance, idx) in enumerate(zip(row_distances, row_indices)):
+                if 0 <= idx < len(chunks):
+                    results.append({
+                        "id": int(idx),
+                        "rank": i + 1,
+                        "content": chunks[idx],
+                        "score": float(distance),
+                        "metadata": locations[idx] if idx < len(locations) else {}
+                    })
+            all_results.append(results)
+        
+        return all_results
     
     def retrieve_context(self, query: str, max_chunks: int = 5) -> str:
         """
@@ -93,16 +131,30 @@ class DefaultSafetyRetrieval:
             Formatted safety context string
         """
         results = self.retrieve(query, top_k=max_chunks)
-        
+        return self.format_context(results)
+    
+    def format_context(self, results: List[Dict]) -> str:
+        """Join retrieved safety rules into a context string"""
         if not results:
             return "No default safety manuals loaded."
         
         context_parts = []
         for result in results:
-            context_parts.append(result['content'])
+            location = result.get('metadata', {})
+            citation = format_page_citation(location)
+            if location.get('source'):
+                citation = f"{location['source']}, {citation}" if citation else location['source']
+            if citation:
+                context_parts.append(f"[Source: {citation}]\n{result['content']}")
+            else:
+                context_parts.append(result['content'])
         
         return "\n\n---\n\n".join(context_parts)
     
+    def unload(self):
+        """Drop the cached index so the next load reads the rebuilt one"""
+        self.cache = None
+    
     def get_metadata(self) -> Dict:
         """Get metadata about loaded default manuals"""
         if self.cache is None:
@@ -1,6 +1,6 @@
 from typing import Dict, List
 from app.core.ai_agents.shared.perplexity_api_client import perplexity_client
-from app.core.ra_system.safety_retrieval_engine import safety_retrieval_engine
+from app.services.retrieval_service import retrieval_service
 
 
 class RAInterrogator:
@@ -8,7 +8,7 @@ class RAInterrogator:
     
     def __init__(self):
         self.perplexity = perplexity_client
-        self.safety_retrieval = safety_retrieval_engine
+        self.safety_retrieval = retrieval_service
     
     async def interrogate_code(
         self,
@@ -28,7 +28,7 @@ class RAInterrogator:
             Interrogation result
         """
         # Load safety manual
-        loaded = self.safety_retrieval.load_safety_manual(project_id, embeddings_dir)
+        loaded = await self.safety_retrieval.load_safety_manual(project_id, embeddings_dir)
         
         if not loaded:
             return {
@@ -36,11 +36,11 @@ class RAInterrogator:
                 "error": "No safety manual found for this project. Please upload a safety manual first."
             }
         
-        # Get relevant safety rules
-        code_text = code.get('program_body', '')
-        safety_context = self.safety_retrieval.retrieve_context(
+        # Get relevant safety rules for every block of the program
+        code_blocks = await self.safety_retrieval.split_program_queries(code.get('program_body', ''))
+        safety_context = await self.safety_retrieval.retrieve_safety_fused_context(
             project_id,
-            code_text,
+            code_blocks,
             max_chunks=5
         )
         
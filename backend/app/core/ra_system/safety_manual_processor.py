@@ -1,90 +1,55 @@
 from pathlib import Path
-from typing import Dict, List
-import PyPDF2
-from docx import Document
-from sentence_transformers import SentenceTransformer
+from typing import Dict, List, Tuple
 import faiss
 import numpy as np
 import pickle
 import json
+from app.core.rag.document_chunking_service import DocumentChunker, iter_document_pages
+from app.core.rag.faiss_index_builder import build_compact_index
+from app.services.embedding_model_service import embedding_model_service
+from app.config import settings
 
 
 class SafetyManualProcessor:
     """Process and embed user's safety manual"""
     
     def __init__(self):
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.dimension = 384
-    
-    def extract_text_from_pdf(self, file_path: str) -> str:
-        """Extract text from PDF"""
-        try:
-            text = ""
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-            return text.strip()
-        except Exception as e:
-            raise Exception(f"Failed to extract PDF: {str(e)}")
-    
-    def extract_text_from_docx(self, file_path: str) -> str:
-        """Extract text from Word document"""
-        try:
-            doc = Document(file_path)
-            text = []
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    text.append(paragraph.text)
-            return "\n".join(text)
-        except Exception as e:
-            raise Exception(f"Failed to extract DOCX: {str(e)}")
-    
-    def extract_text_from_txt(self, file_path: str) -> str:
-        """Extract text from TXT file"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
-        except Exception as e:
-            raise Exception(f"Failed to extract TXT: {str(e)}")
+        self.model = embedding_model_service
+        self.dimension = settings.EMBEDDING_DIMENSION
+        self.chunker = DocumentChunker(chunk_size=300, overlap=50)
     
     def extract_text(self, file_path: str) -> str:
         """Extract text from any supported format"""
-        path = Path(file_path)
-        extension = path.suffix.lower()
+        try:
+            pages = iter_document_pages(file_path)
+        except ValueError as e:
+            raise Exception(str(e))
         
-        if extension == '.pdf':
-            return self.extract_text_from_pdf(file_path)
-        elif extension in ['.docx', '.doc']:
-            return self.extract_text_from_docx(file_path)
-        elif extension == '.txt':
-            return self.extract_text_from_txt(file_path)
-        else:
-            raise Exception(f"Unsupported file type: {extension}")
+        try:
+            return "\n".join(text for _, text in pages).strip()
+        except Exception as e:
+            raise Exception(f"Failed to extract {Path(file_path).suffix.lstrip('.').upper()}: {str(e)}")
     
-    def chunk_text(self, text: str, chunk_size: int = 300, overlap: int = 50) -> List[str]:
-        """Split text into overlapping chunks"""
-        words = text.split()
-        chunks = []
-        
-        for i in range(0, len(words), chunk_size - overlap):
-            chunk = ' '.join(words[i:i + chunk_size])
-            if chunk.strip():
-                chunks.append(chunk)
-        
-        return chunks
+    def chunk_file(self, file_path: str, stats: Dict) -> Tuple[List[str], List[Dict]]:
+        """Chunk a manual page by page into texts and their page locations"""
+        chunks, locations = [], []
+        for chunk, location in self.chunker.chunk_file(file_path, stats):
+            chunks.append(chunk)
+            locations.append(location)
+        return chunks, locations
     
     def create_embeddings(self, chunks: List[str]) -> np.ndarray:
         """Create embeddings for chunks"""
-        return self.model.encode(chunks, show_progress_bar=False)
+        return self.model.encode_documents(chunks, show_progress_bar=False)
     
     def create_faiss_index(self, embeddings: np.ndarray) -> faiss.Index:
-        """Create FAISS index"""
-        index = faiss.IndexFlatL2(self.dimension)
-        index.add(embeddings.astype('float32'))
-        return index
+        """Create FAISS index (storage encoding and PCA set in settings)"""
+        return build_compact_index(
+            embeddings,
+            storage=settings.SAFETY_INDEX_STORAGE,
+            pca_dim=settings.SAFETY_INDEX_PCA_DIM or None,
+            pq_m=settings.SAFETY_INDEX_PQ_M
+        )
     
     def process_and_embed(
         self,
@@ -99,18 +64,16 @@ class SafetyManualProcessor:
             Dict with processing results
         """
         try:
-            # Extract text
-            text = self.extract_text(file_path)
+            # Extract and chunk text page by page
+            stats = {}
+            chunks, locations = self.chunk_file(file_path, stats)
             
-            if not text or len(text) < 100:
+            if stats["chars"] < 100:
                 return {
                     "success": False,
                     "error": "Safety manual content too short or empty"
                 }
             
-            # Chunk text
-            chunks = self.chunk_text(text)
-            
             if not chunks:
                 return {
                     "success": False,
@@ -141,7 +104,9 @@ class SafetyManualProcessor:
                 "project_id": project_id,
                 "total_chunks": len(chunks),
                 "original_file": Path(file_path).name,
-                "word_count": len(text.split())
+                "word_count": stats["words"],
+                # Page / offset location of each chunk, for citations
+                "chunks": locations
             }
             metadata_file = output_path / f"safety_manual_{project_id}_metadata.json"
             with open(metadata_file, 'w') as f:
@@ -150,7 +115,7 @@ class SafetyManualProcessor:
             return {
                 "success": True,
                 "chunks_count": len(chunks),
-                "word_count": len(text.split()),
+                "word_count": stats["words"],
                 "index_path": str(index_file),
                 "chunks_path": str(chunks_file),
                 "metadata_path": str(metadata_file)
@@ -1,36 +1,158 @@
+import sys
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 import faiss
+import numpy as np
 import pickle
 import json
+from app.config import settings
+from app.core.rag.document_chunking_service import format_page_citation
+from app.services.embedding_model_service import embedding_model_service
+
+# Projects whose index directory is remembered for reloading after eviction
+MAX_REMEMBERED_PROJECTS = 4096
+
+
+class SafetyIndexCache:
+    """LRU cache of per-project safety indices with a memory budget"""
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def __contains__(self, project_id: int) -> bool:
+        with self._lock:
+            return project_id in self._entries
+    
+    def get(self, project_id: int, version: Optional[Tuple] = None) -> Optional[Dict]:
+        """
+        Cached entry for a project, or None
+        
+        If a version is given and differs from the cached one (the manual
+        was re-uploaded), the stale entry is dropped.
+        """
+        with self._lock:
+            entry = self._entries.get(project_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            if version is not None and entry["version"] != version:
+                self._remove(project_id)
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(project_id)
+            self.hits += 1
+            return entry
+    
+    def put(self, project_id: int, entry: Dict):
+        """Insert an entry and evict least recently used ones over budget"""
+        with self._lock:
+            if project_id in self._entries:
+                self._remove(project_id)
+            
+            self._entries[project_id] = entry
+            self.total_bytes += entry["nbytes"]
+            
+            # Always keep the entry just inserted, even if it alone exceeds the budget
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+    
+    def invalidate(self, project_id: int):
+        with self._lock:
+            if project_id in self._entries:
+                self._remove(project_id)
+                self.invalidations += 1
+    
+    def _remove(self, project_id: int):
+        entry = self._entries.pop(project_id)
+        self.total_bytes -= entry["nbytes"]
+    
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
 
 
 class SafetyRetrievalEngine:
     """Retrieve relevant safety rules for code validation"""
     
     def __init__(self):
-        self._model = None
-        self.cache = {}  # Cache loaded indices
+        self.model = embedding_model_service  # Shared, loaded on first encode
+        self.cache = SafetyIndexCache(settings.SAFETY_INDEX_CACHE_MAX_MB * 1024 * 1024)
+        # project_id -> directory, to reload after eviction (least recently used first)
+        self._embeddings_dirs: "OrderedDict[int, str]" = OrderedDict()
+        self._dirs_lock = threading.Lock()
+    
+    @staticmethod
+    def _index_file(project_id: int, embeddings_dir: str) -> Path:
+        return Path(embeddings_dir) / f"safety_manual_{project_id}.faiss"
+    
+    @staticmethod
+    def _file_version(path: Path) -> Optional[Tuple[int, int]]:
+        """Version stamp of an index file (mtime, size), None if missing"""
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
     
-    @property
-    def model(self):
-        """Lazy load the model only when needed"""
-        if self._model is None:
-            from sentence_transformers import SentenceTransformer
-            self._model = SentenceTransformer('all-MiniLM-L6-v2')
-        return self._model
+    def _remember_dir(self, project_id: int, embeddings_dir: str):
+        with self._dirs_lock:
+            self._embeddings_dirs[project_id] = embeddings_dir
+            self._embeddings_dirs.move_to_end(project_id)
+            while len(self._embeddings_dirs) > MAX_REMEMBERED_PROJECTS:
+                self._embeddings_dirs.popitem(last=False)
+    
+    def forget(self, project_id: int):
+        """Drop everything held for a project (e.g. when it is deleted)"""
+        with self._dirs_lock:
+            self._embeddings_dirs.pop(project_id, None)
+        self.cache.invalidate(project_id)
     
     def load_safety_manual(self, project_id: int, embeddings_dir: str) -> bool:
         """Load safety manual embeddings for a project"""
-        if project_id in self.cache:
-            return True
-        
+        return self._load_entry(project_id, embeddings_dir) is not None
+    
+    def _load_entry(self, project_id: int, embeddings_dir: str) -> Optional[Dict]:
+        """
+        Cache entry for the index file as it is on disk now: the cached
+        one if its (mtime, size) version still matches, else freshly loaded
+        """
+        self._remember_dir(project_id, embeddings_dir)
         embeddings_path = Path(embeddings_dir)
         
         # Load FAISS index
-        index_file = embeddings_path / f"safety_manual_{project_id}.faiss"
-        if not index_file.exists():
-            return False
+        index_file = self._index_file(project_id, embeddings_dir)
+        version = self._file_version(index_file)
+        if version is None:
+            self.cache.invalidate(project_id)
+            return None
+        
+        entry = self.cache.get(project_id, version)
+        if entry is not None:
+            return entry
         
         index = faiss.read_index(str(index_file))
         
@@ -44,14 +166,54 @@ class SafetyRetrievalEngine:
         with open(metadata_file, 'r') as f:
             metadata = json.load(f)
         
-        # Cache
-        self.cache[project_id] = {
+        # Cache (index size approximated by its file size)
+        nbytes = version[1] + sum(sys.getsizeof(chunk) for chunk in chunks)
+        entry = {
             "index": index,
             "chunks": chunks,
-            "metadata": metadata
+            "metadata": metadata,
+            "version": version,
+            "nbytes": nbytes
         }
+        self.cache.put(project_id, entry)
+        
+        return entry
+    
+    def preload(self, project_ids: List[int], embeddings_dir: str) -> int:
+        """Load the given projects' indices ahead of their first request"""
+        loaded = 0
+        for project_id in project_ids:
+            if self.load_safety_manual(project_id, embeddings_dir):
+                loaded += 1
+        return loaded
+    
+    def preload_recent(self, embeddings_dir: str, limit: int) -> int:
+        """Preload the most recently updated project indices"""
+        index_files = sorted(
+            Path(embeddings_dir).glob("safety_manual_*.faiss"),
+            key=lambda path: path.stat().st_mtime,
+            reverse=True
+        )
         
-        return True
+        project_ids = []
+        for index_file in index_files[:limit]:
+            try:
+                project_ids.append(int(index_file.stem.rsplit("_", 1)[1]))
+            except ValueError:
+                continue
+        
+        return self.preload(project_ids, embeddings_dir)
+    
+    def _get_entry(self, project_id: int) -> Optional[Dict]:
+        """
+        Entry for the project's current index file: reloaded if it was
+        evicted or the manual was re-uploaded since load_safety_manual
+        """
+        with self._dirs_lock:
+            embeddings_dir = self._embeddings_dirs.get(project_id)
+        if embeddings_dir is None:
+            return None
+        return self._load_entry(project_id, embeddings_dir)
     
     def retrieve(self, project_id: int, query: str, top_k: int = 5) -> List[Dict]:
         """
@@ -65,30 +227,68 @@ class SafetyRetrievalEngine:
         Returns:
             List of relevant safety rules
         """
-        if project_id not in self.cache:
-            return []
+        return self.retrieve_many(project_id, [query], top_k=top_k)[0]
+    
+    def retrieve_many(self, project_id: int, queries: List[str], top_k: int = 5) -> List[List[Dict]]:
+        """
+        Retrieve safety rules for several queries with one encode and one search
+        
+        Args:
+            project_id: Project ID
+            queries: Query texts
+            top_k: Number of results per query
+        
+        Returns:
+            One result list per query, in the same order as queries
+        """
+        if self._get_entry(project_id) is None or not queries:
+            return [[] for _ in queries]
+        
+        # Create all query embeddings in a single batch
+        query_embeddings = self.model.encode(queries)
+        return self.search_vectors(project_id, query_embeddings, top_k=top_k)
+    
+    def search_vectors(self, project_id: int, query_embeddings: np.ndarray, top_k: int = 5) -> List[List[Dict]]:
+        """
+        Search a project's safety manual with query embeddings that were
+        already computed (e.g. shared with other indices)
+        
+        Args:
+            project_id: Project ID
+            query_embeddings: (n, dimension) float32 query matrix
+            top_k: Number of results per query
+        
+        Returns:
+            One result list per query row
+        """
+        cache_data = self._get_entry(project_id)
+        if cache_data is None or len(query_embeddings) == 0:
+            return [[] for _ in query_embeddings]
         
-        cache_data = self.cache[project_id]
         index = cache_data["index"]
         chunks = cache_data["chunks"]
-        
-        # Create query embedding
-        query_embedding = self.model.encode([query])
+        # Per-chunk page locations (manuals processed before page-aware chunking have none)
+        locations = cache_data["metadata"].get("chunks", [])
         
         # Search
-        distances, indices = index.search(query_embedding.astype('float32'), top_k)
+        distances, indices = index.search(query_embeddings, top_k)
         
         # Prepare results
-        results = []
-        for i, (distance, idx) in enumerate(zip(distances[0], indices[0])):
-            if idx < len(chunks):
-                results.append({
-                    "rank": i + 1,
-                    "content": chunks[idx],
-                    "score": float(distance)
-                })
+        all_results = []
+        for row_distances, row_indices in zip(distances, indices):
+            results = []
+            for i, (distance, idx) in enumerate(zip(row_distances, row_indices)):
+                if 0 <= idx < len(chunks):
+                    results.append({
+                        "id": int(idx),
+                        "rank": i + 1,
+                        "content": chunks[idx],
+                        "score": float(distance),
+                        "metadata": locations[idx] if idx < len(locations) else {}
+                    })
+            all_results.append(results)
         
-        return results
+        return all_results
     
     def retrieve_context(self, project_id: int, query: str, max_chunks: int = 3) -> str:
         """
@@ -103,13 +303,20 @@ class SafetyRetrievalEngine:
             Formatted safety context string
         """
         results = self.retrieve(project_id, query, top_k=max_chunks)
-        
+        return self.format_context(results)
+    
+    def format_context(self, results: List[Dict]) -> str:
+        """Join retrieved safety rules into a context string"""
         if not results:
             return "No safety manual uploaded for this project."
         
         context_parts = []
         for result in results:
-            context_parts.append(result['content'])
+            citation = format_page_citation(result.get('metadata', {}))
+            if citation:
+                context_parts.append(f"[Safety manual, {citation}]\n{result['content']}")
+            else:
+                context_parts.append(result['content'])
         
         return "\n\n---\n\n".join(context_parts)
 
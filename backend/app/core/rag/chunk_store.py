@@ -0,0 +1,166 @@
+"""
+On-disk chunk store for the manual index
+
+Chunk texts and their metadata are stored as UTF-8 blobs with an int64
+offset table per blob. Readers memory-map both, so every worker shares
+the OS page cache and only the records for the k search hits are decoded.
+
+Layout (inside the metadata directory):
+    chunks.bin / chunk_offsets.npy        chunk text
+    metadata.bin / metadata_offsets.npy   one JSON object per chunk
+"""
+import json
+import mmap
+import os
+import pickle
+from pathlib import Path
+from typing import Dict, Iterator, List
+import numpy as np
+
+CHUNKS_BLOB = "chunks.bin"
+CHUNK_OFFSETS = "chunk_offsets.npy"
+METADATA_BLOB = "metadata.bin"
+METADATA_OFFSETS = "metadata_offsets.npy"
+
+# Pre-chunk-store layout
+LEGACY_CHUNKS = "chunks.pkl"
+LEGACY_METADATA = "metadata.json"
+
+
+class ChunkStoreWriter:
+    """Streams chunks to disk; files only become visible on close()"""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self._chunks_file = open(self._tmp(CHUNKS_BLOB), 'wb')
+        self._metadata_file = open(self._tmp(METADATA_BLOB), 'wb')
+        self._chunk_offsets = [0]
+        self._metadata_offsets = [0]
+
+    def _tmp(self, name: str) -> Path:
+        return self.directory / f"{name}.tmp"
+
+    def __len__(self) -> int:
+        return len(self._chunk_offsets) - 1
+
+    def append(self, chunk: str, metadata: Dict):
+        """Append one chunk and its metadata"""
+        chunk_bytes = chunk.encode('utf-8')
+        metadata_bytes = json.dumps(metadata, ensure_ascii=False).encode('utf-8')
+
+        self._chunks_file.write(chunk_bytes)
+        self._metadata_file.write(metadata_bytes)
+        self._chunk_offsets.append(self._chunk_offsets[-1] + len(chunk_bytes))
+        self._metadata_offsets.append(self._metadata_offsets[-1] + len(metadata_bytes))
+
+    def close(self):
+        """Flush blobs and offset tables, then move them into place"""
+        self._chunks_file.close()
+        self._metadata_file.close()
+
+        with open(self._tmp(CHUNK_OFFSETS), 'wb') as f:
+            np.save(f, np.asarray(self._chunk_offsets, dtype='int64'))
+        with open(self._tmp(METADATA_OFFSETS), 'wb') as f:
+            np.save(f, np.asarray(self._metadata_offsets, dtype='int64'))
+
+        for name in (CHUNKS_BLOB, METADATA_BLOB, CHUNK_OFFSETS, METADATA_OFFSETS):
+            os.replace(self._tmp(name), self.directory / name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._chunks_file.close()
+            self._metadata_file.close()
+
+
+def write_chunk_store(directory: str, chunks: List[str], metadata: List[Dict]):
+    """Write a complete chunk store from in-memory lists"""
+    with ChunkStoreWriter(directory) as writer:
+        for chunk, meta in zip(chunks, metadata):
+            writer.append(chunk, meta)
+
+
+def _map_blob(path: Path):
+    """Read-only memory map of a blob (empty files cannot be mapped)"""
+    if path.stat().st_size == 0:
+        return b""
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class ChunkStore:
+    """Memory-mapped reader for a chunk store directory"""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self._chunk_offsets = np.load(self.directory / CHUNK_OFFSETS, mmap_mode='r')
+        self._metadata_offsets = np.load(self.directory / METADATA_OFFSETS, mmap_mode='r')
+        self._chunks_blob = _map_blob(self.directory / CHUNKS_BLOB)
+        self._metadata_blob = _map_blob(self.directory / METADATA_BLOB)
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        directory = Path(directory)
+        return all(
+            (directory / name).exists()
+            for name in (CHUNKS_BLOB, CHUNK_OFFSETS, METADATA_BLOB, METADATA_OFFSETS)
+        )
+
+    def __len__(self) -> int:
+        return len(self._chunk_offsets) - 1
+
+    def chunk(self, idx: int) -> str:
+        start, end = int(self._chunk_offsets[idx]), int(self._chunk_offsets[idx + 1])
+        return self._chunks_blob[start:end].decode('utf-8')
+
+    def metadata(self, idx: int) -> Dict:
+        start, end = int(self._metadata_offsets[idx]), int(self._metadata_offsets[idx + 1])
+        return json.loads(self._metadata_blob[start:end].decode('utf-8'))
+
+    def iter_metadata(self) -> Iterator[Dict]:
+        for idx in range(len(self)):
+            yield self.metadata(idx)
+
+    def close(self):
+        for blob in (self._chunks_blob, self._metadata_blob):
+            if isinstance(blob, mmap.mmap):
+                blob.close()
+
+
+class LegacyChunkStore:
+    """Same interface over the old chunks.pkl + metadata.json files"""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        with open(self.directory / LEGACY_CHUNKS, 'rb') as f:
+            self._chunks = pickle.load(f)
+        with open(self.directory / LEGACY_METADATA, 'r', encoding='utf-8') as f:
+            self._metadata = json.load(f)
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def chunk(self, idx: int) -> str:
+        return self._chunks[idx]
+
+    def metadata(self, idx: int) -> Dict:
+        return self._metadata[idx]
+
+    def iter_metadata(self) -> Iterator[Dict]:
+        return iter(self._metadata)
+
+    def close(self):
+        pass
+
+
+def open_chunk_store(directory: str):
+    """Open the memory-mapped store, falling back to the legacy pickle files"""
+    if ChunkStore.exists(directory):
+        return ChunkStore(directory)
+    return LegacyChunkStore(directory)
@@ -0,0 +1,284 @@
+"""
+Context Augmentation Service
+Packs retrieved manual chunks into a token budget for LLM prompts:
+duplicates across queries are dropped, overlapping neighbour chunks of
+the same manual are merged into one passage, and passages are picked by
+maximal marginal relevance (MMR) until the budget is full.
+
+MMR compares passages through the stored vectors of the chunks they are
+made of, so packing never runs the encoder: merged passages match no
+stored chunk and would be longer than the encoder's input anyway.
+"""
+import hashlib
+import math
+import threading
+from typing import Callable, Dict, List, Optional
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Gemini tokenizes English prose at roughly four characters per token
+CHARS_PER_TOKEN = 4.0
+
+# Longest word overlap searched for when merging neighbour chunks
+# (chunkers overlap consecutive chunks by 50 words)
+MAX_OVERLAP_WORDS = 100
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate LLM token count of a text"""
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN)) if text else 0
+
+
+def _overlap_words(left: List[str], right: List[str]) -> int:
+    """Length of the longest suffix of left that is a prefix of right"""
+    for size in range(min(len(left), len(right), MAX_OVERLAP_WORDS), 0, -1):
+        if left[-size:] == right[:size]:
+            return size
+    return 0
+
+
+def _truncate_to_tokens(text: str, tokens: int) -> str:
+    """Cut text at a word boundary so it fits in the given tokens"""
+    limit = int(tokens * CHARS_PER_TOKEN)
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > 0 else limit] + " ..."
+
+
+def _public(passage: Dict) -> Dict:
+    """A passage without the packer's working fields"""
+    return {key: value for key, value in passage.items() if key != "_chunks"}
+
+
+class ContextPacker:
+    """Select and merge retrieved chunks to fit a token budget"""
+
+    def __init__(self, mmr_lambda: float = 0.7):
+        self.mmr_lambda = mmr_lambda
+        self._lock = threading.Lock()
+        self._stats = {
+            "packs": 0,
+            "tokens_before": 0,
+            "tokens_used": 0,
+            "duplicates_removed": 0,
+            "chunks_merged": 0
+        }
+
+    def pack(
+        self,
+        per_query_results: List[List[Dict]],
+        token_budget: int,
+        chunk_vectors: Optional[Callable[[List[str]], List[Optional[np.ndarray]]]] = None,
+        format_passage: Optional[Callable[[Dict], str]] = None
+    ) -> Dict:
+        """
+        Pack search results for several queries into one context
+
+        Args:
+            per_query_results: One ranked hit list per query (hits carry
+                "content", "score" and, for manual hits, "id" and "metadata")
+            token_budget: Maximum tokens of the formatted passages
+            chunk_vectors: Stored embeddings of chunk texts (None for a
+                chunk without one), used for MMR diversity; without it
+                passages are taken in relevance order
+            format_passage: Renders one passage as it will appear in the
+                prompt (used for token accounting)
+
+        Returns:
+            Dict with the selected passages and token statistics
+        """
+        format_passage = format_passage or (lambda passage: passage["content"])
+        naive_tokens = sum(
+            estimate_tokens(format_passage(hit))
+            for hits in per_query_results for hit in hits
+        )
+
+        candidates, duplicates = self._deduplicate(per_query_results)
+        passages, merged = self._merge_neighbours(candidates)
+        selected = self._select(passages, token_budget, chunk_vectors, format_passage)
+
+        used_tokens = sum(estimate_tokens(format_passage(passage)) for passage in selected)
+        result = {
+            "passages": selected,
+            "tokens_before": naive_tokens,
+            "tokens_used": used_tokens,
+            "tokens_saved": max(naive_tokens - used_tokens, 0),
+            "duplicates_removed": duplicates,
+            "chunks_merged": merged,
+            "passages_dropped": len(passages) - len(selected)
+        }
+
+        with self._lock:
+            self._stats["packs"] += 1
+            self._stats["tokens_before"] += naive_tokens
+            self._stats["tokens_used"] += used_tokens
+            self._stats["duplicates_removed"] += duplicates
+            self._stats["chunks_merged"] += merged
+
+        logger.debug(
+            f"Context packed: {used_tokens}/{token_budget} tokens, "
+            f"{result['tokens_saved']} saved ({duplicates} duplicates, {merged} merged)"
+        )
+        return result
+
+    def _deduplicate(self, per_query_results: List[List[Dict]]):
+        """Keep each chunk once, with its best score across queries"""
+        best: Dict[str, Dict] = {}
+        total = 0
+        for hits in per_query_results:
+            for hit in hits:
+                total += 1
+                key = hit["id"] if "id" in hit else hashlib.sha1(hit["content"].encode('utf-8')).hexdigest()
+                current = best.get(key)
+                if current is None or hit["score"] < current["score"]:
+                    best[key] = hit
+        return list(best.values()), total - len(best)
+
+    def _merge_neighbours(self, candidates: List[Dict]):
+        """
+        Merge consecutive chunks of the same manual into one passage,
+        dropping the words they share
+        """
+        def position(hit):
+            metadata = hit.get("metadata") or {}
+            return metadata.get("source"), metadata.get("chunk_id")
+
+        mergeable = sorted(
+            (hit for hit in candidates if None not in position(hit)),
+            key=position
+        )
+        passages = [{**hit, "_chunks": [hit["content"]]} for hit in candidates if None in position(hit)]
+        merged = 0
+
+        current = None
+        for hit in mergeable:
+            source, chunk_id = position(hit)
+            if current is not None and current["_source"] == source and current["_last"] + 1 == chunk_id:
+                left = current["content"].split()
+                right = hit["content"].split()
+                current["content"] = " ".join(left + right[_overlap_words(left, right):])
+                current["score"] = min(current["score"], hit["score"])
+                current["_last"] = chunk_id
+                current["merged_ids"].append(hit.get("id"))
+                current["_chunks"].append(hit["content"])
+                # The passage now ends where the later chunk does
+                for key in ("page_end", "char_end"):
+                    if key in hit["metadata"]:
+                        current["metadata"][key] = hit["metadata"][key]
+                merged += 1
+                continue
+
+            if current is not None:
+                passages.append(current)
+            current = dict(hit)
+            current["metadata"] = dict(hit["metadata"])
+            current.update({
+                "_source": source,
+                "_last": chunk_id,
+                "_chunks": [hit["content"]],
+                "merged_ids": [hit.get("id")]
+            })
+
+        if current is not None:
+            passages.append(current)
+
+        for passage in passages:
+            passage.pop("_source", None)
+            if "_last" in passage:
+                passage["metadata"]["last_chunk_id"] = passage.pop("_last")
+
+        # Most relevant first (FAISS L2 scores: lower is closer)
+        passages.sort(key=lambda passage: passage["score"])
+        return passages, merged
+
+    @staticmethod
+    def _passage_vectors(
+        passages: List[Dict],
+        chunk_vectors: Callable[[List[str]], List[Optional[np.ndarray]]]
+    ) -> Optional[np.ndarray]:
+        """
+        Unit vector per passage: the normalized mean of its chunks' stored
+        vectors (zero, i.e. never redundant, if none of them is stored)
+        """
+        texts = [text for passage in passages for text in passage["_chunks"]]
+        stored = iter(chunk_vectors(texts))
+
+        vectors = []
+        dimension = None
+        for passage in passages:
+            found = [vector for vector in (next(stored) for _ in passage["_chunks"]) if vector is not None]
+            if found:
+                found = np.asarray(found, dtype='float32')
+                found = found / np.maximum(np.linalg.norm(found, axis=1, keepdims=True), 1e-12)
+                mean = found.mean(axis=0)
+                vectors.append(mean / max(float(np.linalg.norm(mean)), 1e-12))
+                dimension = len(mean)
+            else:
+                vectors.append(None)
+
+        if dimension is None:
+            return None
+        return np.vstack([
+            vector if vector is not None else np.zeros(dimension, dtype='float32')
+            for vector in vectors
+        ])
+
+    def _select(
+        self,
+        passages: List[Dict],
+        token_budget: int,
+        chunk_vectors: Optional[Callable[[List[str]], List[Optional[np.ndarray]]]],
+        format_passage: Callable[[Dict], str]
+    ) -> List[Dict]:
+        """MMR selection under the token budget"""
+        if not passages or token_budget <= 0:
+            return []
+
+        # Squared L2 between unit vectors -> cosine similarity
+        relevance = np.array([1.0 - passage["score"] / 2.0 for passage in passages])
+        vectors = None
+        if chunk_vectors is not None and len(passages) > 1:
+            vectors = self._passage_vectors(passages, chunk_vectors)
+
+        costs = [estimate_tokens(format_passage(passage)) for passage in passages]
+        remaining = token_budget
+        selected: List[int] = []
+        available = set(range(len(passages)))
+
+        while available:
+            def mmr(i):
+                if vectors is None or not selected:
+                    return relevance[i]
+                redundancy = float(np.max(vectors[selected] @ vectors[i]))
+                return self.mmr_lambda * relevance[i] - (1 - self.mmr_lambda) * redundancy
+
+            best = max(available, key=mmr)
+            available.discard(best)
+
+            if costs[best] <= remaining:
+                selected.append(best)
+                remaining -= costs[best]
+            elif not selected:
+                # Nothing fits whole: trim the best passage to the budget
+                passage = _public(passages[best])
+                overhead = estimate_tokens(format_passage({**passage, "content": ""}))
+                passage["content"] = _truncate_to_tokens(passage["content"], max(remaining - overhead, 1))
+                return [passage]
+
+        return [_public(passages[i]) for i in selected]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["tokens_saved"] = stats["tokens_before"] - stats["tokens_used"]
+        stats["saved_ratio"] = (
+            round(stats["tokens_saved"] / stats["tokens_before"], 4) if stats["tokens_before"] else 0.0
+        )
+        return stats
+
+
+# Global instance
+context_packer = ContextPacker()
@@ -0,0 +1,269 @@
+"""
+Document Chunking Service
+Streaming, page-aware chunker shared by every ingestion path.
+
+Pages are read one at a time and chunks are yielded as soon as they are
+full, so memory stays bounded by one page plus one chunk however large
+the manual is. Chunks end on sentence boundaries, a new section heading
+starts a new chunk, and neighbouring chunks overlap by whole sentences.
+Each chunk records where it came from:
+
+    page_start / page_end   1-based PDF pages (None for TXT / DOCX)
+    char_start / char_end   offsets into the document text, i.e. the page
+                            texts joined with a newline after each page
+    section                 last heading seen before the chunk
+"""
+import re
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import PyPDF2
+
+# (page number or None, page text)
+Page = Tuple[Optional[int], str]
+
+_WORD = re.compile(r'\S+')
+_SENTENCE_END = re.compile(r'[.!?]["\')\]]*$')
+_NUMBERED_HEADING = re.compile(r'^\d+(\.\d+)*\.?\s+[A-Z][^.!?]*$')
+# All-caps titles: letters, spaces and title punctuation only (no digits or
+# operators, which rules out instruction lines such as "LD X0" or "MOV K10 D0")
+_CAPS_HEADING = re.compile(r"^[A-Z][A-Z &/',:\-]*[A-Z]$")
+_MAX_HEADING_WORDS = 12
+_MIN_CAPS_HEADING_WORDS = 2
+
+
+def iter_pdf_pages(file_path: str) -> Iterator[Page]:
+    """Pages of a PDF, extracted one at a time"""
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        for page_num, page in enumerate(pdf_reader.pages):
+            yield page_num + 1, page.extract_text() or ""
+
+
+def iter_text_pages(file_path: str, lines_per_block: int = 200) -> Iterator[Page]:
+    """
+    A text file in blocks of lines (text files have no pages). The newline
+    ending each block is the one the chunker adds after every page, so
+    chunk offsets are file offsets.
+    """
+    with open(file_path, 'r', encoding='utf-8') as file:
+        block = []
+        for line in file:
+            block.append(line)
+            if len(block) >= lines_per_block:
+                yield None, "".join(block)[:-1]
+                block = []
+        if block:
+            text = "".join(block)
+            yield None, text[:-1] if text.endswith("\n") else text
+
+
+def iter_docx_pages(file_path: str) -> Iterator[Page]:
+    """Paragraphs of a Word document (DOCX has no fixed pages)"""
+    from docx import Document
+
+    for paragraph in Document(file_path).paragraphs:
+        if paragraph.text.strip():
+            yield None, paragraph.text
+
+
+def iter_document_pages(file_path: str) -> Iterator[Page]:
+    """Pages of any supported document"""
+    extension = Path(file_path).suffix.lower()
+    if extension == '.pdf':
+        return iter_pdf_pages(file_path)
+    if extension in ['.docx', '.doc']:
+        return iter_docx_pages(file_path)
+    if extension == '.txt':
+        return iter_text_pages(file_path)
+    raise ValueError(f"Unsupported file type: {extension}")
+
+
+def _is_heading(line: str) -> bool:
+    words = line.split()
+    if not words or len(words) > _MAX_HEADING_WORDS:
+        return False
+    if _NUMBERED_HEADING.match(line):
+        return True
+    if not _CAPS_HEADING.match(line):
+        return False
+    # Several real words, not mnemonics ("OUT Y", "LDP EQU")
+    title_words = [word for word in words if any(c.isalpha() for c in word)]
+    letters = [sum(c.isalpha() for c in word) for word in title_words]
+    return (
+        len(title_words) >= _MIN_CAPS_HEADING_WORDS
+        and min(letters) >= 2
+        and max(letters) >= 4
+    )
+
+
+class _Unit:
+    """A sentence or heading with its words and document offsets"""
+
+    __slots__ = ("words", "page", "last_page", "start", "end", "heading", "section")
+
+    def __init__(
+        self,
+        words: List[str],
+        page: Optional[int],
+        last_page: Optional[int],
+        start: int,
+        end: int,
+        heading: bool,
+        section: Optional[str]
+    ):
+        self.words = words
+        self.page = page
+        self.last_page = last_page
+        self.start = start
+        self.end = end
+        self.heading = heading
+        self.section = section
+
+
+class DocumentChunker:
+    """Sentence- and section-aware chunker over a stream of pages"""
+
+    def __init__(self, chunk_size: int = 500, overlap: int = 50):
+        """
+        Args:
+            chunk_size: Target words per chunk
+            overlap: Words of trailing sentences repeated at the start of the next chunk
+        """
+        if overlap >= chunk_size:
+            raise ValueError("overlap must be smaller than chunk_size")
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.min_section_chunk = max(chunk_size // 4, 1)
+
+    def _units(self, pages: Iterable[Page], stats: Dict) -> Iterator[_Unit]:
+        """Split pages into sentences and headings, tracking offsets"""
+        base = 0
+        section = None
+        # The running sentence may continue onto the next page
+        words, first_page, start, end = [], None, None, None
+
+        for page, text in pages:
+            stats["pages"] += 1
+            stats["chars"] += len(text)
+
+            line_start = 0
+            for line in text.split("\n"):
+                stripped = line.strip()
+                line_offset = base + line_start
+                line_start += len(line) + 1
+
+                if not stripped or _is_heading(stripped):
+                    # Blank lines and headings end the running sentence
+                    if words:
+                        yield _Unit(words, first_page, page, start, end, False, section)
+                        words = []
+                    if stripped:
+                        section = " ".join(stripped.split())
+                        offset = line_offset + line.index(stripped[0])
+                        stats["words"] += len(stripped.split())
+                        yield _Unit(stripped.split(), page, page, offset, offset + len(stripped), True, section)
+                    continue
+
+                for match in _WORD.finditer(line):
+                    if not words:
+                        first_page = page
+                        start = line_offset + match.start()
+                    words.append(match.group())
+                    end = line_offset + match.end()
+                    stats["words"] += 1
+                    if _SENTENCE_END.search(match.group()):
+                        yield _Unit(words, first_page, page, start, end, False, section)
+                        words = []
+
+            base += len(text) + 1
+
+        if words:
+            yield _Unit(words, first_page, page, start, end, False, section)
+
+    def _split_long(self, unit: _Unit) -> Iterator[_Unit]:
+        """Break a sentence longer than a chunk into chunk-sized pieces"""
+        if len(unit.words) <= self.chunk_size:
+            yield unit
+            return
+        for i in range(0, len(unit.words), self.chunk_size):
+            # Offsets of the pieces are not tracked word by word; each
+            # piece carries the span of the whole sentence
+            yield _Unit(
+                unit.words[i:i + self.chunk_size],
+                unit.page, unit.last_page, unit.start, unit.end, False, unit.section
+            )
+
+    def _emit(self, buffer: List[_Unit]) -> Tuple[str, Dict]:
+        first, last = buffer[0], buffer[-1]
+        text = " ".join(word for unit in buffer for word in unit.words)
+        return text, {
+            "page_start": first.page,
+            "page_end": last.last_page,
+            "char_start": first.start,
+            "char_end": last.end,
+            "section": first.section
+        }
+
+    def _overlap_tail(self, buffer: List[_Unit]) -> List[_Unit]:
+        """Trailing whole sentences that fit in the overlap"""
+        tail, words = [], 0
+        for unit in reversed(buffer):
+            if words + len(unit.words) > self.overlap:
+                break
+            tail.insert(0, unit)
+            words += len(unit.words)
+        return tail
+
+    def chunk_pages(self, pages: Iterable[Page], stats: Optional[Dict] = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        Chunk a stream of pages
+
+        Args:
+            pages: (page number or None, text) in document order
+            stats: Optional dict filled with pages, words and chars read
+
+        Yields:
+            (chunk text, location metadata)
+        """
+        if stats is None:
+            stats = {}
+        stats.update({"pages": 0, "words": 0, "chars": 0})
+
+        buffer: List[_Unit] = []
+        buffer_words = 0
+        fresh = False  # buffer holds sentences not emitted yet
+
+        for sentence in self._units(pages, stats):
+            for unit in self._split_long(sentence):
+                if unit.heading and fresh and buffer_words >= self.min_section_chunk:
+                    # New section: close the current chunk without carrying overlap
+                    yield self._emit(buffer)
+                    buffer, buffer_words, fresh = [], 0, False
+                elif buffer and buffer_words + len(unit.words) > self.chunk_size:
+                    if fresh:
+                        yield self._emit(buffer)
+                    buffer = self._overlap_tail(buffer)
+                    buffer_words = sum(len(u.words) for u in buffer)
+                    fresh = False
+
+                buffer.append(unit)
+                buffer_words += len(unit.words)
+                fresh = True
+
+        if fresh:
+            yield self._emit(buffer)
+
+    def chunk_file(self, file_path: str, stats: Optional[Dict] = None) -> Iterator[Tuple[str, Dict]]:
+        """Chunk a PDF, DOCX or TXT file page by page"""
+        return self.chunk_pages(iter_document_pages(str(file_path)), stats)
+
+
+def format_page_citation(metadata: Dict) -> str:
+    """'p. 12' / 'pp. 12-13' for a chunk's metadata, '' without pages"""
+    page_start = metadata.get("page_start")
+    page_end = metadata.get("page_end") or page_start
+    if page_start is None:
+        return ""
+    if page_end == page_start:
+        return f"p. {page_start}"
+    return f"pp. {page_start}-{page_end}"
@@ -0,0 +1,181 @@
+"""
+Persistent embedding cache keyed by (model namespace, chunk SHA-256)
+
+Vectors are appended to a raw float16/float32 file that readers
+memory-map; a small SQLite table maps chunk hashes to row numbers.
+SQLite's write lock also serializes appends between processes.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from app.config import settings
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+
+
+def chunk_hash(chunk: str) -> str:
+    """Content hash identifying a chunk across rebuilds"""
+    return hashlib.sha256(chunk.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk, memory-mapped store of chunk embeddings for one model"""
+
+    def __init__(
+        self,
+        model_name: str,
+        dimension: int,
+        cache_dir: Optional[str] = None,
+        dtype: str = "float16"
+    ):
+        base_dir = Path(cache_dir or Path(settings.EMBEDDINGS_PATH) / "embedding_cache")
+        self.directory = base_dir / re.sub(r'[^A-Za-z0-9_.-]', '_', model_name)
+        self.dtype = np.dtype(dtype)
+        self.dimension = dimension
+        self.row_bytes = self.dtype.itemsize * dimension
+
+        self.vectors_path = self.directory / f"vectors.{self.dtype.name}"
+        self.db_path = self.directory / "keys.sqlite"
+
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._mapped_rows = 0
+        self._initialized = False
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with sqlite3.connect(str(self.db_path), timeout=30) as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings "
+                    "(hash TEXT PRIMARY KEY, row INTEGER NOT NULL)"
+                )
+            self._initialized = True
+        return sqlite3.connect(str(self.db_path), timeout=30)
+
+    def _lookup_rows(self, conn: sqlite3.Connection, hashes: List[str]) -> Dict[str, int]:
+        rows = {}
+        for start in range(0, len(hashes), _LOOKUP_BATCH):
+            batch = hashes[start:start + _LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            for chunk_hash_value, row in conn.execute(
+                f"SELECT hash, row FROM embeddings WHERE hash IN ({placeholders})", batch
+            ):
+                rows[chunk_hash_value] = row
+        return rows
+
+    def _vector_rows(self, needed_rows: int) -> np.ndarray:
+        """Memory map covering at least needed_rows rows (remapped as the file grows)"""
+        if self._vectors is None or needed_rows > self._mapped_rows:
+            total_rows = os.path.getsize(self.vectors_path) // self.row_bytes
+            self._vectors = np.memmap(
+                self.vectors_path, dtype=self.dtype, mode='r',
+                shape=(total_rows, self.dimension)
+            )
+            self._mapped_rows = total_rows
+        return self._vectors
+
+    def get_many(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """Cached float32 vectors for the hashes that are present"""
+        if not hashes:
+            return {}
+
+        conn = self._connect()
+        try:
+            rows = self._lookup_rows(conn, list(set(hashes)))
+        finally:
+            conn.close()
+
+        if not rows:
+            return {}
+
+        with self._lock:
+            vectors = self._vector_rows(max(rows.values()) + 1)
+            return {h: np.asarray(vectors[row], dtype='float32') for h, row in rows.items()}
+
+    def put_many(self, hashes: List[str], vectors: np.ndarray):
+        """Append vectors for hashes that are not cached yet"""
+        conn = self._connect()
+        try:
+            # Take the write lock before touching the vectors file so
+            # concurrent writers (threads or processes) never interleave
+            conn.execute("BEGIN IMMEDIATE")
+            existing = self._lookup_rows(conn, list(set(hashes)))
+
+            new_rows = {}
+            for chunk_hash_value, vector in zip(hashes, vectors):
+                if chunk_hash_value not in existing and chunk_hash_value not in new_rows:
+                    new_rows[chunk_hash_value] = vector
+
+            if new_rows:
+                # Drop a partially written trailing row left by a crash
+                size = os.path.getsize(self.vectors_path) if self.vectors_path.exists() else 0
+                if size % self.row_bytes:
+                    os.truncate(self.vectors_path, size - size % self.row_bytes)
+                first_row = size // self.row_bytes
+
+                with open(self.vectors_path, 'ab') as f:
+                    f.write(np.asarray(list(new_rows.values()), dtype=self.dtype).tobytes())
+
+                conn.executemany(
+                    "INSERT INTO embeddings (hash, row) VALUES (?, ?)",
+                    [(h, first_row + i) for i, h in enumerate(new_rows)]
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def encode(self, texts: List[str], encoder: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Embeddings for texts, encoding only the ones not cached yet
+
+        Args:
+            texts: Chunk texts
+            encoder: Called with the uncached texts, returns their embeddings
+
+        Returns:
+            float32 matrix with one row per text
+        """
+        hashes = [chunk_hash(text) for text in texts]
+        cached = self.get_many(hashes)
+
+        result = np.zeros((len(texts), self.dimension), dtype='float32')
+        missing = []
+        for row, chunk_hash_value in enumerate(hashes):
+            vector = cached.get(chunk_hash_value)
+            if vector is None:
+                missing.append(row)
+            else:
+                result[row] = vector
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            # Round fresh vectors through the storage dtype so a cold run
+            # returns exactly what a warm run will read back
+            encoded = np.asarray(
+                encoder([texts[row] for row in missing]), dtype=self.dtype
+            ).astype('float32')
+            result[missing] = encoded
+            self.put_many([hashes[row] for row in missing], encoded)
+
+        return result
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "directory": str(self.directory),
+            "dtype": self.dtype.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,330 @@
+"""
+Embedding Generator
+Pluggable sentence encoder backends behind the embedding model service:
+
+    torch       SentenceTransformer on PyTorch (reference implementation)
+    onnx        The same transformer exported to ONNX, run by ONNX Runtime
+    onnx_int8   The ONNX export with dynamically quantized int8 weights
+
+The ONNX backends reproduce the SentenceTransformer pipeline (tokenizer,
+transformer, pooling, normalization) from the model bundle's own config
+files, so they return vectors interchangeable with the PyTorch backend.
+Exports live next to the bundle in <bundle>/onnx/.
+"""
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+ENCODER_BACKENDS = ("torch", "onnx", "onnx_int8")
+
+ONNX_DIR = "onnx"
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model_int8.onnx"
+
+# Lowest per-text cosine similarity to the PyTorch vectors a backend must reach
+PARITY_THRESHOLDS = {"onnx": 0.9999, "onnx_int8": 0.98}
+
+
+def count_tokens(tokenizer, texts: List[str]) -> List[int]:
+    """Wordpieces per text as the encoder sees them, without special tokens or truncation"""
+    if not texts:
+        return []
+    return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+
+def onnx_model_path(model_path: str, quantized: bool = False) -> Path:
+    """Location of a bundle's ONNX export"""
+    return Path(model_path) / ONNX_DIR / (ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE)
+
+
+class TorchEncoder:
+    """SentenceTransformer on PyTorch"""
+
+    backend = "torch"
+
+    def __init__(self, model_path: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_path)
+        self.tokenizer = self.model.tokenizer
+        self.max_seq_length = self.model.max_seq_length
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        self.parameter_bytes = sum(
+            p.numel() * p.element_size() for p in self.model.parameters()
+        )
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        embeddings = self.model.encode(
+            texts,
+            batch_size=batch_size,
+            show_progress_bar=show_progress_bar
+        )
+        return np.asarray(embeddings, dtype='float32')
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        return count_tokens(self.tokenizer, texts)
+
+
+class OnnxEncoder:
+    """Exported transformer on ONNX Runtime (CPU) with SentenceTransformer pooling"""
+
+    def __init__(self, model_path: str, quantized: bool = False, threads: int = 0):
+        """
+        Args:
+            model_path: Model bundle directory (holds the tokenizer and configs)
+            quantized: Use the int8 export
+            threads: ONNX Runtime intra-op threads (0 = one per core)
+        """
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        onnx_file = onnx_model_path(model_path, quantized)
+        if not onnx_file.exists():
+            raise FileNotFoundError(
+                f"ONNX export not found at {onnx_file}. Create it with: "
+                f"python backend/scripts/provision_embedding_model.py --onnx"
+            )
+
+        self.backend = "onnx_int8" if quantized else "onnx"
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            str(onnx_file), options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+        config = _read_pipeline_config(Path(model_path))
+        self.max_seq_length = config["max_seq_length"]
+        self.pooling = config["pooling"]
+        self.normalize = config["normalize"]
+        self.dimension = config["dimension"]
+        self.parameter_bytes = onnx_file.stat().st_size
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        embeddings = np.empty((len(texts), self.dimension), dtype='float32')
+
+        # Batch texts of similar length together to minimize padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        for start in range(0, len(texts), batch_size):
+            positions = order[start:start + batch_size]
+            tokens = self.tokenizer(
+                [texts[i] for i in positions],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            feeds = {}
+            for name in self._input_names:
+                if name in tokens:
+                    feeds[name] = tokens[name].astype(np.int64)
+                elif name == "token_type_ids":
+                    feeds[name] = np.zeros_like(tokens["input_ids"], dtype=np.int64)
+
+            hidden_states = self.session.run(None, feeds)[0]
+            embeddings[positions] = self._pool(hidden_states, tokens["attention_mask"])
+
+        if show_progress_bar:
+            logger.info(f"Encoded {len(texts)} texts with {self.backend}")
+        return embeddings
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        return count_tokens(self.tokenizer, texts)
+
+    def _pool(self, hidden_states: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        if self.pooling == "cls":
+            pooled = hidden_states[:, 0]
+        else:
+            mask = attention_mask[..., None].astype(hidden_states.dtype)
+            if self.pooling == "max":
+                pooled = np.where(mask > 0, hidden_states, -1e9).max(axis=1)
+            else:
+                pooled = (hidden_states * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+        if self.normalize:
+            pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype('float32')
+
+
+def _read_pipeline_config(model_path: Path) -> Dict:
+    """Sequence length, pooling and normalization of a saved SentenceTransformer"""
+    with open(model_path / "modules.json", 'r', encoding='utf-8') as f:
+        modules = json.load(f)
+
+    config = {"max_seq_length": 256, "pooling": "mean", "normalize": False, "dimension": None}
+
+    st_config = model_path / "sentence_bert_config.json"
+    if st_config.exists():
+        with open(st_config, 'r', encoding='utf-8') as f:
+            config["max_seq_length"] = json.load(f).get("max_seq_length", config["max_seq_length"])
+
+    for module in modules:
+        module_type = module.get("type", "")
+        if module_type.endswith("Normalize"):
+            config["normalize"] = True
+        elif module_type.endswith("Pooling"):
+            with open(model_path / module["path"] / "config.json", 'r', encoding='utf-8') as f:
+                pooling = json.load(f)
+            config["dimension"] = pooling["word_embedding_dimension"]
+            if pooling.get("pooling_mode_cls_token"):
+                config["pooling"] = "cls"
+            elif pooling.get("pooling_mode_max_tokens"):
+                config["pooling"] = "max"
+
+    if config["dimension"] is None:
+        with open(model_path / "config.json", 'r', encoding='utf-8') as f:
+            config["dimension"] = json.load(f)["hidden_size"]
+    return config
+
+
+def create_encoder(backend: str, model_path: str, threads: int = 0):
+    """
+    Construct an encoder backend
+
+    Args:
+        backend: One of ENCODER_BACKENDS
+        model_path: Model bundle directory
+        threads: ONNX Runtime intra-op threads (ONNX backends only)
+    """
+    if backend == "torch":
+        return TorchEncoder(model_path)
+    if backend in ("onnx", "onnx_int8"):
+        return OnnxEncoder(model_path, quantized=backend == "onnx_int8", threads=threads)
+    raise ValueError(f"Unknown embedding backend: {backend}. Choose from {', '.join(ENCODER_BACKENDS)}")
+
+
+# ----------------------------------------------------------------------
+# Export
+# ----------------------------------------------------------------------
+
+def export_onnx(model_path: str, opset: int = 14) -> Path:
+    """
+    Export a bundle's transformer to ONNX (token embeddings only; pooling
+    runs in OnnxEncoder)
+
+    Returns:
+        Path of the exported model
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    output = onnx_model_path(model_path)
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
+    model = AutoModel.from_pretrained(model_path, local_files_only=True).eval()
+    model.config.return_dict = False
+
+    sample = tokenizer(["emergency stop interlock"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            str(output),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True
+        )
+    logger.info(f"Exported ONNX model to {output}")
+    return output
+
+
+def quantize_onnx(model_path: str) -> Path:
+    """
+    Dynamically quantize the ONNX export's weights to int8 (activations
+    stay float and are quantized per batch at run time)
+
+    Returns:
+        Path of the quantized model
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    source = onnx_model_path(model_path)
+    output = onnx_model_path(model_path, quantized=True)
+    quantize_dynamic(str(source), str(output), weight_type=QuantType.QInt8)
+    logger.info(f"Quantized ONNX model to {output}")
+    return output
+
+
+# ----------------------------------------------------------------------
+# Parity and throughput
+# ----------------------------------------------------------------------
+
+def check_parity(reference, candidate, texts: List[str], threshold: Optional[float] = None) -> Dict:
+    """
+    Compare a backend's vectors with the reference (PyTorch) backend
+
+    Besides per-text cosine similarity, checks that each text's nearest
+    neighbour among the others is the same under both backends, which is
+    what retrieval actually depends on.
+
+    Args:
+        reference: Encoder whose output is taken as correct
+        candidate: Encoder under test
+        texts: Sample texts (ideally real manual chunks)
+        threshold: Minimum cosine for "passed" (default from PARITY_THRESHOLDS)
+
+    Returns:
+        Dict with min/mean cosine, max absolute difference, neighbour agreement and passed
+    """
+    expected = reference.encode(texts)
+    actual = candidate.encode(texts)
+
+    cosines = np.sum(expected * actual, axis=1) / np.maximum(
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1), 1e-12
+    )
+
+    neighbour_agreement = 1.0
+    if len(texts) > 1:
+        def nearest(vectors):
+            similarity = vectors @ vectors.T
+            np.fill_diagonal(similarity, -np.inf)
+            return similarity.argmax(axis=1)
+        neighbour_agreement = float(np.mean(nearest(expected) == nearest(actual)))
+
+    threshold = threshold if threshold is not None else PARITY_THRESHOLDS.get(candidate.backend, 0.999)
+    min_cosine = float(cosines.min())
+    return {
+        "backend": candidate.backend,
+        "texts": len(texts),
+        "min_cosine": round(min_cosine, 6),
+        "mean_cosine": round(float(cosines.mean()), 6),
+        "max_abs_diff": round(float(np.abs(expected - actual).max()), 6),
+        "neighbour_agreement": round(neighbour_agreement, 4),
+        "threshold": threshold,
+        "passed": min_cosine >= threshold
+    }
+
+
+def measure_throughput(encoder, texts: List[str], batch_size: int = 32, repeats: int = 3) -> Dict:
+    """Texts encoded per second (best of several runs, after one warm-up batch)"""
+    encoder.encode(texts[:batch_size], batch_size=batch_size)
+
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        encoder.encode(texts, batch_size=batch_size)
+        best = min(best, time.perf_counter() - start)
+
+    return {
+        "backend": encoder.backend,
+        "texts": len(texts),
+        "batch_size": batch_size,
+        "seconds": round(best, 3),
+        "texts_per_second": round(len(texts) / best, 1) if best else 0.0,
+        "model_mb": round(encoder.parameter_bytes / (1024 * 1024), 1)
+    }
@@ -0,0 +1,351 @@
+"""
+FAISS index construction, runtime search parameters and index evaluation
+shared by the manual build script and the vector store loader
+"""
+import math
+import time
+from typing import Dict, List, Optional, Sequence
+import faiss
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# Storage encodings for small per-project indices (searched exhaustively)
+STORAGE_TYPES = ("flat", "sq_fp16", "sq_int8", "pq")
+
+
+def default_nlist(num_vectors: int) -> int:
+    """
+    Number of IVF cells: ~4*sqrt(n), capped so every centroid gets
+    the ~39 training points FAISS asks for
+    """
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+
+
+def build_index(
+    embeddings: np.ndarray,
+    index_type: str = "flat",
+    nlist: Optional[int] = None,
+    pq_m: int = 16,
+    pq_nbits: int = 8,
+    hnsw_m: int = 32,
+    ef_construction: int = 200
+) -> faiss.Index:
+    """
+    Build and fill a FAISS index of the requested type
+
+    Args:
+        embeddings: float32 matrix, one row per chunk
+        index_type: flat, ivf_flat, ivf_pq or hnsw
+        nlist: IVF cell count (defaults to default_nlist)
+        pq_m: PQ sub-quantizers (must divide the dimension)
+        pq_nbits: Bits per PQ code
+        hnsw_m: HNSW graph degree
+        ef_construction: HNSW build-time beam width
+
+    Returns:
+        Trained index containing every embedding, ids = row numbers
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type} (expected one of {', '.join(INDEX_TYPES)})")
+
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    num_vectors, dimension = embeddings.shape
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dimension)
+
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+
+    else:
+        nlist = nlist or default_nlist(num_vectors)
+        quantizer = faiss.IndexFlatL2(dimension)
+
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        else:
+            if dimension % pq_m != 0:
+                raise ValueError(f"pq_m={pq_m} must divide the embedding dimension {dimension}")
+            # PQ codebooks need at least 2^nbits training points
+            pq_nbits = min(pq_nbits, max(1, int(math.log2(max(num_vectors, 2)))))
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, pq_nbits)
+
+        index.train(embeddings)
+
+    index.add(embeddings)
+    return index
+
+
+def index_type_of(index: faiss.Index) -> str:
+    """Name of the index family (one of INDEX_TYPES, or the FAISS class name)"""
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    if isinstance(index, faiss.IndexFlat):
+        return "flat"
+    return type(index).__name__
+
+
+def make_search_parameters(
+    index: faiss.Index,
+    selector: Optional[faiss.IDSelector] = None,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None
+) -> Optional[faiss.SearchParameters]:
+    """
+    Per-query search parameters for the given index
+
+    FAISS parameter objects override the index defaults, so IVF and HNSW
+    parameters always carry an explicit nprobe / efSearch.
+    """
+    index_type = index_type_of(index)
+
+    if index_type in ("ivf_flat", "ivf_pq"):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = nprobe or faiss.extract_index_ivf(index).nprobe
+    elif index_type == "hnsw":
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = ef_search or index.hnsw.efSearch
+    elif selector is not None:
+        params = faiss.SearchParameters()
+    else:
+        return None
+
+    if selector is not None:
+        params.sel = selector
+    return params
+
+
+def build_compact_index(
+    embeddings: np.ndarray,
+    storage: str = "flat",
+    pca_dim: Optional[int] = None,
+    pq_m: int = 16,
+    pq_nbits: int = 8
+) -> faiss.Index:
+    """
+    Build an exhaustive-search index with compressed vector storage
+
+    Args:
+        embeddings: float32 matrix, one row per chunk
+        storage: flat (float32), sq_fp16, sq_int8 or pq
+        pca_dim: Reduce vectors to this many dimensions with PCA first
+            (skipped when there are fewer vectors than dimensions to learn)
+        pq_m: PQ sub-quantizers (must divide the stored dimension)
+        pq_nbits: Bits per PQ code
+
+    Returns:
+        Trained index containing every embedding, ids = row numbers
+    """
+    if storage not in STORAGE_TYPES:
+        raise ValueError(f"Unknown storage type: {storage} (expected one of {', '.join(STORAGE_TYPES)})")
+
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    num_vectors, dimension = embeddings.shape
+
+    description = []
+    stored_dim = dimension
+    if pca_dim and pca_dim < dimension:
+        if num_vectors >= pca_dim:
+            description.append(f"PCA{pca_dim}")
+            stored_dim = pca_dim
+        else:
+            logger.info(f"Skipping PCA{pca_dim}: only {num_vectors} vectors to train on")
+
+    if storage == "flat":
+        description.append("Flat")
+    elif storage == "sq_fp16":
+        description.append("SQfp16")
+    elif storage == "sq_int8":
+        description.append("SQ8")
+    else:
+        if stored_dim % pq_m != 0:
+            raise ValueError(f"pq_m={pq_m} must divide the stored dimension {stored_dim}")
+        # PQ codebooks need at least 2^nbits training points
+        pq_nbits = min(pq_nbits, max(1, int(math.log2(max(num_vectors, 2)))))
+        description.append(f"PQ{pq_m}x{pq_nbits}")
+
+    index = faiss.index_factory(dimension, ",".join(description))
+    if not index.is_trained:
+        index.train(embeddings)
+    index.add(embeddings)
+    return index
+
+
+def index_memory_bytes(index: faiss.Index) -> int:
+    """Serialized size of an index (what is held in memory once loaded)"""
+    return int(faiss.serialize_index(index).size)
+
+
+def recall_at_k(reference_ids: np.ndarray, candidate_ids: np.ndarray, k: int) -> float:
+    """Fraction of the exact top-k neighbours found by the candidate search"""
+    found = 0
+    for reference_row, candidate_row in zip(reference_ids[:, :k], candidate_ids[:, :k]):
+        found += len(set(reference_row.tolist()) & set(candidate_row.tolist()))
+    return found / float(reference_ids.shape[0] * k)
+
+
+def evaluate_index_types(
+    embeddings: np.ndarray,
+    query_embeddings: np.ndarray,
+    k: int = 5,
+    index_types: Sequence[str] = INDEX_TYPES,
+    nprobe: int = 8,
+    ef_search: int = 64,
+    **build_options
+) -> List[Dict]:
+    """
+    Build every index type over the same vectors and compare it with the
+    flat baseline
+
+    Returns:
+        One row per index type with recall@k, latency and build time
+    """
+    query_embeddings = np.ascontiguousarray(query_embeddings, dtype='float32')
+
+    baseline = build_index(embeddings, "flat")
+    _, reference_ids = baseline.search(query_embeddings, k)
+
+    rows = []
+    for index_type in index_types:
+        build_start = time.perf_counter()
+        index = build_index(embeddings, index_type, **build_options)
+        build_seconds = time.perf_counter() - build_start
+
+        params = make_search_parameters(index, nprobe=nprobe, ef_search=ef_search)
+
+        latencies = []
+        candidate_ids = np.empty_like(reference_ids)
+        for row, query in enumerate(query_embeddings):
+            start = time.perf_counter()
+            _, ids = index.search(query.reshape(1, -1), k, params=params)
+            latencies.append(time.perf_counter() - start)
+            candidate_ids[row] = ids[0]
+
+        latencies_ms = np.array(latencies) * 1000
+        rows.append({
+            "index_type": index_type,
+            "recall_at_k": round(recall_at_k(reference_ids, candidate_ids, k), 4),
+            "mean_latency_ms": round(float(latencies_ms.mean()), 4),
+            "p95_latency_ms": round(float(np.percentile(latencies_ms, 95)), 4),
+            "build_seconds": round(build_seconds, 3)
+        })
+
+    return rows
+
+
+class StreamingIndexBuilder:
+    """
+    Builds an index from vectors that arrive in batches
+
+    Flat and HNSW indices are filled as batches arrive. IVF indices need
+    training first, so vectors are buffered until train_size of them are
+    available (or the stream ends), then the index is trained and the
+    buffer flushed.
+    """
+
+    def __init__(
+        self,
+        dimension: int,
+        index_type: str = "flat",
+        nlist: Optional[int] = None,
+        train_size: Optional[int] = None,
+        **build_options
+    ):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {index_type} (expected one of {', '.join(INDEX_TYPES)})")
+
+        self.dimension = dimension
+        self.index_type = index_type
+        self.nlist = nlist
+        self.build_options = build_options
+        self.train_size = train_size or (39 * nlist if nlist else 50000)
+        self.index = None
+        self._buffer: List[np.ndarray] = []
+        self._buffered = 0
+
+        if index_type in ("flat", "hnsw"):
+            empty = np.empty((0, dimension), dtype='float32')
+            self.index = build_index(empty, index_type, **build_options)
+
+    @property
+    def ntotal(self) -> int:
+        return (self.index.ntotal if self.index is not None else 0) + self._buffered
+
+    def add(self, vectors: np.ndarray):
+        """Add a batch of vectors (row order = chunk order)"""
+        vectors = np.ascontiguousarray(vectors, dtype='float32')
+
+        if self.index is not None:
+            self.index.add(vectors)
+            return
+
+        self._buffer.append(vectors)
+        self._buffered += len(vectors)
+        if self._buffered >= self.train_size:
+            self._train_and_flush()
+
+    def _train_and_flush(self):
+        sample = np.vstack(self._buffer)
+        self.index = build_index(sample, self.index_type, nlist=self.nlist, **self.build_options)
+        self._buffer = []
+        self._buffered = 0
+
+    def finish(self) -> faiss.Index:
+        """Return the filled index (training on whatever was buffered if needed)"""
+        if self.index is None:
+            if not self._buffer:
+                raise ValueError("No vectors were added to the index")
+            self._train_and_flush()
+        return self.index
+
+
+def evaluate_storage_types(
+    embeddings: np.ndarray,
+    query_embeddings: np.ndarray,
+    k: int = 5,
+    storage_types: Sequence[str] = STORAGE_TYPES,
+    pca_dims: Sequence[Optional[int]] = (None,),
+    **build_options
+) -> List[Dict]:
+    """
+    Build every storage / PCA combination over the same vectors and
+    compare memory and recall with the float32 flat baseline
+
+    Returns:
+        One row per combination with bytes, memory saved and recall@k
+    """
+    query_embeddings = np.ascontiguousarray(query_embeddings, dtype='float32')
+
+    baseline = build_compact_index(embeddings, "flat")
+    baseline_bytes = index_memory_bytes(baseline)
+    _, reference_ids = baseline.search(query_embeddings, k)
+
+    rows = []
+    for pca_dim in pca_dims:
+        for storage in storage_types:
+            try:
+                index = build_compact_index(embeddings, storage, pca_dim=pca_dim, **build_options)
+            except ValueError as e:
+                logger.warning(f"Skipping {storage} (pca={pca_dim}): {e}")
+                continue
+
+            _, candidate_ids = index.search(query_embeddings, k)
+            memory_bytes = index_memory_bytes(index)
+            rows.append({
+                "storage": storage,
+                "pca_dim": pca_dim,
+                "memory_bytes": memory_bytes,
+                "memory_saved_pct": round(100.0 * (1 - memory_bytes / baseline_bytes), 2),
+                "recall_at_k": round(recall_at_k(reference_ids, candidate_ids, k), 4)
+            })
+
+    return rows
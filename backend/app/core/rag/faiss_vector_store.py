@@ -1,79 +1,424 @@
 import faiss
-import pickle
 import json
+import threading
+import time
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from app.config import settings
+from app.core.rag.chunk_store import open_chunk_store
+from app.core.rag.faiss_index_builder import index_type_of, make_search_parameters
+from app.core.rag.index_versions import current_version, read_manifest, version_paths
+from app.core.rag.query_cache import QueryResultCache
+from app.services.embedding_model_service import embedding_model_service
+
+
+class IndexSnapshot:
+    """One loaded index version; searches hold on to it until they finish"""
+
+    def __init__(self, version: str, manifest: Dict, index: faiss.Index, chunk_store, type_partitions: Dict):
+        self.version = version
+        self.manifest = manifest
+        self.index = index
+        self.chunk_store = chunk_store
+        self.type_partitions = type_partitions
+        self.loaded_at = time.time()
 
 
 class FAISSVectorStore:
-    def __init__(self):
-        self.model = None
-        self.index = None
-        self.chunks = None
-        self.metadata = None
-        self.is_loaded = False
-        
-    def load(self):
-        """Load FAISS index and metadata"""
-        if self.is_loaded:
-            return
-        
-        print("Loading RAG system...")
-        
-        # Load embedding model
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        
-        # Setup paths
-        embeddings_path = Path(settings.EMBEDDINGS_PATH)
-        faiss_dir = embeddings_path / "faiss_index"
-        metadata_dir = embeddings_path / "metadata"
-        
-        # Load FAISS index
-        index_path = faiss_dir / "manual_index.faiss"
+    def __init__(self, embeddings_dir: Optional[str] = None):
+        self.embeddings_dir = Path(embeddings_dir or settings.EMBEDDINGS_PATH)
+        self.model = embedding_model_service
+        self.nprobe = settings.RAG_IVF_NPROBE
+        self.ef_search = settings.RAG_HNSW_EF_SEARCH
+        self._active: Optional[IndexSnapshot] = None
+        self._load_lock = threading.Lock()
+        self._loading_version: Optional[str] = None
+        self._last_check = 0.0
+        self._last_load_error: Optional[str] = None
+        self.cache = QueryResultCache(
+            max_entries=settings.RAG_QUERY_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.RAG_QUERY_CACHE_TTL_SECONDS
+        )
+
+    # Views of the active snapshot
+    @property
+    def is_loaded(self) -> bool:
+        return self._active is not None
+
+    @property
+    def index(self) -> Optional[faiss.Index]:
+        return self._active.index if self._active else None
+
+    @property
+    def chunk_store(self):
+        return self._active.chunk_store if self._active else None
+
+    @property
+    def type_partitions(self) -> Dict[str, Dict]:
+        return self._active.type_partitions if self._active else {}
+
+    @property
+    def index_version(self) -> Optional[str]:
+        return self._active.version if self._active else None
+
+    def _read_version(self, version: str) -> IndexSnapshot:
+        """Load one index version from disk (does not touch the active one)"""
+        index_path, metadata_dir = version_paths(version, str(self.embeddings_dir))
         if not index_path.exists():
             raise FileNotFoundError(f"FAISS index not found at {index_path}")
-        self.index = faiss.read_index(str(index_path))
-        
-        # Load chunks
-        chunks_path = metadata_dir / "chunks.pkl"
-        with open(chunks_path, 'rb') as f:
-            self.chunks = pickle.load(f)
-        
-        # Load metadata
-        metadata_path = metadata_dir / "metadata.json"
-        with open(metadata_path, 'r', encoding='utf-8') as f:
-            self.metadata = json.load(f)
-        
-        self.is_loaded = True
-        print(f"RAG system loaded: {len(self.chunks)} chunks available")
-    
-    def search(self, query: str, top_k: int = 5) -> List[Dict]:
-        """Search for relevant chunks"""
+        io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if settings.RAG_INDEX_MMAP else 0
+
+        index = faiss.read_index(str(index_path), io_flags)
+
+        # Chunk text + metadata (memory-mapped, decoded per hit)
+        chunk_store = open_chunk_store(str(metadata_dir))
+
+        # Published versions are immutable, so a mismatch means a broken build
+        if index.ntotal != len(chunk_store):
+            raise RuntimeError(
+                f"Manual index ({index.ntotal} vectors) and chunk store "
+                f"({len(chunk_store)} chunks) of version {version} are out of sync"
+            )
+
+        return IndexSnapshot(
+            version=version,
+            manifest=read_manifest(version, str(self.embeddings_dir)),
+            index=index,
+            chunk_store=chunk_store,
+            # Per-type ID selectors for filtered search
+            type_partitions=self._load_type_partitions(metadata_dir, chunk_store)
+        )
+
+    def _activate(self, snapshot: IndexSnapshot):
+        """
+        Swap in a loaded version. The swap is a single reference
+        assignment: searches that already picked up the old snapshot
+        finish on it, and its files stay mapped until they are done.
+        """
+        self._active = snapshot
+        # Results cached for a previous version are keyed by that version
+        # and can never be hit again
+        self.cache.clear()
+        print(f"RAG index version {snapshot.version} active: {len(snapshot.chunk_store)} chunks "
+              f"({index_type_of(snapshot.index)} index)")
+
+    def load(self):
+        """Load the active index version (blocking, first load only)"""
+        with self._load_lock:
+            if self.is_loaded:
+                return
+
+            print("Loading RAG system...")
+
+            version = current_version(str(self.embeddings_dir))
+            if version is None:
+                raise FileNotFoundError(f"No manual index found in {self.embeddings_dir}")
+
+            self._activate(self._read_version(version))
+            self._last_check = time.monotonic()
+
+    def _load_in_background(self, version: str):
+        try:
+            snapshot = self._read_version(version)
+        except Exception as e:
+            # Keep serving the current version; retried on the next check
+            self._last_load_error = f"{version}: {e}"
+            print(f"Failed to load RAG index version {version}: {e}")
+        else:
+            self._last_load_error = None
+            with self._load_lock:
+                self._activate(snapshot)
+        finally:
+            self._loading_version = None
+
+    def check_for_update(self) -> bool:
+        """
+        Start loading a newly published version in the background
+
+        Returns:
+            True if a load was started
+        """
+        self._last_check = time.monotonic()
+        version = current_version(str(self.embeddings_dir))
+        if version is None or version == self.index_version:
+            return False
+
+        with self._load_lock:
+            if self._loading_version is not None:
+                return False
+            self._loading_version = version
+
+        threading.Thread(
+            target=self._load_in_background,
+            args=(version,),
+            name="rag-index-loader",
+            daemon=True
+        ).start()
+        return True
+
+    def _ensure_current(self) -> IndexSnapshot:
+        """
+        Active snapshot, loading it on first use. New versions are looked
+        for at most every RAG_INDEX_POLL_SECONDS and loaded without
+        blocking the query.
+        """
         if not self.is_loaded:
             self.load()
-        
-        # Create query embedding
-        query_embedding = self.model.encode([query])
-        
-        # Search in FAISS
-        distances, indices = self.index.search(query_embedding.astype('float32'), top_k)
-        
-        # Prepare results
-        results = []
-        for i, (distance, idx) in enumerate(zip(distances[0], indices[0])):
-            if idx < len(self.chunks):
-                results.append({
-                    "rank": i + 1,
-                    "content": self.chunks[idx],
-                    "metadata": self.metadata[idx],
-                    "score": float(distance)
-                })
-        
-        return results
+        elif time.monotonic() - self._last_check >= settings.RAG_INDEX_POLL_SECONDS:
+            self.check_for_update()
+        return self._active
+
+    def get_version_info(self) -> Dict:
+        """Active version, its manifest summary and any pending load"""
+        snapshot = self._active
+        return {
+            "loaded": snapshot is not None,
+            "active_version": snapshot.version if snapshot else None,
+            "published_version": current_version(str(self.embeddings_dir)),
+            "loading_version": self._loading_version,
+            "last_load_error": self._last_load_error,
+            "total_chunks": len(snapshot.chunk_store) if snapshot else 0,
+            "index_type": index_type_of(snapshot.index) if snapshot else None,
+            "created_at": snapshot.manifest.get("created_at") if snapshot else None,
+            "loaded_at": snapshot.loaded_at if snapshot else None
+        }
+
+    def _load_type_partitions(self, metadata_dir: Path, chunk_store) -> Dict[str, Dict]:
+        """
+        Build one ID selector per manual type from the integer type array
+        stored next to the index (falls back to the metadata list for
+        indices built before chunk_types.npy existed)
+        """
+        types_path = metadata_dir / "chunk_types.npy"
+        names_path = metadata_dir / "chunk_type_names.json"
+
+        if types_path.exists() and names_path.exists():
+            type_codes = np.load(types_path)
+            with open(names_path, 'r', encoding='utf-8') as f:
+                type_names = json.load(f)
+        else:
+            types = [m.get('type', '') for m in chunk_store.iter_metadata()]
+            type_names = sorted(set(types))
+            code_of = {name: code for code, name in enumerate(type_names)}
+            type_codes = np.array([code_of[t] for t in types], dtype='int16')
+
+        partitions = {}
+        for code, name in enumerate(type_names):
+            ids = np.flatnonzero(type_codes == code).astype('int64')
+            if len(ids) == 0:
+                continue
+
+            # Contiguous partitions (the build script writes one type at a
+            # time) use a range selector, which lets flat indices scan only
+            # that slice of the vectors.
+            if ids[-1] - ids[0] + 1 == len(ids):
+                selector = faiss.IDSelectorRange(int(ids[0]), int(ids[-1]) + 1)
+            else:
+                selector = faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+
+            partitions[name] = {
+                "selector": selector,
+                "size": len(ids)
+            }
+
+        return partitions
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        filter_type: Optional[str] = None
+    ) -> List[Dict]:
+        """Search for relevant chunks"""
+        return self.search_many([query], top_k=top_k, filter_type=filter_type)[0]
+
+    def search_many(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        filter_type: Optional[str] = None
+    ) -> List[List[Dict]]:
+        """
+        Search for several queries with one batched encode and one FAISS call
+
+        Queries already answered for the current index version are served
+        from the result cache and skip both the encoder and the search.
+
+        Args:
+            queries: Search queries
+            top_k: Number of results per query
+            filter_type: Only search chunks of this manual type
+
+        Returns:
+            One result list per query, in the same order as queries
+        """
+        # Everything below uses this snapshot, even if a new version is
+        # swapped in while the query runs
+        snapshot = self._ensure_current()
+
+        if not queries:
+            return []
+        if filter_type and filter_type not in snapshot.type_partitions:
+            return [[] for _ in queries]
+
+        all_results: List[Optional[List[Dict]]] = [None] * len(queries)
+        keys = [
+            (self.cache.normalize_query(query), top_k, filter_type, snapshot.version)
+            for query in queries
+        ]
+
+        missing = []
+        for position, key in enumerate(keys):
+            cached = self.cache.get(key)
+            if cached is None:
+                missing.append(position)
+            else:
+                all_results[position] = [dict(result) for result in cached]
+
+        if missing:
+            # Create all missing query embeddings in a single batch
+            query_embeddings = self.model.encode([queries[p] for p in missing])
+            found = self._search_snapshot(snapshot, query_embeddings, top_k, filter_type)
+
+            for position, results in zip(missing, found):
+                self.cache.put(keys[position], results)
+                all_results[position] = [dict(result) for result in results]
+
+        return all_results
+
+    def search_vectors(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int = 5,
+        filter_type: Optional[str] = None
+    ) -> List[List[Dict]]:
+        """
+        Search with query embeddings that were already computed (e.g. shared
+        with other indices). Results are not cached.
+
+        Args:
+            query_embeddings: (n, dimension) float32 query matrix
+            top_k: Number of results per query
+            filter_type: Only search chunks of this manual type
+
+        Returns:
+            One result list per query row
+        """
+        snapshot = self._ensure_current()
+        if len(query_embeddings) == 0:
+            return []
+        return self._search_snapshot(snapshot, query_embeddings, top_k, filter_type)
+
+    def _search_snapshot(
+        self,
+        snapshot: IndexSnapshot,
+        query_embeddings: np.ndarray,
+        top_k: int,
+        filter_type: Optional[str]
+    ) -> List[List[Dict]]:
+        """One FAISS call for the whole query matrix against a snapshot"""
+        selector = None
+        partition = None
+        if filter_type:
+            partition = snapshot.type_partitions.get(filter_type)
+            if partition is None:
+                return [[] for _ in query_embeddings]
+            selector = partition["selector"]
+        search_params = make_search_parameters(
+            snapshot.index,
+            selector=selector,
+            nprobe=self.nprobe,
+            ef_search=self.ef_search
+        )
+
+        distances, indices = snapshot.index.search(
+            query_embeddings, top_k, params=search_params
+        )
+        if partition is not None:
+            self._fill_short_rows(
+                snapshot.index, query_embeddings, min(top_k, partition["size"]),
+                selector, search_params, distances, indices
+            )
+
+        all_results = []
+        for row_distances, row_indices in zip(distances, indices):
+            results = []
+            for i, (distance, idx) in enumerate(zip(row_distances, row_indices)):
+                if 0 <= idx < len(snapshot.chunk_store):
+                    results.append({
+                        "rank": i + 1,
+                        "id": int(idx),
+                        "content": snapshot.chunk_store.chunk(int(idx)),
+                        "metadata": snapshot.chunk_store.metadata(int(idx)),
+                        "score": float(distance)
+                    })
+            all_results.append(results)
+        return all_results
+
+    @staticmethod
+    def _fill_short_rows(
+        index: faiss.Index,
+        query_embeddings: np.ndarray,
+        wanted: int,
+        selector: faiss.IDSelector,
+        search_params: Optional[faiss.SearchParameters],
+        distances: np.ndarray,
+        indices: np.ndarray
+    ):
+        """
+        A filtered IVF / HNSW search only visits nprobe cells / efSearch
+        candidates, so for a small partition it can return fewer in-type
+        hits than asked for. Re-run the short rows with a wider search
+        (updating distances and indices in place) until they are full or
+        the search covers the whole index: every IVF cell, or an HNSW
+        beam as wide as the index.
+        """
+        index_type = index_type_of(index)
+        if index_type not in ("ivf_flat", "ivf_pq", "hnsw"):
+            return
+
+        top_k = indices.shape[1]
+        if index_type == "hnsw":
+            width, widest = search_params.efSearch, max(index.ntotal, top_k)
+        else:
+            width, widest = search_params.nprobe, faiss.extract_index_ivf(index).nlist
+
+        while width < widest:
+            short = np.flatnonzero((indices >= 0).sum(axis=1) < wanted)
+            if len(short) == 0:
+                return
+            width = min(width * 4, widest)
+            params = make_search_parameters(index, selector=selector, nprobe=width, ef_search=width)
+            distances[short], indices[short] = index.search(query_embeddings[short], top_k, params=params)
+
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """
+        Tune approximate search at runtime
+
+        Args:
+            nprobe: IVF cells visited per query (IVF-Flat / IVF-PQ indices)
+            ef_search: HNSW search beam width (HNSW indices)
+        """
+        if nprobe is not None:
+            self.nprobe = nprobe
+        if ef_search is not None:
+            self.ef_search = ef_search
+
+        # Cached results were produced with the old recall/latency trade-off
+        self.cache.clear()
+
+    def get_type_counts(self) -> Dict[str, int]:
+        """Number of chunks in each manual type partition"""
+        snapshot = self._ensure_current()
+        return {name: p["size"] for name, p in snapshot.type_partitions.items()}
+
+    def get_cache_stats(self) -> Dict:
+        """Query cache counters plus the index version they apply to"""
+        stats = self.cache.get_stats()
+        stats["index_version"] = self.index_version
+        return stats
 
 
 # Global instance
-vector_store = FAISSVectorStore()
\ No newline at end of file
+vector_store = FAISSVectorStore()
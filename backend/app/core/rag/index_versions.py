@@ -0,0 +1,195 @@
+"""
+Versioned manual index directories
+
+Every build or update of the manual index is written to its own version
+directory and only becomes active once its manifest is written and the
+CURRENT pointer is switched to it, so readers never see a half-written
+index.
+
+Layout (inside the embeddings directory):
+    manual_index/CURRENT                           active version id
+    manual_index/versions/<id>/manifest.json       build description
+    manual_index/versions/<id>/faiss_index/manual_index.faiss
+    manual_index/versions/<id>/metadata/           chunk store + type array
+
+Indices built before versioning (faiss_index/ and metadata/ directly in
+the embeddings directory) are still served while no CURRENT pointer exists.
+"""
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+from app.config import settings
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+VERSIONS_ROOT = "manual_index"
+CURRENT_POINTER = "CURRENT"
+MANIFEST = "manifest.json"
+INDEX_FILE = "manual_index.faiss"
+UPDATE_LOCK = "update.lock"
+
+
+def _root(embeddings_dir: Optional[str] = None) -> Path:
+    return Path(embeddings_dir or settings.EMBEDDINGS_PATH) / VERSIONS_ROOT
+
+
+def _write_atomic(path: Path, text: str):
+    tmp = path.with_name(f"{path.name}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def current_version(embeddings_dir: Optional[str] = None) -> Optional[str]:
+    """
+    Id of the active index version
+
+    Unversioned indices report "legacy-<mtime>-<size>" so a rebuild in
+    the old layout is still detected; None if there is no index at all.
+    """
+    pointer = _root(embeddings_dir) / CURRENT_POINTER
+    try:
+        return pointer.read_text(encoding='utf-8').strip() or None
+    except OSError:
+        pass
+
+    legacy_index = Path(embeddings_dir or settings.EMBEDDINGS_PATH) / "faiss_index" / INDEX_FILE
+    try:
+        stat = legacy_index.stat()
+    except OSError:
+        return None
+    return f"legacy-{stat.st_mtime_ns}-{stat.st_size}"
+
+
+@contextmanager
+def update_lock(embeddings_dir: Optional[str] = None) -> Iterator[None]:
+    """
+    Exclusive lock for editing the active version, held from reading
+    CURRENT until the edited copy is published. Without it two updaters
+    branch from the same version and the later publish drops the other's
+    changes. Blocks until the lock is free (across processes).
+    """
+    root = _root(embeddings_dir)
+    root.mkdir(parents=True, exist_ok=True)
+    with open(root / UPDATE_LOCK, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after about 10 seconds; keep waiting
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def version_paths(version: str, embeddings_dir: Optional[str] = None) -> Tuple[Path, Path]:
+    """(index file, metadata directory) of a version"""
+    if version.startswith("legacy-"):
+        base = Path(embeddings_dir or settings.EMBEDDINGS_PATH)
+    else:
+        base = _root(embeddings_dir) / "versions" / version
+    return base / "faiss_index" / INDEX_FILE, base / "metadata"
+
+
+def read_manifest(version: str, embeddings_dir: Optional[str] = None) -> Dict:
+    """Manifest of a version ({"version": ...} only for legacy indices)"""
+    if version.startswith("legacy-"):
+        return {"version": version, "layout": "legacy"}
+    with open(_root(embeddings_dir) / "versions" / version / MANIFEST, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class IndexVersionWriter:
+    """
+    Directory for a new index version
+
+    Write the index to index_path and the chunk store / type array to
+    metadata_dir, then call publish(). Until then the version is invisible
+    to readers.
+    """
+
+    def __init__(self, embeddings_dir: Optional[str] = None):
+        self.embeddings_dir = embeddings_dir
+        self.version = time.strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:6]
+        self.directory = _root(embeddings_dir) / "versions" / self.version
+        self.index_path = self.directory / "faiss_index" / INDEX_FILE
+        self.metadata_dir = self.directory / "metadata"
+
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        self.metadata_dir.mkdir(parents=True, exist_ok=True)
+
+    def publish(self, **manifest) -> str:
+        """
+        Write the manifest and make this the active version
+
+        Args:
+            **manifest: Build details to record (index type, chunk count, sources, ...)
+
+        Returns:
+            The new version id
+        """
+        manifest.update({
+            "version": self.version,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "embedding_model": settings.EMBEDDING_MODEL_NAME,
+            "files": {
+                str(path.relative_to(self.directory)): path.stat().st_size
+                for path in sorted(self.directory.rglob("*")) if path.is_file()
+            }
+        })
+        _write_atomic(self.directory / MANIFEST, json.dumps(manifest, indent=2))
+        _write_atomic(_root(self.embeddings_dir) / CURRENT_POINTER, self.version)
+
+        logger.info(f"Published manual index version {self.version}")
+        prune_versions(settings.RAG_INDEX_KEEP_VERSIONS, self.embeddings_dir)
+        return self.version
+
+    def discard(self):
+        """Remove an unpublished version (e.g. after a failed build)"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def prune_versions(keep: int, embeddings_dir: Optional[str] = None):
+    """
+    Delete all but the newest `keep` published versions (never the active
+    one). Workers still serving a deleted version keep their open file
+    mappings until they swap to the new one.
+    """
+    versions_dir = _root(embeddings_dir) / "versions"
+    if not versions_dir.exists():
+        return
+
+    active = current_version(embeddings_dir)
+    published = sorted(
+        (path for path in versions_dir.iterdir() if (path / MANIFEST).exists()),
+        key=lambda path: path.name,
+        reverse=True
+    )
+    for path in published[max(keep, 1):]:
+        if path.name != active:
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,341 @@
+"""
+Knowledge Base Updater
+Incrementally add, remove and replace individual manuals in the manual
+RAG index without re-extracting or re-embedding the rest of the corpus
+
+Each update still reads the whole chunk store and writes a complete new
+index version, so its cost grows with the corpus (O(corpus) I/O, but
+no re-embedding). Updates are serialized with a file lock.
+"""
+import json
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import faiss
+import numpy as np
+from app.config import settings
+from app.core.rag.chunk_store import open_chunk_store, write_chunk_store
+from app.core.rag.document_chunking_service import DocumentChunker
+from app.core.rag.embedding_cache import chunk_hash
+from app.core.rag.faiss_index_builder import index_type_of
+from app.core.rag.index_versions import IndexVersionWriter, current_version, update_lock, version_paths
+from app.services.embedding_model_service import embedding_model_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Words per chunk used by process_manuals.py for each manual type
+CHUNK_SIZES = {"Datatype_Rules": 300}
+DEFAULT_CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
+
+class KnowledgeBaseUpdater:
+    """Apply single-manual changes to the manual index"""
+
+    def __init__(self, embeddings_dir: Optional[str] = None):
+        self.embeddings_dir = str(embeddings_dir or settings.EMBEDDINGS_PATH)
+        self.model = embedding_model_service
+
+    # ------------------------------------------------------------------
+    # Chunking (same chunker and chunk sizes as process_manuals.py)
+    # ------------------------------------------------------------------
+
+    def build_records(self, file_path: Path, manual_type: str) -> List[Tuple[str, Dict]]:
+        """Chunk a manual into (text, metadata) records"""
+        if file_path.suffix.lower() not in ('.pdf', '.txt'):
+            raise ValueError(f"Unsupported manual type: {file_path.suffix}")
+
+        chunker = DocumentChunker(CHUNK_SIZES.get(manual_type, DEFAULT_CHUNK_SIZE), CHUNK_OVERLAP)
+        chunks = list(chunker.chunk_file(file_path))
+
+        return [
+            (chunk, {
+                "source": file_path.name,
+                "type": manual_type,
+                "chunk_id": i,
+                **location,
+                "total_chunks": len(chunks),
+                "hash": chunk_hash(chunk)
+            })
+            for i, (chunk, location) in enumerate(chunks)
+        ]
+
+    # ------------------------------------------------------------------
+    # Public operations
+    # ------------------------------------------------------------------
+
+    def add_manual(self, file_path: str, manual_type: str) -> Dict:
+        """Add a manual that is not in the index yet"""
+        file_path = Path(file_path)
+        with update_lock(self.embeddings_dir):
+            index, chunks, metadata = self._load()
+
+            if any(m["source"] == file_path.name for m in metadata):
+                raise ValueError(f"{file_path.name} is already indexed, use replace_manual")
+
+            records = self.build_records(file_path, manual_type)
+            return self._apply(index, chunks, metadata, remove=[], add=records)
+
+    def remove_manual(self, source: str) -> Dict:
+        """Remove every chunk of a manual (by file name)"""
+        with update_lock(self.embeddings_dir):
+            index, chunks, metadata = self._load()
+
+            remove = [i for i, m in enumerate(metadata) if m["source"] == source]
+            if not remove:
+                raise ValueError(f"{source} is not in the index")
+
+            return self._apply(index, chunks, metadata, remove=remove, add=[])
+
+    def replace_manual(self, file_path: str, manual_type: str) -> Dict:
+        """
+        Replace a manual with a new revision of the same file name
+
+        Chunks whose content is unchanged stay in the index untouched;
+        only removed chunks are dropped and only new chunks are embedded.
+        """
+        file_path = Path(file_path)
+        with update_lock(self.embeddings_dir):
+            index, chunks, metadata = self._load()
+            records = self.build_records(file_path, manual_type)
+            return self._apply(index, chunks, metadata, *self._diff(file_path.name, metadata, records))
+
+    def _diff(
+        self,
+        source: str,
+        metadata: List[Dict],
+        records: List[Tuple[str, Dict]]
+    ) -> Tuple[List[int], List[Tuple[str, Dict]]]:
+        """
+        (positions to remove, records to add) that turn a manual's indexed
+        chunks into records; unchanged chunks get their metadata refreshed
+        in place
+        """
+        old_positions = defaultdict(list)
+        for i, m in enumerate(metadata):
+            if m["source"] == source:
+                old_positions[m["hash"]].append(i)
+
+        remove, add = [], []
+        for chunk, meta in records:
+            positions = old_positions.get(meta["hash"])
+            if positions:
+                # Unchanged chunk: keep vector in place, refresh metadata
+                metadata[positions.pop()] = meta
+            else:
+                add.append((chunk, meta))
+
+        for positions in old_positions.values():
+            remove.extend(positions)
+
+        return remove, add
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _load(self) -> Tuple[faiss.Index, List[str], List[Dict]]:
+        """Load the current index and the whole chunk store into memory for editing"""
+        version = current_version(self.embeddings_dir)
+        if version is None:
+            dimension = settings.EMBEDDING_DIMENSION
+            return faiss.IndexFlatL2(dimension), [], []
+
+        index_path, metadata_dir = version_paths(version, self.embeddings_dir)
+        index = faiss.read_index(str(index_path))
+        store = open_chunk_store(str(metadata_dir))
+
+        chunks = [store.chunk(i) for i in range(len(store))]
+        metadata = list(store.iter_metadata())
+
+        # Stores built before content hashes were recorded
+        for chunk, meta in zip(chunks, metadata):
+            if "hash" not in meta:
+                meta["hash"] = chunk_hash(chunk)
+
+        return index, chunks, metadata
+
+    def _vectors_for(
+        self,
+        index: faiss.Index,
+        records: List[Tuple[str, Dict]],
+        known: Dict[str, int]
+    ) -> Tuple[np.ndarray, int]:
+        """
+        Embeddings for new records: chunks whose content already exists in
+        the index reuse the stored vector, everything else is encoded
+
+        Returns:
+            (vectors, number of chunks that had to be encoded)
+        """
+        vectors = np.zeros((len(records), index.d), dtype='float32')
+        to_encode = []
+        exact = _stores_exact_vectors(index)
+
+        for row, (chunk, meta) in enumerate(records):
+            position = known.get(meta["hash"])
+            if position is not None and exact:
+                vectors[row] = index.reconstruct(position)
+            else:
+                to_encode.append(row)
+
+        if to_encode:
+            vectors[to_encode] = self.model.encode_documents([records[row][0] for row in to_encode])
+
+        return vectors, len(to_encode)
+
+    def _apply(
+        self,
+        index: faiss.Index,
+        chunks: List[str],
+        metadata: List[Dict],
+        remove: List[int],
+        add: List[Tuple[str, Dict]]
+    ) -> Dict:
+        """Remove positions, append records and write everything back"""
+        remove_set = set(remove)
+        known = {
+            meta["hash"]: i
+            for i, meta in enumerate(metadata)
+            if i not in remove_set
+        }
+        new_vectors, encoded = self._vectors_for(index, add, known)
+
+        if remove_set:
+            chunks_kept = [c for i, c in enumerate(chunks) if i not in remove_set]
+            index = self._remove_positions(index, sorted(remove_set), chunks_kept)
+            chunks = chunks_kept
+            metadata = [m for i, m in enumerate(metadata) if i not in remove_set]
+
+        if add:
+            index.add(new_vectors)
+            chunks.extend(chunk for chunk, _ in add)
+            metadata.extend(meta for _, meta in add)
+
+        version = self._write(index, chunks, metadata)
+
+        result = {
+            "success": True,
+            "version": version,
+            "chunks_removed": len(remove_set),
+            "chunks_added": len(add),
+            "chunks_embedded": encoded,
+            "total_chunks": len(chunks)
+        }
+        logger.info(f"Knowledge base updated: {result}")
+        return result
+
+    def _remove_positions(self, index: faiss.Index, positions: List[int], chunks_kept: List[str]) -> faiss.Index:
+        """
+        Drop vectors so that ids stay equal to chunk store positions
+
+        Stored codes are never decoded and re-added: flat indices compact
+        in place, IVF indices drop the entries from their inverted lists and
+        renumber the rest, and HNSW (which cannot remove) is refilled from
+        exact vectors into a copy with the same parameters. Quantized
+        storage would lose precision on every update if it were re-filled
+        from its own reconstructions, so those vectors come from the
+        embedding cache instead.
+
+        Args:
+            index: Index to edit
+            positions: Sorted positions to drop
+            chunks_kept: Chunk texts of the remaining positions, in order
+        """
+        ids = np.asarray(positions, dtype='int64')
+        selector = faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+
+        if index_type_of(index) in ("ivf_flat", "ivf_pq"):
+            _remove_ivf_entries(index, selector, index.ntotal, set(positions))
+            return index
+
+        if index_type_of(index) != "hnsw":
+            index.remove_ids(selector)
+            return index
+
+        if _stores_exact_vectors(index):
+            removed = set(positions)
+            keep = [i for i in range(index.ntotal) if i not in removed]
+            kept_vectors = np.vstack([index.reconstruct(i) for i in keep]) if keep else None
+            rebuilt = faiss.IndexHNSWFlat(index.d, index.hnsw.nb_neighbors(1))
+            rebuilt.hnsw.efConstruction = index.hnsw.efConstruction
+            rebuilt.hnsw.efSearch = index.hnsw.efSearch
+        else:
+            kept_vectors = self.model.encode_documents(chunks_kept) if chunks_kept else None
+            # The copy keeps the trained quantizer and the HNSW parameters
+            rebuilt = faiss.clone_index(index)
+            rebuilt.reset()
+
+        if kept_vectors is not None:
+            rebuilt.add(kept_vectors)
+        return rebuilt
+
+    def _write(self, index: faiss.Index, chunks: List[str], metadata: List[Dict]) -> str:
+        """
+        Write the edited index, chunk store and type array as a new index
+        version and publish it. Running vector stores swap to it in the
+        background; the previous version is left untouched.
+
+        Returns:
+            The new version id
+        """
+        version = IndexVersionWriter(self.embeddings_dir)
+        try:
+            write_chunk_store(str(version.metadata_dir), chunks, metadata)
+
+            type_names = sorted({m["type"] for m in metadata})
+            code_of = {name: code for code, name in enumerate(type_names)}
+            chunk_types = np.array([code_of[m["type"]] for m in metadata], dtype='int16')
+            np.save(version.metadata_dir / "chunk_types.npy", chunk_types)
+            with open(version.metadata_dir / "chunk_type_names.json", 'w', encoding='utf-8') as f:
+                json.dump(type_names, f)
+
+            faiss.write_index(index, str(version.index_path))
+        except BaseException:
+            version.discard()
+            raise
+
+        return version.publish(
+            index_type=index_type_of(index),
+            total_chunks=len(chunks),
+            dimension=index.d,
+            sources=sorted({m["source"] for m in metadata})
+        )
+
+
+
+def _stores_exact_vectors(index: faiss.Index) -> bool:
+    """Whether reconstruct() returns the original vectors (no quantization)"""
+    return isinstance(index, (faiss.IndexFlat, faiss.IndexHNSWFlat))
+
+
+def _remove_ivf_entries(index: faiss.Index, selector: faiss.IDSelector, total: int, removed: set):
+    """
+    Remove ids from an IVF index and shift the remaining ids down to
+    their new chunk store positions, leaving every stored code untouched
+    """
+    ivf = faiss.extract_index_ivf(index)
+    direct_map_type = ivf.direct_map.type
+    # Removal is not supported with an array direct map; rebuilt below
+    ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+    index.remove_ids(selector)
+
+    new_ids = np.full(total, -1, dtype='int64')
+    kept = np.asarray([i for i in range(total) if i not in removed], dtype='int64')
+    new_ids[kept] = np.arange(len(kept), dtype='int64')
+
+    invlists = ivf.invlists
+    for list_no in range(ivf.nlist):
+        size = invlists.list_size(list_no)
+        if not size:
+            continue
+        old = faiss.rev_swig_ptr(invlists.get_ids(list_no), size).copy()
+        codes = faiss.rev_swig_ptr(invlists.get_codes(list_no), size * invlists.code_size).copy()
+        renumbered = new_ids[old]
+        invlists.update_entries(list_no, 0, size, faiss.swig_ptr(renumbered), faiss.swig_ptr(codes))
+
+    ivf.set_direct_map_type(direct_map_type)
+
+# Global instance
+knowledge_base_updater = KnowledgeBaseUpdater()
@@ -0,0 +1,131 @@
+"""
+Query Fusion
+Combines ranked hit lists into one ranking:
+
+- reciprocal-rank fusion (RRF) for several queries against one index: a
+  hit scores sum(1 / (k + rank)) over the queries that returned it, so
+  chunks relevant to many parts of the input rise to the top without
+  comparing raw distances across queries
+- similarity merge for one query against several indices, re-scored as
+  exact cosine similarity so that quantized or reduced indices rank on
+  the same scale as exact ones
+"""
+import hashlib
+from typing import Callable, Dict, Hashable, List, Optional
+import numpy as np
+
+# Standard RRF constant (Cormack et al.); larger values flatten the rank weights
+DEFAULT_RRF_K = 60
+
+
+def _hit_key(hit: Dict) -> Hashable:
+    if "id" in hit:
+        return hit["id"]
+    return hashlib.sha1(hit["content"].encode('utf-8')).hexdigest()
+
+
+def reciprocal_rank_fusion(
+    result_lists: List[List[Dict]],
+    top_k: int,
+    k: int = DEFAULT_RRF_K,
+    key: Optional[Callable[[Dict], Hashable]] = None
+) -> List[Dict]:
+    """
+    Fuse ranked hit lists into one
+
+    Args:
+        result_lists: One ranked hit list per query (best first)
+        top_k: Number of fused hits to return
+        k: RRF constant
+        key: Identifies the same chunk across lists (default: "id", else content)
+
+    Returns:
+        Fused hits, best first. Each is a copy of the hit's best-scoring
+        occurrence with "rank", "rrf_score" and "query_hits" (number of
+        queries that returned it) set.
+    """
+    key = key or _hit_key
+    fused: Dict[Hashable, Dict] = {}
+
+    for hits in result_lists:
+        for position, hit in enumerate(hits):
+            hit_key = key(hit)
+            contribution = 1.0 / (k + position + 1)
+            current = fused.get(hit_key)
+            if current is None:
+                fused[hit_key] = {**hit, "rrf_score": contribution, "query_hits": 1}
+                continue
+            current["rrf_score"] += contribution
+            current["query_hits"] += 1
+            if hit.get("score", float("inf")) < current.get("score", float("inf")):
+                current.update({
+                    name: value for name, value in hit.items()
+                    if name not in ("rrf_score", "query_hits")
+                })
+
+    ranked = sorted(fused.values(), key=lambda hit: hit["rrf_score"], reverse=True)[:top_k]
+    for rank, hit in enumerate(ranked):
+        hit["rank"] = rank + 1
+    return ranked
+
+
+def l2_similarity(distance: float) -> float:
+    """
+    Cosine similarity of two unit vectors from their squared L2 distance,
+    clipped to [0, 1]. Only exact for full-dimension, unquantized indices;
+    PQ, SQ and PCA storage return approximate or reduced-space distances.
+    """
+    return min(max(1.0 - distance / 2.0, 0.0), 1.0)
+
+
+def cosine_similarities(query_vector: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """Cosine similarity of one query vector to each row, clipped to [0, 1]"""
+    vectors = np.asarray(vectors, dtype='float32')
+    query_vector = np.asarray(query_vector, dtype='float32').reshape(-1)
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector)
+    return np.clip(vectors @ query_vector / np.maximum(norms, 1e-12), 0.0, 1.0)
+
+
+def merge_by_similarity(
+    hits_by_source: Dict[str, List[Dict]],
+    top_k: int,
+    query_vector: Optional[np.ndarray] = None,
+    embed: Optional[Callable[[List[str]], np.ndarray]] = None
+) -> List[Dict]:
+    """
+    Merge hits of several indices into one ranking
+
+    Index distances are only comparable when every index stores exact
+    vectors, so with query_vector and embed given the candidates are
+    re-scored against the chunks' original embeddings before ranking.
+
+    Args:
+        hits_by_source: Ranked L2 hits per index name
+        top_k: Number of merged hits to return
+        query_vector: Embedding of the query
+        embed: Original embeddings of chunk texts (e.g. the chunk
+            embedding cache behind encode_documents)
+
+    Returns:
+        Hits best first, each tagged with "source_index" and a
+        "similarity". A chunk found in several indices is kept once.
+    """
+    merged: Dict[str, Dict] = {}
+    for source, hits in hits_by_source.items():
+        for hit in hits:
+            tagged = {**hit, "source_index": source, "similarity": l2_similarity(hit["score"])}
+            key = hashlib.sha1(hit["content"].encode('utf-8')).hexdigest()
+            current = merged.get(key)
+            if current is None or tagged["similarity"] > current["similarity"]:
+                merged[key] = tagged
+
+    candidates = list(merged.values())
+    if candidates and query_vector is not None and embed is not None:
+        similarities = cosine_similarities(query_vector, embed([hit["content"] for hit in candidates]))
+        for hit, similarity in zip(candidates, similarities):
+            hit["similarity"] = float(similarity)
+
+    ranked = sorted(candidates, key=lambda hit: hit["similarity"], reverse=True)[:top_k]
+    for rank, hit in enumerate(ranked):
+        hit["rank"] = rank + 1
+    return ranked
@@ -1,10 +1,13 @@
 from typing import List, Dict, Optional
-from app.core.rag.faiss_vector_store import vector_store
+from app.config import settings
+from app.core.rag.context_augmentation_service import context_packer
+from app.core.rag.document_chunking_service import format_page_citation
+from app.core.rag.faiss_vector_store import FAISSVectorStore, vector_store
 
 
 class SemanticRetrievalEngine:
-    def __init__(self):
-        self.vector_store = vector_store
+    def __init__(self, store: Optional[FAISSVectorStore] = None):
+        self.vector_store = store or vector_store
     
     def retrieve(self, query: str, top_k: int = 5, filter_type: Optional[str] = None) -> List[Dict]:
         """
@@ -18,15 +21,48 @@ class SemanticRetrievalEngine:
         Returns:
             List of relevant chunks with metadata
         """
-        # Search in vector store
-        results = self.vector_store.search(query, top_k=top_k * 2)  # Get more, then filter
+        # Type filtering happens inside the index; approximate (IVF / HNSW)
+        # searches are widened until top_k in-type hits come back, so only a
+        # partition smaller than top_k returns fewer
+        return self.vector_store.search(query, top_k=top_k, filter_type=filter_type)
+    
+    def retrieve_many(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        filter_type: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Retrieve manual content for several queries at once
+        
+        All queries are encoded in one batch and searched with one FAISS call.
+        Hits are merged in query order and chunks returned by more than one
+        query are only kept once.
+        
+        Args:
+            queries: Search queries
+            top_k: Number of results to keep per query
+            filter_type: Filter by manual type (FX5U, GX_Works3, Datatype_Rules)
+        
+        Returns:
+            Merged, deduplicated list of chunks with metadata
+        """
+        per_query_results = self.vector_store.search_many(
+            queries,
+            top_k=top_k,
+            filter_type=filter_type
+        )
         
-        # Filter by type if specified
-        if filter_type:
-            results = [r for r in results if r['metadata']['type'] == filter_type]
+        merged = []
+        seen_ids = set()
+        for results in per_query_results:
+            for result in results:
+                if result['id'] in seen_ids:
+                    continue
+                seen_ids.add(result['id'])
+                merged.append(result)
         
-        # Return top_k results
-        return results[:top_k]
+        return merged
     
     def retrieve_context(self, query: str, max_chunks: int = 3) -> str:
         """
@@ -40,17 +76,80 @@ class SemanticRetrievalEngine:
             Formatted context string
         """
         results = self.retrieve(query, top_k=max_chunks)
+        return self.format_context(results)
+    
+    def retrieve_context_many(self, queries: List[str], max_chunks: int = 3) -> str:
+        """
+        Retrieve context for several queries as a single string for LLM
+        
+        Args:
+            queries: Search queries
+            max_chunks: Maximum number of chunks per query
+        
+        Returns:
+            Formatted context string without duplicate chunks
+        """
+        results = self.retrieve_many(queries, top_k=max_chunks)
+        return self.format_context(results)
+    
+    def retrieve_packed_context(
+        self,
+        queries: List[str],
+        token_budget: Optional[int] = None,
+        max_chunks: int = 3,
+        filter_type: Optional[str] = None
+    ) -> Dict:
+        """
+        Retrieve context for several queries packed into a token budget
+        
+        Chunks found by more than one query are kept once, consecutive
+        chunks of a manual are merged without their shared overlap, and
+        passages are chosen for relevance and diversity (MMR) until the
+        budget is full.
+        
+        Args:
+            queries: Search queries
+            token_budget: Maximum context tokens, sized to the prompt
+                (default RAG_CONTEXT_TOKEN_BUDGET)
+            max_chunks: Maximum number of chunks retrieved per query
+            filter_type: Filter by manual type (FX5U, GX_Works3, Datatype_Rules)
         
+        Returns:
+            Dict with the formatted "context" plus token statistics
+        """
+        per_query_results = self.vector_store.search_many(
+            queries,
+            top_k=max_chunks,
+            filter_type=filter_type
+        )
+        return self.pack_results(per_query_results, token_budget)
+    
+    def pack_results(self, per_query_results: List[List[Dict]], token_budget: Optional[int] = None) -> Dict:
+        """Pack already retrieved per-query hits (see retrieve_packed_context)"""
+        packed = context_packer.pack(
+            per_query_results,
+            token_budget or settings.RAG_CONTEXT_TOKEN_BUDGET,
+            chunk_vectors=self.vector_store.model.stored_document_vectors,
+            format_passage=self._format_passage
+        )
+        packed["context"] = self.format_context(packed["passages"])
+        return packed
+    
+    def format_context(self, results: List[Dict]) -> str:
+        """Format retrieved chunks with their sources"""
         if not results:
             return "No relevant information found in manuals."
         
-        context_parts = []
-        for i, result in enumerate(results, 1):
-            source = result['metadata']['source']
-            content = result['content']
-            context_parts.append(f"[Source: {source}]\n{content}\n")
-        
-        return "\n---\n".join(context_parts)
+        return "\n---\n".join(self._format_passage(result) for result in results)
+    
+    @staticmethod
+    def _format_passage(result: Dict) -> str:
+        source = result['metadata']['source']
+        citation = format_page_citation(result['metadata'])
+        if citation:
+            source = f"{source}, {citation}"
+        content = result['content']
+        return f"[Source: {source}]\n{content}\n"
 
 
 # Global instance
@@ -1,6 +1,15 @@
-from typing import Dict, List
+from typing import AsyncIterator, Dict, List
 from app.core.ai_agents.shared.perplexity_api_client import perplexity_client
-from app.core.rag.semantic_retrieval_engine import retrieval_engine
+from app.services.retrieval_service import retrieval_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bump when the validation prompt or its parsing changes so cached responses are not reused
+VALIDATION_PROMPT_VERSION = "1"
+
+# Manual context for the validation prompt: room for its 3 queries x 2 whole chunks
+VALIDATION_CONTEXT_TOKEN_BUDGET = 4500
 
 
 class StageValidator:
@@ -8,61 +17,96 @@ class StageValidator:
     
     def __init__(self):
         self.perplexity = perplexity_client
-        self.retrieval = retrieval_engine
+        self.retrieval = retrieval_service
     
-    async def validate_stage(self, stage: Dict) -> Dict:
+    async def validate_stage(self, stage: Dict, use_cache: bool = True) -> Dict:
         """
         Validate a stage's logic
         
         Args:
             stage: Stage data with logic
+            use_cache: Reuse the cached answer for an unchanged prompt
         
         Returns:
             Validation result
         """
-        import logging
-        logger = logging.getLogger(__name__)
-        
         try:
-            # Get validation rules from manuals
-            manual_context = self._get_validation_context()
-            
-            # Build validation prompt
-            system_prompt = self._build_validation_prompt(manual_context)
-            
-            # Build validation request
-            user_request = self._build_validation_request(stage)
-            
-            # Call Perplexity
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_request}
-            ]
+            messages = await self._build_messages(stage)
             
             logger.info(f"Calling Perplexity API for stage validation: {stage.get('stage_name')}")
             response = await self.perplexity.chat_completion(
                 messages=messages,
                 temperature=0.1,  # Lower temperature for more consistent, less creative validation
-                max_tokens=2000
+                max_tokens=2000,
+                prompt_version=VALIDATION_PROMPT_VERSION,
+                use_cache=use_cache
             )
             
             # Parse response
             validation_text = self.perplexity.extract_response_text(response)
             
-            if not validation_text:
-                logger.error("Empty response from Perplexity API")
-                raise ValueError("No response received from validation service")
+            return self._build_result(stage, validation_text)
+        except Exception as e:
+            logger.error(f"Validation failed: {str(e)}", exc_info=True)
+            raise
+    
+    async def validate_stage_stream(self, stage: Dict, use_cache: bool = True) -> AsyncIterator[Dict]:
+        """
+        Validate a stage's logic, streaming the model's analysis
+        
+        Yields {"type": "token", "text": ...} events as the analysis is
+        written, then {"type": "result", "result": ...} with the same dict
+        validate_stage returns.
+        """
+        try:
+            messages = await self._build_messages(stage)
             
-            # Parse validation result
-            result = self._parse_validation_result(validation_text)
-            logger.info(f"Validation completed for stage {stage.get('stage_name')}: {result['status']}")
+            logger.info(f"Streaming stage validation: {stage.get('stage_name')}")
+            parts = []
+            async for text in self.perplexity.stream_completion(
+                messages=messages,
+                temperature=0.1,
+                max_tokens=2000,
+                prompt_version=VALIDATION_PROMPT_VERSION,
+                use_cache=use_cache
+            ):
+                parts.append(text)
+                yield {"type": "token", "text": text}
             
-            return result
+            yield {"type": "result", "result": self._build_result(stage, "".join(parts))}
         except Exception as e:
             logger.error(f"Validation failed: {str(e)}", exc_info=True)
             raise
     
-    def _get_validation_context(self) -> str:
+    async def _build_messages(self, stage: Dict) -> List[Dict]:
+        """System prompt (with manual context) and validation request for a stage"""
+        # Get validation rules from manuals
+        manual_context = await self._get_validation_context()
+        
+        # Build validation prompt
+        system_prompt = self._build_validation_prompt(manual_context)
+        
+        # Build validation request
+        user_request = self._build_validation_request(stage)
+        
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_request}
+        ]
+    
+    def _build_result(self, stage: Dict, validation_text: str) -> Dict:
+        """Parse the model's answer into a validation result"""
+        if not validation_text:
+            logger.error("Empty response from Perplexity API")
+            raise ValueError("No response received from validation service")
+        
+        # Parse validation result
+        result = self._parse_validation_result(validation_text)
+        logger.info(f"Validation completed for stage {stage.get('stage_name')}: {result['status']}")
+        
+        return result
+    
+    async def _get_validation_context(self) -> str:
         """Get manual context for validation"""
         queries = [
             "PLC safety requirements interlocks",
@@ -70,13 +114,10 @@ class StageValidator:
             "Structured Text programming rules"
         ]
         
-        contexts = []
-        for query in queries:
-            context = self.retrieval.retrieve_context(query, max_chunks=2)
-            if context:
-                contexts.append(context)
-        
-        return "\n\n".join(contexts)
+        # One batched encode + search for all queries, packed into the token budget
+        return await self.retrieval.retrieve_packed_context(
+            queries, token_budget=VALIDATION_CONTEXT_TOKEN_BUDGET, max_chunks=2
+        )
     
     def _build_validation_prompt(self, manual_context: str) -> str:
         """Build system prompt for validation"""
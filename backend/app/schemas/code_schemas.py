@@ -4,6 +4,7 @@ from typing import List, Dict, Optional
 
 class GenerateCodeRequest(BaseModel):
     stage_id: int
+    use_cache: bool = True  # False forces a fresh LLM call
 
 
 class LabelInfo(BaseModel):
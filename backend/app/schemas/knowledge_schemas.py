@@ -0,0 +1,24 @@
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
+
+
+class KnowledgeSearchRequest(BaseModel):
+    query: str
+    sources: Optional[List[str]] = None  # manuals, default_safety, project_safety (default: all)
+    project_id: Optional[int] = None
+    top_k: int = Field(5, ge=1, le=50)
+    filter_type: Optional[str] = None
+
+
+class KnowledgeSearchHit(BaseModel):
+    rank: int
+    source_index: str
+    similarity: float
+    content: str
+    metadata: Dict[str, Any] = {}
+
+
+class KnowledgeSearchResponse(BaseModel):
+    query: str
+    sources: List[str]
+    results: List[KnowledgeSearchHit]
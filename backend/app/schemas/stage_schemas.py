@@ -9,6 +9,7 @@ class UpdateStageLogicRequest(BaseModel):
 
 class ValidateStageRequest(BaseModel):
     stage_id: int
+    use_cache: bool = True  # False forces a fresh LLM call
 
 
 class FinalizeStageRequest(BaseModel):
@@ -0,0 +1,219 @@
+"""
+Embedding Model Service
+Process-wide, lazily loaded sentence embedding model shared by every
+retrieval and ingestion path
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Union
+import numpy as np
+from app.config import settings
+from app.core.rag.embedding_cache import EmbeddingCache, chunk_hash
+from app.core.rag.embedding_generator import TorchEncoder, create_encoder
+from app.services.model_bundle import enable_offline_mode, model_fingerprint, resolve_model_path
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process (Linux only, None elsewhere)"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class EmbeddingModelService:
+    """Single sentence encoder instance shared by the whole worker"""
+
+    def __init__(self, model_name: Optional[str] = None, backend: Optional[str] = None):
+        self.model_name = model_name or settings.EMBEDDING_MODEL_NAME
+        self.backend = backend or settings.EMBEDDING_BACKEND
+        self._encoder = None
+        self._document_cache = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "loaded": False,
+            "model_path": None,
+            "load_time_seconds": None,
+            "parameter_bytes": None,
+            "rss_delta_bytes": None,
+            "encode_calls": 0,
+            "texts_encoded": 0
+        }
+
+    @property
+    def encoder(self):
+        """Load the encoder on first use (double-checked so only one thread loads it)"""
+        if self._encoder is None:
+            with self._lock:
+                if self._encoder is None:
+                    self._encoder = self._load_encoder()
+        return self._encoder
+
+    @property
+    def model(self):
+        """The PyTorch SentenceTransformer (e.g. for multi-process encoding pools)"""
+        encoder = self.encoder
+        if not isinstance(encoder, TorchEncoder):
+            raise RuntimeError(f"The {self.backend} embedding backend has no SentenceTransformer")
+        return encoder.model
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._encoder is not None
+
+    @property
+    def dimension(self) -> int:
+        """Embedding dimension of the loaded model"""
+        return self.encoder.dimension
+
+    @property
+    def max_query_tokens(self) -> int:
+        """Most text tokens embedded before the encoder truncates (special tokens excluded)"""
+        encoder = self.encoder
+        return encoder.max_seq_length - encoder.tokenizer.num_special_tokens_to_add()
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """Encoder tokens per text (see max_query_tokens)"""
+        return self.encoder.count_tokens(texts)
+
+    def _load_encoder(self):
+        """Construct the configured encoder backend, recording cost"""
+        model_path = resolve_model_path(self.model_name)
+        if settings.EMBEDDING_LOCAL_FILES_ONLY:
+            enable_offline_mode()
+
+        logger.info(f"Loading embedding model: {self.model_name} ({self.backend}) from {model_path}")
+        rss_before = _current_rss_bytes()
+        start = time.perf_counter()
+
+        encoder = create_encoder(self.backend, model_path, threads=settings.EMBEDDING_ONNX_THREADS)
+
+        load_time = time.perf_counter() - start
+        rss_after = _current_rss_bytes()
+
+        self._stats.update({
+            "loaded": True,
+            "model_path": model_path,
+            "load_time_seconds": round(load_time, 3),
+            "parameter_bytes": encoder.parameter_bytes,
+            "rss_delta_bytes": (
+                rss_after - rss_before
+                if rss_before is not None and rss_after is not None
+                else None
+            )
+        })
+
+        logger.info(
+            f"Embedding model loaded in {load_time:.2f}s "
+            f"({encoder.parameter_bytes / (1024 * 1024):.1f} MB of parameters)"
+        )
+        return encoder
+
+    def encode(
+        self,
+        texts: Union[str, List[str]],
+        batch_size: int = 32,
+        show_progress_bar: bool = False
+    ) -> np.ndarray:
+        """
+        Encode texts into float32 embeddings
+
+        Args:
+            texts: A single text or a list of texts
+            batch_size: Encoder batch size
+            show_progress_bar: Show progress while encoding
+
+        Returns:
+            2D float32 array with one row per text
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+
+        embeddings = self.encoder.encode(
+            texts,
+            batch_size=batch_size,
+            show_progress_bar=show_progress_bar
+        )
+
+        self._stats["encode_calls"] += 1
+        self._stats["texts_encoded"] += len(texts)
+
+        return embeddings
+
+    @property
+    def document_cache(self) -> EmbeddingCache:
+        """Persistent chunk embedding cache for this model, backend and weights"""
+        if self._document_cache is None:
+            # Backends and re-provisioned weights produce slightly different
+            # vectors; each combination gets its own cache
+            cache_name = f"{self.model_name}-{self.backend}-{model_fingerprint(self.model_name, self.backend)}"
+            self._document_cache = EmbeddingCache(
+                cache_name,
+                settings.EMBEDDING_DIMENSION,
+                dtype=settings.EMBEDDING_CACHE_DTYPE
+            )
+        return self._document_cache
+
+    def encode_documents(
+        self,
+        texts: List[str],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        encoder: Optional[Callable[[List[str]], np.ndarray]] = None
+    ) -> np.ndarray:
+        """
+        Encode document chunks, reusing embeddings cached on disk
+
+        Chunks already embedded by any ingestion path (same model, backend
+        and weights, same text) are read from the cache; the model is only
+        loaded if something actually needs encoding.
+
+        Args:
+            texts: Chunk texts
+            batch_size: Encoder batch size
+            show_progress_bar: Show progress while encoding
+            encoder: Alternative encoder for the uncached texts
+                (e.g. a multi-process pool)
+
+        Returns:
+            2D float32 array with one row per text
+        """
+        if encoder is None:
+            def encoder(missing):
+                return self.encode(missing, batch_size=batch_size, show_progress_bar=show_progress_bar)
+
+        if not settings.EMBEDDING_CACHE_ENABLED:
+            return np.asarray(encoder(texts), dtype='float32')
+
+        return self.document_cache.encode(texts, encoder)
+
+    def stored_document_vectors(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Cached embeddings of document chunks, None for any chunk that is
+        not cached. Never encodes or writes to the cache.
+        """
+        if not settings.EMBEDDING_CACHE_ENABLED or not texts:
+            return [None] * len(texts)
+        hashes = [chunk_hash(text) for text in texts]
+        stored = self.document_cache.get_many(hashes)
+        return [stored.get(chunk_hash_value) for chunk_hash_value in hashes]
+
+    def get_stats(self) -> Dict:
+        """Load time, memory use and usage counters"""
+        stats = dict(self._stats)
+        stats["model_name"] = self.model_name
+        stats["backend"] = self.backend
+        stats["current_rss_bytes"] = _current_rss_bytes()
+        if self._document_cache is not None:
+            stats["document_cache"] = self._document_cache.get_stats()
+        return stats
+
+
+# Global instance (the model itself is only loaded on first encode)
+embedding_model_service = EmbeddingModelService()
@@ -0,0 +1,191 @@
+"""
+Embedding Model Bundle
+The sentence embedding model is shipped as a local directory under
+data/models/<model name>/ together with a checksum manifest, so workers
+load it from disk and never reach out to HuggingFace.
+scripts/provision_embedding_model.py creates and verifies bundles.
+"""
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from app.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "bundle_manifest.json"
+
+# Weight files each encoder backend loads from a bundle, in order of preference
+BACKEND_WEIGHT_FILES = {
+    "torch": ("model.safetensors", "pytorch_model.bin"),
+    "onnx": ("onnx/model.onnx",),
+    "onnx_int8": ("onnx/model_int8.onnx",)
+}
+
+
+class ModelBundleError(RuntimeError):
+    """The local model bundle is missing or does not match its manifest"""
+
+
+def bundle_dir(model_name: Optional[str] = None) -> Path:
+    """Directory of a model's bundle"""
+    model_name = model_name or settings.EMBEDDING_MODEL_NAME
+    return Path(settings.MODELS_PATH) / model_name.replace("/", "__")
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _bundle_files(directory: Path) -> List[Path]:
+    return sorted(
+        path for path in directory.rglob("*")
+        if path.is_file() and path.name != MANIFEST_FILE
+    )
+
+
+def write_manifest(directory: Path, model_name: str, dimension: int) -> Dict:
+    """
+    Record the size and SHA-256 of every file in a bundle
+
+    Args:
+        directory: Saved SentenceTransformer directory
+        model_name: Model the bundle was made from
+        dimension: Embedding dimension of the model
+
+    Returns:
+        The manifest written to <directory>/bundle_manifest.json
+    """
+    manifest = {
+        "model_name": model_name,
+        "dimension": dimension,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "files": {
+            str(path.relative_to(directory)): {
+                "size": path.stat().st_size,
+                "sha256": _sha256(path)
+            }
+            for path in _bundle_files(directory)
+        }
+    }
+    with open(directory / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_manifest(directory: Path) -> Dict:
+    with open(directory / MANIFEST_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def verify_bundle(directory: Path, check_hashes: bool = True) -> List[str]:
+    """
+    Compare a bundle with its manifest
+
+    Args:
+        directory: Bundle directory
+        check_hashes: Also hash every file (sizes are always checked)
+
+    Returns:
+        Problems found; empty if the bundle is intact
+    """
+    try:
+        manifest = read_manifest(directory)
+    except (OSError, ValueError) as e:
+        return [f"Cannot read {MANIFEST_FILE}: {e}"]
+
+    problems = []
+    for name, expected in manifest.get("files", {}).items():
+        path = directory / name
+        if not path.is_file():
+            problems.append(f"Missing file: {name}")
+        elif path.stat().st_size != expected["size"]:
+            problems.append(f"Size mismatch: {name}")
+        elif check_hashes and _sha256(path) != expected["sha256"]:
+            problems.append(f"Checksum mismatch: {name}")
+
+    if manifest.get("dimension") not in (None, settings.EMBEDDING_DIMENSION):
+        problems.append(
+            f"Bundle dimension {manifest['dimension']} does not match "
+            f"EMBEDDING_DIMENSION={settings.EMBEDDING_DIMENSION}"
+        )
+    return problems
+
+
+def model_fingerprint(model_name: Optional[str] = None, backend: Optional[str] = None) -> str:
+    """
+    Short checksum of the weights a backend loads, taken from the bundle
+    manifest (or by hashing the file when there is no manifest). Vectors
+    from different weights are not interchangeable, so caches key on it.
+
+    Returns:
+        12 hex characters, or "unversioned" for a model without local weights
+    """
+    model_name = model_name or settings.EMBEDDING_MODEL_NAME
+    backend = backend or settings.EMBEDDING_BACKEND
+    directory = Path(model_name) if Path(model_name).is_dir() else bundle_dir(model_name)
+
+    try:
+        manifest_files = read_manifest(directory).get("files", {})
+    except (OSError, ValueError):
+        manifest_files = {}
+
+    for name in BACKEND_WEIGHT_FILES.get(backend, ()):
+        if name in manifest_files:
+            return manifest_files[name]["sha256"][:12]
+        if (directory / name).is_file():
+            return _sha256(directory / name)[:12]
+    return "unversioned"
+
+
+def enable_offline_mode():
+    """
+    Stop transformers / huggingface_hub from making network calls. Must run
+    before they are imported, which is why every model load calls it first.
+    """
+    os.environ["HF_HUB_OFFLINE"] = "1"
+    os.environ["TRANSFORMERS_OFFLINE"] = "1"
+
+
+def resolve_model_path(model_name: Optional[str] = None) -> str:
+    """
+    Path the embedding model should be loaded from
+
+    A directory name is used as is; otherwise the bundle under MODELS_PATH
+    is verified and used. With EMBEDDING_LOCAL_FILES_ONLY off, a model
+    without a bundle falls back to the HuggingFace name.
+
+    Raises:
+        ModelBundleError: The bundle is missing or damaged
+    """
+    model_name = model_name or settings.EMBEDDING_MODEL_NAME
+    directory = Path(model_name) if Path(model_name).is_dir() else bundle_dir(model_name)
+
+    if (directory / MANIFEST_FILE).exists():
+        problems = verify_bundle(directory, check_hashes=settings.EMBEDDING_VERIFY_BUNDLE)
+        if problems:
+            raise ModelBundleError(
+                f"Embedding model bundle {directory} is damaged: {'; '.join(problems)}. "
+                f"Re-run scripts/provision_embedding_model.py"
+            )
+        return str(directory)
+
+    if directory.is_dir() and directory == Path(model_name):
+        logger.warning(f"Embedding model directory {directory} has no {MANIFEST_FILE}; loading unverified")
+        return str(directory)
+
+    if settings.EMBEDDING_LOCAL_FILES_ONLY:
+        raise ModelBundleError(
+            f"Embedding model bundle not found at {directory}. Provision it with: "
+            f"python backend/scripts/provision_embedding_model.py --model {model_name}"
+        )
+
+    logger.warning(f"No local bundle for {model_name}; loading it from HuggingFace")
+    return model_name
@@ -0,0 +1,376 @@
+"""
+Retrieval Service
+Async front end for manual and safety retrieval. Encoding and FAISS
+search run on a dedicated thread pool instead of the event loop, and
+queries that arrive within a few milliseconds of each other are
+coalesced into one batched encode + search.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional
+import numpy as np
+from app.config import settings
+from app.core.rag.context_augmentation_service import context_packer
+from app.core.rag.faiss_vector_store import vector_store
+from app.core.rag.query_fusion import merge_by_similarity, reciprocal_rank_fusion
+from app.core.rag.semantic_retrieval_engine import retrieval_engine
+from app.core.ra_system.code_query_splitter import split_program_blocks
+from app.core.ra_system.safety_retrieval_engine import safety_retrieval_engine
+from app.core.ra_system.default_safety_retrieval import default_safety_retrieval
+from app.services.embedding_model_service import embedding_model_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Indices a federated search can cover
+FEDERATED_SOURCES = ("manuals", "default_safety", "project_safety")
+
+
+class MicroBatcher:
+    """
+    Collects items submitted under the same key for a short window and
+    hands them to batch_fn in one call on the executor
+
+    batch_fn(key, items) must return one result per item, in order. A
+    batch is flushed when the window expires or max_batch_size items are
+    waiting, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[Hashable, List[Any]], List[Any]],
+        executor: ThreadPoolExecutor,
+        window_ms: float,
+        max_batch_size: int
+    ):
+        self.batch_fn = batch_fn
+        self.executor = executor
+        self.window_seconds = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._pending: Dict[Hashable, List] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, key: Hashable, item: Any) -> Any:
+        """Queue one item and wait for its result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        pending = self._pending.setdefault(key, [])
+        pending.append((item, future))
+
+        if len(pending) >= self.max_batch_size:
+            self._flush(key)
+        elif len(pending) == 1:
+            self._timers[key] = loop.call_later(self.window_seconds, self._flush, key)
+
+        return await future
+
+    def _flush(self, key: Hashable):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+        batch = self._pending.pop(key, None)
+        if not batch:
+            return
+
+        self.batches += 1
+        self.items += len(batch)
+
+        items = [item for item, _ in batch]
+        futures = [future for _, future in batch]
+
+        loop = asyncio.get_running_loop()
+        task = loop.run_in_executor(self.executor, self.batch_fn, key, items)
+        task.add_done_callback(lambda done: self._resolve(done, futures))
+
+    @staticmethod
+    def _resolve(done: asyncio.Future, futures: List[asyncio.Future]):
+        if done.cancelled():
+            for future in futures:
+                future.cancel()
+            return
+
+        error = done.exception()
+        if error is not None:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        for future, result in zip(futures, done.result()):
+            # A caller that was cancelled while waiting no longer wants it
+            if not future.done():
+                future.set_result(result)
+
+    def get_stats(self) -> Dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0
+        }
+
+
+def _unique_search(search_many: Callable[[List[str]], List[List[Dict]]], queries: List[str]) -> List[List[Dict]]:
+    """Search each distinct query once and give every caller its own copy"""
+    unique = list(dict.fromkeys(queries))
+    results_of = dict(zip(unique, search_many(unique)))
+    return [[dict(result) for result in results_of[query]] for query in queries]
+
+
+class RetrievalService:
+    """Awaitable retrieval for request handlers"""
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.RAG_EXECUTOR_WORKERS,
+            thread_name_prefix="retrieval"
+        )
+        window_ms = settings.RAG_BATCH_WINDOW_MS
+        max_batch_size = settings.RAG_MAX_BATCH_SIZE
+
+        self._manual_batcher = MicroBatcher(self._search_manuals, self.executor, window_ms, max_batch_size)
+        self._safety_batcher = MicroBatcher(self._search_safety, self.executor, window_ms, max_batch_size)
+        self._default_safety_batcher = MicroBatcher(
+            self._search_default_safety, self.executor, window_ms, max_batch_size
+        )
+
+    async def _run(self, fn: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    # ------------------------------------------------------------------
+    # Batch functions (run on the executor)
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _search_manuals(key, queries: List[str]) -> List[List[Dict]]:
+        top_k, filter_type = key
+        return _unique_search(
+            lambda unique: vector_store.search_many(unique, top_k=top_k, filter_type=filter_type),
+            queries
+        )
+
+    @staticmethod
+    def _search_safety(key, queries: List[str]) -> List[List[Dict]]:
+        project_id, top_k = key
+        return _unique_search(
+            lambda unique: safety_retrieval_engine.retrieve_many(project_id, unique, top_k=top_k),
+            queries
+        )
+
+    @staticmethod
+    def _search_default_safety(top_k, queries: List[str]) -> List[List[Dict]]:
+        return _unique_search(
+            lambda unique: default_safety_retrieval.retrieve_many(unique, top_k=top_k),
+            queries
+        )
+
+    # ------------------------------------------------------------------
+    # Manual retrieval
+    # ------------------------------------------------------------------
+
+    async def search(self, query: str, top_k: int = 5, filter_type: Optional[str] = None) -> List[Dict]:
+        """Manual chunks for one query (batched with concurrent queries)"""
+        return await self._manual_batcher.submit((top_k, filter_type), query)
+
+    async def retrieve_context(self, query: str, max_chunks: int = 3) -> str:
+        """Formatted manual context for one query"""
+        results = await self.search(query, top_k=max_chunks)
+        return retrieval_engine.format_context(results)
+
+    async def retrieve_context_many(self, queries: List[str], max_chunks: int = 3) -> str:
+        """Formatted, deduplicated manual context for several queries"""
+        return await self._run(retrieval_engine.retrieve_context_many, queries, max_chunks)
+
+    async def retrieve_packed_context(
+        self,
+        queries: List[str],
+        token_budget: Optional[int] = None,
+        max_chunks: int = 3,
+        filter_type: Optional[str] = None
+    ) -> str:
+        """Deduplicated, merged, MMR-selected manual context within a token budget"""
+        # Searches go through the batcher so they coalesce with other requests
+        per_query_results = await asyncio.gather(*(
+            self.search(query, top_k=max_chunks, filter_type=filter_type) for query in queries
+        ))
+        packed = await self._run(retrieval_engine.pack_results, list(per_query_results), token_budget)
+        return packed["context"]
+
+    # ------------------------------------------------------------------
+    # Program queries
+    # ------------------------------------------------------------------
+
+    async def split_program_queries(self, program_body: str) -> List[str]:
+        """A program body split into safety queries that each fit the encoder unshortened"""
+        return await self._run(self._split_program, program_body)
+
+    @staticmethod
+    def _split_program(program_body: str) -> List[str]:
+        # Sized with the encoder's own tokenizer so nothing past max_seq_length is cut off
+        max_tokens = embedding_model_service.max_query_tokens
+        if settings.RA_QUERY_BLOCK_TOKENS > 0:
+            max_tokens = min(max_tokens, settings.RA_QUERY_BLOCK_TOKENS)
+        return split_program_blocks(
+            program_body,
+            max_size=max_tokens,
+            max_blocks=settings.RA_MAX_QUERY_BLOCKS,
+            measure=embedding_model_service.count_tokens
+        )
+
+    # ------------------------------------------------------------------
+    # Project safety manuals
+    # ------------------------------------------------------------------
+
+    async def load_safety_manual(self, project_id: int, embeddings_dir: str) -> bool:
+        return await self._run(safety_retrieval_engine.load_safety_manual, project_id, embeddings_dir)
+
+    async def retrieve_safety(self, project_id: int, query: str, top_k: int = 5) -> List[Dict]:
+        return await self._safety_batcher.submit((project_id, top_k), query)
+
+    async def retrieve_safety_context(self, project_id: int, query: str, max_chunks: int = 3) -> str:
+        results = await self.retrieve_safety(project_id, query, top_k=max_chunks)
+        return safety_retrieval_engine.format_context(results)
+
+    async def retrieve_safety_fused(self, project_id: int, queries: List[str], top_k: int = 5) -> List[Dict]:
+        """Safety rules for several queries (e.g. the blocks of a program), fused by reciprocal rank"""
+        # Submitted together, the queries share one batched encode + search
+        per_query_results = await asyncio.gather(*(
+            self.retrieve_safety(project_id, query, top_k=top_k) for query in queries
+        ))
+        return reciprocal_rank_fusion(list(per_query_results), top_k, k=settings.RA_RRF_K)
+
+    async def retrieve_safety_fused_context(self, project_id: int, queries: List[str], max_chunks: int = 3) -> str:
+        results = await self.retrieve_safety_fused(project_id, queries, top_k=max_chunks)
+        return safety_retrieval_engine.format_context(results)
+
+    # ------------------------------------------------------------------
+    # Default safety manuals
+    # ------------------------------------------------------------------
+
+    async def load_default_safety_manual(self) -> bool:
+        return await self._run(default_safety_retrieval.load_default_safety_manual)
+
+    async def retrieve_default_safety(self, query: str, top_k: int = 5) -> List[Dict]:
+        return await self._default_safety_batcher.submit(top_k, query)
+
+    async def retrieve_default_safety_context(self, query: str, max_chunks: int = 5) -> str:
+        results = await self.retrieve_default_safety(query, top_k=max_chunks)
+        return default_safety_retrieval.format_context(results)
+
+    async def retrieve_default_safety_fused(self, queries: List[str], top_k: int = 5) -> List[Dict]:
+        """Default safety rules for several queries, fused by reciprocal rank"""
+        per_query_results = await asyncio.gather(*(
+            self.retrieve_default_safety(query, top_k=top_k) for query in queries
+        ))
+        return reciprocal_rank_fusion(list(per_query_results), top_k, k=settings.RA_RRF_K)
+
+    async def retrieve_default_safety_fused_context(self, queries: List[str], max_chunks: int = 5) -> str:
+        results = await self.retrieve_default_safety_fused(queries, top_k=max_chunks)
+        return default_safety_retrieval.format_context(results)
+
+    # ------------------------------------------------------------------
+    # Federated search
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _federated_manuals(query_embeddings: np.ndarray, top_k: int, filter_type: Optional[str]) -> List[Dict]:
+        try:
+            return vector_store.search_vectors(query_embeddings, top_k=top_k, filter_type=filter_type)[0]
+        except FileNotFoundError as e:
+            logger.warning(f"Federated search skipped manuals: {e}")
+            return []
+
+    @staticmethod
+    def _federated_default_safety(query_embeddings: np.ndarray, top_k: int) -> List[Dict]:
+        if not default_safety_retrieval.load_default_safety_manual():
+            return []
+        return default_safety_retrieval.search_vectors(query_embeddings, top_k=top_k)[0]
+
+    @staticmethod
+    def _federated_project_safety(
+        project_id: int,
+        embeddings_dir: str,
+        query_embeddings: np.ndarray,
+        top_k: int
+    ) -> List[Dict]:
+        if not safety_retrieval_engine.load_safety_manual(project_id, embeddings_dir):
+            return []
+        return safety_retrieval_engine.search_vectors(project_id, query_embeddings, top_k=top_k)[0]
+
+    async def federated_search(
+        self,
+        query: str,
+        sources: Optional[List[str]] = None,
+        project_id: Optional[int] = None,
+        top_k: int = 5,
+        filter_type: Optional[str] = None,
+        safety_embeddings_dir: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Search several indices with one query and merge the hits
+
+        The query is encoded once and the index searches run in parallel
+        on the executor. The merged candidates are re-scored by exact cosine
+        similarity to their cached chunk embeddings, so indices with
+        quantized or PCA-reduced storage rank on the same scale as the rest.
+
+        Args:
+            query: Search query
+            sources: Any of FEDERATED_SOURCES (default: all)
+            project_id: Project whose safety manual is searched ("project_safety")
+            top_k: Number of merged hits to return
+            filter_type: Manual type filter for the "manuals" index
+            safety_embeddings_dir: Where project safety indices live
+
+        Returns:
+            Hits best first, each tagged with "source_index" and "similarity"
+        """
+        sources = list(dict.fromkeys(sources or FEDERATED_SOURCES))
+        unknown = [source for source in sources if source not in FEDERATED_SOURCES]
+        if unknown:
+            raise ValueError(f"Unknown index: {', '.join(unknown)}")
+        if "project_safety" in sources and project_id is None:
+            raise ValueError("project_safety search requires a project_id")
+
+        query_embeddings = await self._run(embedding_model_service.encode, [query])
+
+        searches = []
+        for source in sources:
+            if source == "manuals":
+                searches.append(self._run(self._federated_manuals, query_embeddings, top_k, filter_type))
+            elif source == "default_safety":
+                searches.append(self._run(self._federated_default_safety, query_embeddings, top_k))
+            else:
+                embeddings_dir = safety_embeddings_dir or str(Path(settings.EMBEDDINGS_PATH) / "safety_manuals")
+                searches.append(self._run(
+                    self._federated_project_safety, project_id, embeddings_dir, query_embeddings, top_k
+                ))
+
+        hits = await asyncio.gather(*searches)
+        return await self._run(
+            merge_by_similarity,
+            dict(zip(sources, hits)),
+            top_k,
+            query_embeddings[0],
+            embedding_model_service.encode_documents
+        )
+
+    def get_stats(self) -> Dict:
+        """Batching counters per retrieval target"""
+        return {
+            "manuals": self._manual_batcher.get_stats(),
+            "safety": self._safety_batcher.get_stats(),
+            "default_safety": self._default_safety_batcher.get_stats(),
+            "context_packing": context_packer.get_stats()
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+# Global instance
+retrieval_service = RetrievalService()
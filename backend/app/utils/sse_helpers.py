@@ -0,0 +1,42 @@
+import json
+import logging
+from typing import Any, AsyncIterator, Tuple
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+
+def format_sse(event: str, data: Any) -> str:
+    """One server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
+
+
+def sse_response(events: AsyncIterator[Tuple[str, Any]]) -> StreamingResponse:
+    """
+    Stream (event, data) pairs as text/event-stream
+
+    The status line is sent before the first event, so a failure part way
+    through is reported to the client as a final "error" event. Errors that
+    say when to try again (LLM quota exhaustion) include "retry_after" seconds.
+    """
+    async def body():
+        try:
+            async for event, data in events:
+                yield format_sse(event, data)
+        except Exception as e:
+            logger.error(f"Event stream failed: {str(e)}", exc_info=True)
+            error = {"detail": str(e)}
+            retry_after = getattr(e, "retry_after", None)
+            if retry_after is not None:
+                error["retry_after"] = int(retry_after)
+            yield format_sse("error", error)
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Stop nginx from buffering the stream
+        }
+    )
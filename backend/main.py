@@ -1,6 +1,7 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
 from app.config import settings
 
@@ -13,7 +14,7 @@ from app.api.routes import (
     planner,
     stages,
     validation,
-    # ra_system,  # Disabled: HuggingFace network issue
+    ra_system,
     architecture,
     nexus,
     aidude,
@@ -27,6 +28,7 @@ from app.api.routes import (
     sharing,
     employees
 )
+from app.api.middleware.compression import StreamingAwareGZipMiddleware
 from app.api.middleware.request_logging import RequestLoggingMiddleware
 from app.api.middleware.error_handler import setup_exception_handlers
 from app.utils.custom_logger import setup_logging
@@ -34,6 +36,93 @@ from app.utils.custom_logger import setup_logging
 # Setup logging
 setup_logging()
 
+def check_embedding_model_bundle():
+    """Report a missing or incomplete local embedding model at startup"""
+    import logging
+    from app.services.model_bundle import MANIFEST_FILE, bundle_dir, verify_bundle
+    
+    logger = logging.getLogger(__name__)
+    directory = bundle_dir()
+    if not (directory / MANIFEST_FILE).exists():
+        if settings.EMBEDDING_LOCAL_FILES_ONLY:
+            logger.warning(
+                f"Embedding model bundle not found at {directory}; retrieval will fail until "
+                f"backend/scripts/provision_embedding_model.py is run"
+            )
+        return
+    
+    # Sizes only; checksums are verified when the model is loaded
+    problems = verify_bundle(directory, check_hashes=False)
+    if problems:
+        logger.warning(f"Embedding model bundle {directory} is incomplete: {'; '.join(problems)}")
+
+
+def preload_safety_indices():
+    """Warm the safety index cache with recently active projects"""
+    if settings.SAFETY_INDEX_PRELOAD_COUNT <= 0:
+        return
+    
+    from pathlib import Path
+    from app.core.ra_system.safety_retrieval_engine import safety_retrieval_engine
+    from app.services.retrieval_service import retrieval_service
+    
+    import logging
+    
+    logger = logging.getLogger(__name__)
+    
+    def report(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Safety index preload failed", exc_info=future.exception())
+    
+    embeddings_dir = Path(settings.EMBEDDINGS_PATH) / 'safety_manuals'
+    if embeddings_dir.exists():
+        # Load in the background so startup is not delayed
+        preload = asyncio.get_running_loop().run_in_executor(
+            retrieval_service.executor,
+            safety_retrieval_engine.preload_recent,
+            str(embeddings_dir),
+            settings.SAFETY_INDEX_PRELOAD_COUNT
+        )
+        preload.add_done_callback(report)
+
+
+async def watch_rag_index_versions():
+    """Pick up newly published manual index versions even when idle"""
+    import logging
+    from app.core.rag.faiss_vector_store import vector_store
+    
+    logger = logging.getLogger(__name__)
+    
+    while True:
+        await asyncio.sleep(settings.RAG_INDEX_POLL_SECONDS)
+        # Only swaps once the index is in use; the first load stays lazy
+        if not vector_store.is_loaded:
+            continue
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, vector_store.check_for_update)
+        except Exception:
+            # e.g. a version that is still being published; try again next poll
+            logger.exception("Checking for a new RAG index version failed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared resources at startup and release them at shutdown"""
+    from app.core.ai_agents.shared.llm_http_client import llm_http_client
+    from app.services.retrieval_service import retrieval_service
+    
+    await llm_http_client.start()
+    check_embedding_model_bundle()
+    preload_safety_indices()
+    rag_index_watcher = asyncio.create_task(watch_rag_index_versions())
+    
+    yield
+    
+    rag_index_watcher.cancel()
+    retrieval_service.shutdown()
+    await llm_http_client.close()
+
+
 # Create FastAPI app
 app = FastAPI(
     title=settings.APP_NAME,
@@ -41,7 +130,8 @@ app = FastAPI(
     debug=settings.DEBUG,
     docs_url="/api/docs",
     redoc_url="/api/redoc",
-    openapi_url="/api/openapi.json"
+    openapi_url="/api/openapi.json",
+    lifespan=lifespan
 )
 
 # Setup CORS
@@ -53,8 +143,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Add Gzip compression
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+# Add Gzip compression (skipped for server-sent event streams)
+app.add_middleware(StreamingAwareGZipMiddleware, minimum_size=1000)
 
 # Add custom middleware
 app.add_middleware(RequestLoggingMiddleware)
@@ -72,7 +162,7 @@ app.include_router(input.router, prefix="/api/input", tags=["Input"])
 app.include_router(planner.router, prefix="/api/planner", tags=["Planner"])
 app.include_router(stages.router, prefix="/api/stage", tags=["Stages"])
 app.include_router(validation.router, prefix="/api/validation", tags=["Validation"])
-# app.include_router(ra_system.router, prefix="/api/ra", tags=["RA System"])  # Disabled: HuggingFace network issue
+app.include_router(ra_system.router, prefix="/api/ra", tags=["RA System"])
 app.include_router(architecture.router, prefix="/api/architecture", tags=["Architecture"])
 app.include_router(nexus.router, prefix="/api/nexus", tags=["Nexus AI"])
 app.include_router(aidude.router, prefix="/api/aidude", tags=["AI Dude"])
@@ -103,7 +193,20 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    from app.core.ai_agents.shared import llm_gateway
+    from app.core.ra_system.safety_retrieval_engine import safety_retrieval_engine
+    from app.core.rag.faiss_vector_store import vector_store
+    from app.services.embedding_model_service import embedding_model_service
+    from app.services.retrieval_service import retrieval_service
+    return {
+        "status": "healthy",
+        "rag_index": vector_store.get_version_info(),
+        "query_cache": vector_store.get_cache_stats(),
+        "embedding_model": embedding_model_service.get_stats(),
+        "retrieval": retrieval_service.get_stats(),
+        "safety_index_cache": safety_retrieval_engine.cache.get_stats(),
+        "llm": llm_gateway.get_stats()
+    }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,112 @@
+import sys
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.config import settings
+from app.core.rag.chunk_store import open_chunk_store
+from app.core.rag.embedding_generator import (
+    ENCODER_BACKENDS,
+    check_parity,
+    create_encoder,
+    measure_throughput
+)
+from app.core.rag.index_versions import current_version, version_paths
+from app.services.model_bundle import enable_offline_mode, resolve_model_path
+
+
+def sample_texts(count: int) -> list:
+    """Manual chunks from the active index (what ingestion encodes), or filler text"""
+    version = current_version()
+    if version is not None:
+        try:
+            _, metadata_dir = version_paths(version)
+            store = open_chunk_store(str(metadata_dir))
+            if len(store):
+                rng = np.random.default_rng(0)
+                rows = rng.choice(len(store), size=min(count, len(store)), replace=False)
+                print(f"✅ Using {len(rows)} manual chunks from index version {version}")
+                return [store.chunk(int(row)) for row in rows]
+        except Exception as e:
+            print(f"⚠️  Could not read manual chunks ({e}); using synthetic text")
+
+    words = (
+        "the emergency stop relay must de-energize every output when the guard door "
+        "opens and the timer preset is reached before the conveyor motor restarts"
+    ).split()
+    rng = np.random.default_rng(0)
+    return [" ".join(rng.choice(words, size=120)) for _ in range(count)]
+
+
+def main():
+    """Compare encode throughput and numeric parity of the embedding backends"""
+    parser = argparse.ArgumentParser(description="Benchmark torch / ONNX / int8 ONNX embedding backends on CPU")
+    parser.add_argument("--backends", nargs="+", choices=ENCODER_BACKENDS, default=list(ENCODER_BACKENDS))
+    parser.add_argument("--texts", type=int, default=512, help="Chunks encoded per run")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32, 64],
+                        help="1 approximates query encoding, larger sizes ingestion")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=settings.EMBEDDING_ONNX_THREADS,
+                        help="ONNX Runtime intra-op threads (0 = one per core)")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("BENCHMARKING EMBEDDING BACKENDS")
+    print("=" * 60)
+
+    model_path = resolve_model_path()
+    enable_offline_mode()
+    texts = sample_texts(args.texts)
+
+    encoders = {}
+    for backend in args.backends:
+        try:
+            encoders[backend] = create_encoder(backend, model_path, threads=args.threads)
+        except FileNotFoundError as e:
+            print(f"⚠️  Skipping {backend}: {e}")
+
+    rows = []
+    for backend, encoder in encoders.items():
+        for batch_size in args.batch_sizes:
+            # Batch size 1 runs are slow; a smaller sample is enough
+            run_texts = texts[:64] if batch_size == 1 else texts
+            result = measure_throughput(encoder, run_texts, batch_size=batch_size, repeats=args.repeats)
+            rows.append(result)
+            print(f"  {backend:<10} batch {batch_size:>3}: {result['texts_per_second']:>8.1f} texts/s")
+
+    parity = []
+    reference = encoders.get("torch") or create_encoder("torch", model_path)
+    for backend, encoder in encoders.items():
+        if backend != "torch":
+            parity.append(check_parity(reference, encoder, texts[:256]))
+
+    print(f"\n{'Backend':<10} {'Batch':>5} {'Texts/s':>9} {'Speedup':>8} {'Model MB':>9}")
+    baseline = {row["batch_size"]: row["texts_per_second"] for row in rows if row["backend"] == "torch"}
+    for row in rows:
+        speedup = row["texts_per_second"] / baseline[row["batch_size"]] if baseline.get(row["batch_size"]) else 0.0
+        print(f"{row['backend']:<10} {row['batch_size']:>5} {row['texts_per_second']:>9.1f} "
+              f"{speedup:>7.2f}x {row['model_mb']:>9.1f}")
+
+    if parity:
+        print(f"\n{'Backend':<10} {'Min cos':>9} {'Mean cos':>9} {'Max diff':>9} {'NN agree':>9} {'Passed':>7}")
+        for result in parity:
+            print(f"{result['backend']:<10} {result['min_cosine']:>9.6f} {result['mean_cosine']:>9.6f} "
+                  f"{result['max_abs_diff']:>9.6f} {result['neighbour_agreement']:>9.4f} "
+                  f"{'yes' if result['passed'] else 'NO':>7}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"throughput": rows, "parity": parity}, f, indent=2)
+        print(f"\n💾 Results saved to: {args.output}")
+
+    sys.exit(0 if all(result["passed"] for result in parity) else 1)
+
+
+if __name__ == "__main__":
+    main()
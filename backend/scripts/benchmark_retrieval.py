@@ -0,0 +1,356 @@
+import sys
+import argparse
+import json
+import pickle
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.config import settings
+from app.core.rag.chunk_store import ChunkStoreWriter
+from app.core.rag.faiss_index_builder import (
+    INDEX_TYPES,
+    STORAGE_TYPES,
+    build_compact_index,
+    build_index,
+    index_type_of,
+    recall_at_k
+)
+from app.core.rag.faiss_vector_store import FAISSVectorStore
+from app.core.rag.semantic_retrieval_engine import SemanticRetrievalEngine
+from app.core.ra_system.safety_retrieval_engine import SafetyRetrievalEngine
+from app.services.embedding_model_service import embedding_model_service
+
+# Context queries sent by the code generator, validator and segregator
+REPLAY_QUERIES = {
+    "codegen": [
+        "FX5U Structured Text syntax rules",
+        "Mitsubishi device symbols M D X Y",
+        "GX Works3 program structure global local labels"
+    ],
+    "validator": [
+        "PLC safety requirements interlocks",
+        "FX5U device constraints limits",
+        "Structured Text programming rules"
+    ],
+    "segregator": [
+        "PLC stage programming control flow stages"
+    ]
+}
+
+# Manual types (sorted by name, as chunk_type_names.json is) and their
+# share of the synthetic corpus
+SYNTHETIC_TYPES = [("Datatype_Rules", 0.10), ("FX5U", 0.45), ("GX_Works3", 0.45)]
+
+VOCABULARY = (
+    "device relay timer counter interlock emergency stop conveyor motor sensor "
+    "label global local program block function structured text instruction "
+    "register word bit double float string array output input coil contact "
+    "safety guard door reset alarm stage sequence cycle parameter constant"
+).split()
+
+
+def current_rss_mb() -> float:
+    rss = embedding_model_service.get_stats()["current_rss_bytes"]
+    return round(rss / (1024 * 1024), 1) if rss else 0.0
+
+
+def latency_summary(latencies, total_seconds: float) -> dict:
+    """p50/p95/p99 latency in ms plus calls per second"""
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        "throughput_qps": round(len(latencies) / total_seconds, 1) if total_seconds else 0.0
+    }
+
+
+def timed_calls(fn, queries, repeats: int, before_each=None) -> dict:
+    """Call fn(query) for every query, repeats times, and summarize latency"""
+    latencies = []
+    total_start = time.perf_counter()
+    for _ in range(repeats):
+        for query in queries:
+            if before_each is not None:
+                before_each()
+            start = time.perf_counter()
+            fn(query)
+            latencies.append(time.perf_counter() - start)
+    return latency_summary(latencies, time.perf_counter() - total_start)
+
+
+# ----------------------------------------------------------------------
+# Synthetic corpora
+# ----------------------------------------------------------------------
+
+def cluster_centres(dimension: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Real manual chunk vectors when a reconstructable manual index exists,
+    so the synthetic corpus has the same geometry as the real one;
+    random directions otherwise
+    """
+    index_path = Path(settings.EMBEDDINGS_PATH) / "faiss_index" / "manual_index.faiss"
+    if index_path.exists():
+        index = faiss.read_index(str(index_path))
+        if index.d == dimension and index_type_of(index) in ("flat", "hnsw") and index.ntotal:
+            return index.reconstruct_n(0, min(index.ntotal, 5000))
+
+    centres = rng.standard_normal((512, dimension)).astype('float32')
+    return centres / np.linalg.norm(centres, axis=1, keepdims=True)
+
+
+def synthetic_vectors(num_chunks: int, centres: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Unit vectors scattered around the cluster centres"""
+    dimension = centres.shape[1]
+    vectors = np.empty((num_chunks, dimension), dtype='float32')
+    block = 100000
+    for start in range(0, num_chunks, block):
+        end = min(start + block, num_chunks)
+        picks = centres[rng.integers(0, len(centres), size=end - start)]
+        noise = rng.standard_normal((end - start, dimension)).astype('float32') * (0.5 / np.sqrt(dimension))
+        rows = picks + noise
+        vectors[start:end] = rows / np.linalg.norm(rows, axis=1, keepdims=True)
+    return vectors
+
+
+def synthetic_text(i: int, manual_type: str, rng: np.random.Generator) -> str:
+    words = rng.choice(VOCABULARY, size=40)
+    return f"[{manual_type} synthetic chunk {i}] " + " ".join(words)
+
+
+def write_manual_corpus(directory: Path, vectors: np.ndarray, index_type: str, rng, **build_options) -> dict:
+    """Write a manual index + chunk store laid out like process_manuals.py output"""
+    metadata_dir = directory / "metadata"
+    faiss_dir = directory / "faiss_index"
+    faiss_dir.mkdir(parents=True, exist_ok=True)
+
+    num_chunks = len(vectors)
+    type_codes = np.empty(num_chunks, dtype='int16')
+    type_names = [name for name, _ in SYNTHETIC_TYPES]
+
+    with ChunkStoreWriter(str(metadata_dir)) as writer:
+        start = 0
+        for code, (manual_type, share) in enumerate(SYNTHETIC_TYPES):
+            end = num_chunks if code == len(SYNTHETIC_TYPES) - 1 else start + int(num_chunks * share)
+            for i in range(start, end):
+                writer.append(synthetic_text(i, manual_type, rng), {
+                    "source": f"synthetic_{manual_type}.pdf",
+                    "type": manual_type,
+                    "chunk_id": i - start
+                })
+            type_codes[start:end] = code
+            start = end
+
+    np.save(metadata_dir / "chunk_types.npy", type_codes)
+    with open(metadata_dir / "chunk_type_names.json", 'w', encoding='utf-8') as f:
+        json.dump(type_names, f)
+
+    build_start = time.perf_counter()
+    index = build_index(vectors, index_type, **build_options)
+    build_seconds = time.perf_counter() - build_start
+
+    index_path = faiss_dir / "manual_index.faiss"
+    faiss.write_index(index, str(index_path))
+    return {
+        "build_seconds": round(build_seconds, 2),
+        "index_mb": round(index_path.stat().st_size / (1024 * 1024), 1)
+    }
+
+
+# ----------------------------------------------------------------------
+# Benchmarks
+# ----------------------------------------------------------------------
+
+def benchmark_manual_store(work_dir: Path, vectors, queries, query_vectors, args, rng) -> list:
+    """FAISSVectorStore and SemanticRetrievalEngine for each index type"""
+    _, reference_ids = build_index(vectors, "flat").search(query_vectors, args.k)
+
+    rows = []
+    for index_type in args.index_types:
+        directory = work_dir / f"manual_{index_type}"
+        print(f"\n🔄 {index_type}: building over {len(vectors)} chunks...")
+        build = write_manual_corpus(directory, vectors, index_type, rng, nlist=args.nlist)
+
+        store = FAISSVectorStore(str(directory))
+        store.set_search_params(nprobe=args.nprobe, ef_search=args.ef_search)
+        load_start = time.perf_counter()
+        store.load()
+        load_seconds = time.perf_counter() - load_start
+        engine = SemanticRetrievalEngine(store)
+
+        results = store.search_many(queries, top_k=args.k)
+        candidate_ids = np.array([
+            [r["id"] for r in hits] + [-1] * (args.k - len(hits)) for hits in results
+        ])
+
+        row = {
+            "target": "FAISSVectorStore",
+            "index_type": index_type,
+            "chunks": len(vectors),
+            "recall_at_k": round(recall_at_k(reference_ids, candidate_ids, args.k), 4),
+            "load_seconds": round(load_seconds, 3),
+            **build
+        }
+
+        uncached = timed_calls(
+            lambda q: store.search(q, top_k=args.k), queries, args.repeats, before_each=store.cache.clear
+        )
+        cached = timed_calls(lambda q: store.search(q, top_k=args.k), queries, args.repeats)
+        filtered = timed_calls(
+            lambda q: store.search(q, top_k=args.k, filter_type="FX5U"),
+            queries, args.repeats, before_each=store.cache.clear
+        )
+        rows.append({**row, "mode": "uncached", **uncached, "rss_mb": current_rss_mb()})
+        rows.append({**row, "mode": "cached", **cached, "rss_mb": current_rss_mb()})
+        rows.append({**row, "mode": "filtered", **filtered, "rss_mb": current_rss_mb()})
+
+        # Whole context build as the generator / validator issue it
+        context_sets = [REPLAY_QUERIES["codegen"], REPLAY_QUERIES["validator"]]
+        context = timed_calls(
+            lambda qs: engine.retrieve_context_many(qs, max_chunks=2),
+            context_sets, args.repeats, before_each=store.cache.clear
+        )
+        rows.append({
+            **row, "target": "SemanticRetrievalEngine", "mode": "context_many",
+            **context, "rss_mb": current_rss_mb()
+        })
+
+        if not args.keep:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    return rows
+
+
+def benchmark_safety_engine(work_dir: Path, centres, queries, query_vectors, args, rng) -> list:
+    """SafetyRetrievalEngine load / retrieve per storage type, plus cache behaviour"""
+    directory = work_dir / "safety_manuals"
+    directory.mkdir(parents=True, exist_ok=True)
+
+    rows = []
+    for storage in args.storage_types:
+        engine = SafetyRetrievalEngine()
+        recalls, load_times = [], []
+
+        for project_id in range(1, args.safety_projects + 1):
+            vectors = synthetic_vectors(args.safety_chunks, centres, rng)
+            chunks = [synthetic_text(i, "Safety", rng) for i in range(args.safety_chunks)]
+
+            index = build_compact_index(vectors, storage, pca_dim=args.pca_dim or None)
+            faiss.write_index(index, str(directory / f"safety_manual_{project_id}.faiss"))
+            with open(directory / f"safety_manual_{project_id}_chunks.pkl", 'wb') as f:
+                pickle.dump(chunks, f)
+            with open(directory / f"safety_manual_{project_id}_metadata.json", 'w') as f:
+                json.dump({"project_id": project_id, "total_chunks": len(chunks)}, f)
+
+            start = time.perf_counter()
+            engine.load_safety_manual(project_id, str(directory))
+            load_times.append(time.perf_counter() - start)
+
+            _, reference_ids = build_index(vectors, "flat").search(query_vectors, args.k)
+            _, candidate_ids = index.search(query_vectors, args.k)
+            recalls.append(recall_at_k(reference_ids, candidate_ids, args.k))
+
+        # Replay against the most recently loaded project (a cache hit)
+        project_id = args.safety_projects
+        timings = timed_calls(
+            lambda q: engine.retrieve(project_id, q, top_k=args.k), queries, args.repeats
+        )
+        cache_stats = engine.cache.get_stats()
+        rows.append({
+            "target": "SafetyRetrievalEngine",
+            "index_type": storage + (f"+pca{args.pca_dim}" if args.pca_dim else ""),
+            "chunks": args.safety_chunks,
+            "mode": "retrieve",
+            "recall_at_k": round(float(np.mean(recalls)), 4),
+            "load_seconds": round(float(np.mean(load_times)), 4),
+            "cached_projects": cache_stats["entries"],
+            "cache_mb": round(cache_stats["total_bytes"] / (1024 * 1024), 1),
+            "evictions": cache_stats["evictions"],
+            **timings,
+            "rss_mb": current_rss_mb()
+        })
+
+    if not args.keep:
+        shutil.rmtree(directory, ignore_errors=True)
+    return rows
+
+
+def print_rows(rows: list):
+    print(f"\n{'Target':<24} {'Index':<14} {'Mode':<13} {'Chunks':>9} {'Recall':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'QPS':>8} {'RSS MB':>8}")
+    for row in rows:
+        print(f"{row['target']:<24} {row['index_type']:<14} {row['mode']:<13} {row['chunks']:>9} "
+              f"{row['recall_at_k']:>7.4f} {row['p50_ms']:>8.3f} {row['p95_ms']:>8.3f} "
+              f"{row['p99_ms']:>8.3f} {row['throughput_qps']:>8.1f} {row['rss_mb']:>8.1f}")
+
+
+def main():
+    """Benchmark retrieval latency, throughput, memory and recall"""
+    parser = argparse.ArgumentParser(description="Benchmark manual and safety retrieval on synthetic corpora")
+    parser.add_argument("--chunks", type=int, nargs="+", default=[10000, 100000],
+                        help="Synthetic manual corpus sizes (e.g. 10000 100000 1000000)")
+    parser.add_argument("--index-types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, default=settings.RAG_IVF_NPROBE)
+    parser.add_argument("--ef-search", type=int, default=settings.RAG_HNSW_EF_SEARCH)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=20, help="Times each replayed query is issued")
+    parser.add_argument("--queries-file", help="Recorded queries, one per line (added to the replay set)")
+    parser.add_argument("--safety-projects", type=int, default=20)
+    parser.add_argument("--safety-chunks", type=int, default=500)
+    parser.add_argument("--storage-types", nargs="+", choices=STORAGE_TYPES, default=list(STORAGE_TYPES))
+    parser.add_argument("--pca-dim", type=int, default=0)
+    parser.add_argument("--skip-safety", action="store_true")
+    parser.add_argument("--work-dir", help="Where synthetic corpora are written (default: temp dir)")
+    parser.add_argument("--keep", action="store_true", help="Keep the synthetic corpora")
+    parser.add_argument("--output", help="Also write the rows as JSON to this file")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("BENCHMARKING RETRIEVAL")
+    print("=" * 60)
+
+    queries = [q for group in REPLAY_QUERIES.values() for q in group]
+    if args.queries_file:
+        with open(args.queries_file, 'r', encoding='utf-8') as f:
+            queries.extend(line.strip() for line in f if line.strip())
+    print(f"\n✅ Replaying {len(queries)} queries x {args.repeats}")
+
+    query_vectors = embedding_model_service.encode(queries)
+    rng = np.random.default_rng(0)
+    centres = cluster_centres(query_vectors.shape[1], rng)
+
+    work_dir = Path(args.work_dir or tempfile.mkdtemp(prefix="retrieval_bench_"))
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    rows = []
+    try:
+        for num_chunks in args.chunks:
+            vectors = synthetic_vectors(num_chunks, centres, rng)
+            rows.extend(benchmark_manual_store(work_dir, vectors, queries, query_vectors, args, rng))
+            del vectors
+
+        if not args.skip_safety:
+            rows.extend(benchmark_safety_engine(work_dir, centres, queries, query_vectors, args, rng))
+    finally:
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_rows(rows)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=2)
+        print(f"\n💾 Results saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import sys
+import argparse
+import pickle
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.config import settings
+from app.core.rag.faiss_index_builder import STORAGE_TYPES, evaluate_storage_types
+from app.services.embedding_model_service import embedding_model_service
+
+
+def load_project_chunks(project_id: int, embeddings_dir: Path) -> list:
+    """Chunk texts of an uploaded project safety manual"""
+    chunks_file = embeddings_dir / f"safety_manual_{project_id}_chunks.pkl"
+    with open(chunks_file, 'rb') as f:
+        return pickle.load(f)
+
+
+def main():
+    """Compare memory and recall of safety index storage encodings"""
+    parser = argparse.ArgumentParser(description="Benchmark quantized / PCA-reduced safety index storage")
+    parser.add_argument("--project-id", type=int, action="append",
+                        help="Project whose safety manual to use (repeatable, default: all)")
+    parser.add_argument("--queries-file", help="Text file with one query per line (default: sampled chunks)")
+    parser.add_argument("--sample-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--pca-dims", type=int, nargs="*", default=[0, 192, 128, 64],
+                        help="PCA output dimensions to try (0 = no PCA)")
+    parser.add_argument("--pq-m", type=int, default=16)
+    args = parser.parse_args()
+
+    embeddings_dir = Path(settings.EMBEDDINGS_PATH) / 'safety_manuals'
+    project_ids = args.project_id or sorted(
+        int(path.stem.rsplit("_", 1)[1])
+        for path in embeddings_dir.glob("safety_manual_*.faiss")
+        if path.stem.rsplit("_", 1)[1].isdigit()
+    )
+
+    if not project_ids:
+        print(f"\n❌ ERROR: No project safety manuals found in {embeddings_dir}")
+        return
+
+    print("=" * 60)
+    print("BENCHMARKING SAFETY INDEX STORAGE")
+    print("=" * 60)
+
+    chunks = []
+    for project_id in project_ids:
+        chunks.extend(load_project_chunks(project_id, embeddings_dir))
+    print(f"\n✅ {len(chunks)} chunks from {len(project_ids)} project(s)")
+
+    embeddings = embedding_model_service.encode_documents(chunks)
+
+    if args.queries_file:
+        with open(args.queries_file, 'r', encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+        query_embeddings = embedding_model_service.encode(queries)
+    else:
+        rng = np.random.default_rng(0)
+        sample = rng.choice(len(embeddings), size=min(args.sample_queries, len(embeddings)), replace=False)
+        query_embeddings = embeddings[sample]
+
+    rows = evaluate_storage_types(
+        embeddings,
+        query_embeddings,
+        k=args.k,
+        storage_types=STORAGE_TYPES,
+        pca_dims=[dim or None for dim in args.pca_dims],
+        pq_m=args.pq_m
+    )
+
+    print(f"\n{'Storage':<10} {'PCA':>6} {'Bytes':>12} {'Saved %':>9} {'Recall@' + str(args.k):>10}")
+    for row in rows:
+        print(f"{row['storage']:<10} {row['pca_dim'] or '-':>6} {row['memory_bytes']:>12} "
+              f"{row['memory_saved_pct']:>9.2f} {row['recall_at_k']:>10.4f}")
+
+    print("\nSet SAFETY_INDEX_STORAGE / SAFETY_INDEX_PCA_DIM to apply a setting to new uploads.")
+
+
+if __name__ == "__main__":
+    main()
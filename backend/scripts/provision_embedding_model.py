@@ -0,0 +1,166 @@
+import sys
+import argparse
+import shutil
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.config import settings
+from app.core.rag.embedding_generator import (
+    ONNX_DIR,
+    check_parity,
+    create_encoder,
+    export_onnx,
+    quantize_onnx
+)
+from app.services.model_bundle import (
+    MANIFEST_FILE,
+    bundle_dir,
+    enable_offline_mode,
+    read_manifest,
+    verify_bundle,
+    write_manifest
+)
+
+# Parity sample: the kind of text the encoder sees at ingestion and query time
+PARITY_TEXTS = [
+    "FX5U Structured Text syntax rules",
+    "Mitsubishi device symbols M D X Y",
+    "GX Works3 program structure global local labels",
+    "PLC safety requirements interlocks",
+    "The emergency stop circuit must de-energize all outputs independently of the PLC program.",
+    "Guard door switches shall be monitored and the machine must not restart automatically after a reset.",
+    "IF X0 AND NOT X1 THEN Y0 := TRUE; END_IF; CASE D0 OF 0: Y2 := TRUE; END_CASE;",
+    "Timers TON and TOF take a preset time PT of type TIME, for example T#5s.",
+    "Word devices D0 to D7999 store 16-bit signed integers; use DINT for 32-bit values.",
+    "Conveyor motor overload relays must be wired to a safety input and latch an alarm."
+]
+
+
+def check_loads(directory: Path) -> int:
+    """Load the bundle offline and return its embedding dimension"""
+    enable_offline_mode()
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(str(directory))
+    embedding = model.encode(["emergency stop interlock"])
+    return int(embedding.shape[1])
+
+
+def add_onnx(directory: Path) -> bool:
+    """Export the bundle to ONNX, quantize it to int8 and check both against PyTorch"""
+    enable_offline_mode()
+    print("🔄 Exporting to ONNX...")
+    export_onnx(str(directory))
+    print("🔄 Quantizing to int8...")
+    quantize_onnx(str(directory))
+
+    reference = create_encoder("torch", str(directory))
+    ok = True
+    for backend in ("onnx", "onnx_int8"):
+        parity = check_parity(reference, create_encoder(backend, str(directory)), PARITY_TEXTS)
+        mark = "✅" if parity["passed"] else "❌"
+        print(f"{mark} {backend}: min cosine {parity['min_cosine']} (threshold {parity['threshold']}), "
+              f"neighbour agreement {parity['neighbour_agreement']}")
+        ok = ok and parity["passed"]
+
+    if not ok:
+        print("\n❌ ONNX exports do not match the PyTorch model; removing them")
+        shutil.rmtree(directory / ONNX_DIR, ignore_errors=True)
+    return ok
+
+
+def provision(model_name: str, source_dir: str = None, force: bool = False, onnx: bool = False) -> bool:
+    """Create the local bundle for a model"""
+    target = bundle_dir(model_name)
+    if (target / MANIFEST_FILE).exists() and not force:
+        if not onnx:
+            print(f"\n✅ Bundle already exists: {target} (use --force to replace it)")
+            return verify(model_name)
+
+        # Add ONNX exports to the existing bundle and re-sign it
+        if not verify(model_name) or not add_onnx(target):
+            return False
+        write_manifest(target, model_name, read_manifest(target)["dimension"])
+        print(f"\n✅ ONNX exports added to {target}")
+        return True
+
+    staging = target.with_name(f"{target.name}.partial")
+    shutil.rmtree(staging, ignore_errors=True)
+
+    if source_dir:
+        # Air-gapped install: copy a saved model brought in on removable media
+        print(f"\n🔄 Copying model from {source_dir}...")
+        shutil.copytree(source_dir, staging)
+        (staging / MANIFEST_FILE).unlink(missing_ok=True)
+    else:
+        print(f"\n🔄 Downloading {model_name} from HuggingFace...")
+        from sentence_transformers import SentenceTransformer
+        SentenceTransformer(model_name).save(str(staging))
+
+    print("🔄 Checking the model loads offline...")
+    dimension = check_loads(staging)
+    if dimension != settings.EMBEDDING_DIMENSION:
+        print(f"\n❌ Model dimension {dimension} does not match EMBEDDING_DIMENSION={settings.EMBEDDING_DIMENSION}")
+        shutil.rmtree(staging, ignore_errors=True)
+        return False
+
+    if onnx and not add_onnx(staging):
+        shutil.rmtree(staging, ignore_errors=True)
+        return False
+
+    manifest = write_manifest(staging, model_name, dimension)
+
+    # Swap the finished bundle into place
+    shutil.rmtree(target, ignore_errors=True)
+    staging.rename(target)
+
+    total_mb = sum(entry["size"] for entry in manifest["files"].values()) / (1024 * 1024)
+    print(f"\n✅ Bundle ready: {target}")
+    print(f"   - Files: {len(manifest['files'])} ({total_mb:.1f} MB)")
+    print(f"   - Dimension: {dimension}")
+    return True
+
+
+def verify(model_name: str) -> bool:
+    """Check a bundle against its checksum manifest"""
+    target = bundle_dir(model_name)
+    print(f"\n🔍 Verifying {target}...")
+
+    problems = verify_bundle(target)
+    if problems:
+        print("\n❌ Bundle is not usable:")
+        for problem in problems:
+            print(f"   - {problem}")
+        return False
+
+    print("✅ All checksums match")
+    return True
+
+
+def main():
+    """Provision or verify the bundled embedding model"""
+    parser = argparse.ArgumentParser(description="Provision the local embedding model bundle in data/models")
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL_NAME, help="Model to bundle")
+    parser.add_argument("--from-dir", help="Copy a saved SentenceTransformer directory instead of downloading")
+    parser.add_argument("--verify", action="store_true", help="Only verify the existing bundle")
+    parser.add_argument("--force", action="store_true", help="Replace an existing bundle")
+    parser.add_argument("--onnx", action="store_true",
+                        help="Also export ONNX and int8 ONNX encoders (for EMBEDDING_BACKEND=onnx / onnx_int8)")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("EMBEDDING MODEL BUNDLE")
+    print("=" * 60)
+
+    if args.verify:
+        ok = verify(args.model)
+    else:
+        ok = provision(args.model, args.from_dir, args.force, args.onnx)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import sys
+import argparse
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.core.rag.knowledge_base_updater import knowledge_base_updater
+
+MANUAL_TYPES = ["FX5U", "GX_Works3", "Datatype_Rules"]
+
+
+def main():
+    """Add, remove or replace a single manual in the RAG index"""
+    parser = argparse.ArgumentParser(description="Incrementally update the manual RAG index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    add_parser = subparsers.add_parser("add", help="Add a new manual")
+    add_parser.add_argument("file", help="PDF or TXT manual")
+    add_parser.add_argument("--type", choices=MANUAL_TYPES, required=True)
+    
+    replace_parser = subparsers.add_parser("replace", help="Replace a manual with a new revision")
+    replace_parser.add_argument("file", help="PDF or TXT manual (same file name as the indexed one)")
+    replace_parser.add_argument("--type", choices=MANUAL_TYPES, required=True)
+    
+    remove_parser = subparsers.add_parser("remove", help="Remove a manual")
+    remove_parser.add_argument("source", help="File name of the indexed manual")
+    
+    args = parser.parse_args()
+    
+    print("=" * 60)
+    print(f"UPDATING KNOWLEDGE BASE ({args.command.upper()})")
+    print("=" * 60)
+    
+    try:
+        if args.command == "add":
+            result = knowledge_base_updater.add_manual(args.file, args.type)
+        elif args.command == "replace":
+            result = knowledge_base_updater.replace_manual(args.file, args.type)
+        else:
+            result = knowledge_base_updater.remove_manual(args.source)
+    except (ValueError, FileNotFoundError) as e:
+        print(f"\n❌ ERROR: {e}")
+        return
+    
+    print("\n✅ SUCCESS!")
+    print(f"   - Chunks removed: {result['chunks_removed']}")
+    print(f"   - Chunks added: {result['chunks_added']}")
+    print(f"   - Chunks embedded: {result['chunks_embedded']}")
+    print(f"   - Total chunks: {result['total_chunks']}")
+    print(f"   - Published version: {result['version']}")
+
+
+if __name__ == "__main__":
+    main()
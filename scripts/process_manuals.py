@@ -10,65 +10,80 @@ load_dotenv(dotenv_path=env_path)
 sys.path.append(str(backend_dir))
 
 import os
-from typing import List
+import argparse
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
 import PyPDF2
-from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
 import json
-import pickle
+from app.services.embedding_model_service import embedding_model_service
+from app.core.rag.chunk_store import ChunkStoreWriter, write_chunk_store
+from app.core.rag.faiss_index_builder import (
+    INDEX_TYPES,
+    StreamingIndexBuilder,
+    build_index,
+    evaluate_index_types
+)
+from app.core.rag.document_chunking_service import DocumentChunker, Page, iter_document_pages
+from app.core.rag.embedding_cache import chunk_hash
+from app.core.rag.index_versions import IndexVersionWriter
 
 # Get paths from environment
 MANUALS_PATH = Path(root_dir) / "data" / "manuals"
 EMBEDDINGS_PATH = Path(root_dir) / "data" / "embeddings"
 
+# Context queries sent by the code generator, validator and segregator
+REPORT_QUERIES = [
+    "FX5U Structured Text syntax rules",
+    "Mitsubishi device symbols M D X Y",
+    "GX Works3 program structure global local labels",
+    "PLC safety requirements interlocks",
+    "FX5U device constraints limits",
+    "Structured Text programming rules",
+    "PLC stage programming control flow stages"
+]
+
 
 class ManualProcessor:
     def __init__(self):
-        print("🔄 Loading embedding model...")
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.dimension = 384  # Dimension of all-MiniLM-L6-v2
+        # The model itself is loaded on first encode
+        self.model = embedding_model_service
         self.chunks = []
         self.metadata = []
-        
-    def extract_text_from_pdf(self, pdf_path: Path) -> str:
-        """Extract text from PDF file"""
-        print(f"  📄 Reading: {pdf_path.name}")
-        text = ""
-        try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page_num, page in enumerate(pdf_reader.pages):
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += f"\n--- Page {page_num + 1} ---\n"
-                        text += page_text
-            return text
-        except Exception as e:
-            print(f"  ❌ Error reading {pdf_path.name}: {e}")
-            return ""
     
-    def extract_text_from_txt(self, txt_path: Path) -> str:
-        """Extract text from TXT file"""
-        print(f"  📄 Reading: {txt_path.name}")
+    @property
+    def dimension(self) -> int:
+        return self.model.dimension
+        
+    def chunk_file(self, file_path: Path, manual_type: str, chunk_size: int = 500):
+        """Chunk one manual page by page and record its chunks"""
+        print(f"  📄 Reading: {file_path.name}")
+        chunker = DocumentChunker(chunk_size=chunk_size, overlap=50)
+        first = len(self.chunks)
+        
         try:
-            with open(txt_path, 'r', encoding='utf-8') as file:
-                return file.read()
+            for i, (chunk, location) in enumerate(chunker.chunk_file(file_path)):
+                self.chunks.append(chunk)
+                self.metadata.append({
+                    "source": file_path.name,
+                    "type": manual_type,
+                    "chunk_id": i,
+                    **location,
+                    "hash": chunk_hash(chunk)
+                })
         except Exception as e:
-            print(f"  ❌ Error reading {txt_path.name}: {e}")
-            return ""
-    
-    def chunk_text(self, text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
-        """Split text into overlapping chunks"""
-        words = text.split()
-        chunks = []
-        
-        for i in range(0, len(words), chunk_size - overlap):
-            chunk = ' '.join(words[i:i + chunk_size])
-            if chunk.strip():
-                chunks.append(chunk)
+            print(f"  ❌ Error reading {file_path.name}: {e}")
+            del self.chunks[first:], self.metadata[first:]
+            return
         
-        return chunks
+        for meta in self.metadata[first:]:
+            meta["total_chunks"] = len(self.chunks) - first
+        print(f"    ✅ Created {len(self.chunks) - first} chunks from {file_path.name}")
     
     def process_manual_folder(self, folder_path: Path, manual_type: str):
         """Process all manuals in a folder"""
@@ -78,39 +93,9 @@ class ManualProcessor:
             print(f"  ⚠️  Folder not found: {folder_path}")
             return
         
-        # Process PDF files
-        pdf_files = list(folder_path.glob("*.pdf"))
-        for pdf_file in pdf_files:
-            text = self.extract_text_from_pdf(pdf_file)
-            if text:
-                chunks = self.chunk_text(text)
-                print(f"    ✅ Created {len(chunks)} chunks from {pdf_file.name}")
-                
-                for i, chunk in enumerate(chunks):
-                    self.chunks.append(chunk)
-                    self.metadata.append({
-                        "source": pdf_file.name,
-                        "type": manual_type,
-                        "chunk_id": i,
-                        "total_chunks": len(chunks)
-                    })
-        
-        # Process TXT files
-        txt_files = list(folder_path.glob("*.txt"))
-        for txt_file in txt_files:
-            text = self.extract_text_from_txt(txt_file)
-            if text:
-                chunks = self.chunk_text(text)
-                print(f"    ✅ Created {len(chunks)} chunks from {txt_file.name}")
-                
-                for i, chunk in enumerate(chunks):
-                    self.chunks.append(chunk)
-                    self.metadata.append({
-                        "source": txt_file.name,
-                        "type": manual_type,
-                        "chunk_id": i,
-                        "total_chunks": len(chunks)
-                    })
+        # Process PDF files, then TXT files
+        for file_path in list(folder_path.glob("*.pdf")) + list(folder_path.glob("*.txt")):
+            self.chunk_file(file_path, manual_type)
     
     def create_embeddings(self):
         """Create embeddings for all chunks"""
@@ -119,51 +104,309 @@ class ManualProcessor:
             return None
         
         print(f"\n🔄 Creating embeddings for {len(self.chunks)} chunks...")
-        embeddings = self.model.encode(self.chunks, show_progress_bar=True)
+        embeddings = self.model.encode_documents(self.chunks, show_progress_bar=True)
         print(f"✅ Embeddings created: shape {embeddings.shape}")
         return embeddings
     
-    def create_faiss_index(self, embeddings):
-        """Create FAISS index"""
-        print("\n🔄 Creating FAISS index...")
-        index = faiss.IndexFlatL2(self.dimension)
-        index.add(embeddings.astype('float32'))
+    def create_faiss_index(self, embeddings, index_type: str = "flat", **build_options):
+        """Create FAISS index of the requested type"""
+        print(f"\n🔄 Creating FAISS index ({index_type})...")
+        index = build_index(embeddings, index_type, **build_options)
         print(f"✅ FAISS index created with {index.ntotal} vectors")
         return index
     
-    def save_index(self, index):
-        """Save FAISS index and metadata"""
-        # Create directories
-        faiss_dir = EMBEDDINGS_PATH / "faiss_index"
-        metadata_dir = EMBEDDINGS_PATH / "metadata"
-        faiss_dir.mkdir(parents=True, exist_ok=True)
-        metadata_dir.mkdir(parents=True, exist_ok=True)
+    def report_index_types(self, embeddings, k: int = 5, sample_queries: int = 200, **build_options):
+        """Print recall@k and latency of every index type against the flat baseline"""
+        print(f"\n📊 Comparing index types (recall@{k} vs flat baseline)...")
+        
+        # Real context queries plus a sample of chunk vectors as queries
+        rng = np.random.default_rng(0)
+        sample = rng.choice(len(embeddings), size=min(sample_queries, len(embeddings)), replace=False)
+        query_embeddings = np.vstack([
+            self.model.encode(REPORT_QUERIES),
+            embeddings[sample]
+        ])
+        
+        rows = evaluate_index_types(embeddings, query_embeddings, k=k, **build_options)
+        
+        print(f"\n{'Index':<10} {'Recall@' + str(k):>10} {'Mean ms':>10} {'P95 ms':>10} {'Build s':>10}")
+        for row in rows:
+            print(f"{row['index_type']:<10} {row['recall_at_k']:>10.4f} "
+                  f"{row['mean_latency_ms']:>10.4f} {row['p95_latency_ms']:>10.4f} "
+                  f"{row['build_seconds']:>10.3f}")
+        return rows
+    
+    def save_index(self, index, index_type: str = "flat"):
+        """Save FAISS index and metadata as a new index version"""
+        # Running servers pick the version up once it is published
+        version = IndexVersionWriter(str(EMBEDDINGS_PATH))
+        metadata_dir = version.metadata_dir
         
         # Save FAISS index
-        index_path = faiss_dir / "manual_index.faiss"
-        faiss.write_index(index, str(index_path))
-        print(f"\n💾 FAISS index saved to: {index_path}")
+        faiss.write_index(index, str(version.index_path))
+        print(f"\n💾 FAISS index saved to: {version.index_path}")
         
-        # Save chunks
-        chunks_path = metadata_dir / "chunks.pkl"
-        with open(chunks_path, 'wb') as f:
-            pickle.dump(self.chunks, f)
-        print(f"💾 Chunks saved to: {chunks_path}")
+        # Save chunks and metadata as a memory-mappable chunk store
+        write_chunk_store(str(metadata_dir), self.chunks, self.metadata)
+        print(f"💾 Chunks and metadata saved to: {metadata_dir}")
         
-        # Save metadata
-        metadata_path = metadata_dir / "metadata.json"
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(self.metadata, f, indent=2)
-        print(f"💾 Metadata saved to: {metadata_path}")
+        # Save integer type array for type-filtered search
+        save_type_array(metadata_dir, [m["type"] for m in self.metadata])
         
-        print("\n✅ All RAG components saved successfully!")
+        version.publish(
+            index_type=index_type,
+            total_chunks=len(self.chunks),
+            dimension=index.d,
+            sources=sorted(set(m["source"] for m in self.metadata))
+        )
+        print(f"\n✅ All RAG components saved successfully! (version {version.version})")
+
+
+def save_type_array(metadata_dir: Path, chunk_type_list: List[str]):
+    """Save the integer chunk type array and its type names"""
+    type_names = sorted(set(chunk_type_list))
+    code_of = {name: code for code, name in enumerate(type_names)}
+    chunk_types = np.array([code_of[t] for t in chunk_type_list], dtype='int16')
+    np.save(metadata_dir / "chunk_types.npy", chunk_types)
+    with open(metadata_dir / "chunk_type_names.json", 'w', encoding='utf-8') as f:
+        json.dump(type_names, f)
+    print(f"💾 Type partitions saved: {', '.join(type_names)}")
+
+
+def extract_pdf_page_range(pdf_path: str, start: int, end: int) -> List[Page]:
+    """Extract pages [start, end) of a PDF (runs in a worker process)"""
+    pages = []
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        for page_num in range(start, end):
+            pages.append((page_num + 1, pdf_reader.pages[page_num].extract_text() or ""))
+    return pages
+
+
+class PipelinedManualProcessor:
+    """
+    Streaming ingestion: PDF pages are extracted in a process pool, chunks
+    flow through a bounded queue into batched encoding, and vectors are
+    appended to the index and chunk store batch by batch.
+    """
+    
+    def __init__(
+        self,
+        workers: int = None,
+        pages_per_task: int = 8,
+        batch_size: int = 256,
+        queue_size: int = 2048,
+        encode_processes: int = 0
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.pages_per_task = pages_per_task
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.encode_processes = encode_processes
+        self.model = embedding_model_service
+        self.pages = 0
+        self.chunks = 0
+    
+    def iter_pages(self, executor: ProcessPoolExecutor, file_path: Path) -> Iterator[Page]:
+        """Pages of a manual in order, with a bounded number of pages in flight"""
+        if file_path.suffix.lower() != '.pdf':
+            for page in iter_document_pages(str(file_path)):
+                self.pages += 1
+                yield page
+            return
+        
+        with open(file_path, 'rb') as file:
+            num_pages = len(PyPDF2.PdfReader(file).pages)
+        
+        pending = deque()
+        for start in range(0, num_pages, self.pages_per_task):
+            end = min(start + self.pages_per_task, num_pages)
+            pending.append(executor.submit(extract_pdf_page_range, str(file_path), start, end))
+            if len(pending) >= self.workers * 2:
+                for page in pending.popleft().result():
+                    self.pages += 1
+                    yield page
+        
+        while pending:
+            for page in pending.popleft().result():
+                self.pages += 1
+                yield page
+    
+    @staticmethod
+    def _put(chunk_queue: queue.Queue, item, stop: threading.Event) -> bool:
+        """Queue an item, giving up once the consumer has stopped"""
+        while not stop.is_set():
+            try:
+                chunk_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _produce(
+        self,
+        sources: List[Tuple[Path, str, int]],
+        chunk_queue: queue.Queue,
+        errors: List,
+        stop: threading.Event
+    ):
+        """Extraction + chunking stage (runs in its own thread until done or stopped)"""
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                for file_path, manual_type, chunk_size in sources:
+                    print(f"  📄 Streaming: {file_path.name}")
+                    pages = self.iter_pages(executor, file_path)
+                    chunker = DocumentChunker(chunk_size=chunk_size, overlap=50)
+                    for i, (chunk, location) in enumerate(chunker.chunk_pages(pages)):
+                        queued = self._put(chunk_queue, (chunk, {
+                            "source": file_path.name,
+                            "type": manual_type,
+                            "chunk_id": i,
+                            **location,
+                            "hash": chunk_hash(chunk)
+                        }), stop)
+                        if not queued:
+                            # The consumer failed: drop pending extractions so the pool exits now
+                            executor.shutdown(wait=True, cancel_futures=True)
+                            return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            self._put(chunk_queue, None, stop)
+    
+    def _encode(self, texts: List[str], pool) -> np.ndarray:
+        """Encode a batch, skipping chunks already in the embedding cache"""
+        encoder = None
+        if pool is not None:
+            def encoder(missing):
+                return self.model.model.encode_multi_process(missing, pool, batch_size=64)
+        return self.model.encode_documents(texts, batch_size=64, encoder=encoder)
+    
+    def run(self, sources: List[Tuple[Path, str, int]], index_type: str = "flat", **build_options):
+        """Ingest all sources and publish index, chunk store and type array as a new version"""
+        version = IndexVersionWriter(str(EMBEDDINGS_PATH))
+        metadata_dir = version.metadata_dir
+        
+        print(f"\n🔄 Streaming ingestion: {self.workers} extraction workers, "
+              f"batch {self.batch_size}, queue {self.queue_size}")
+        
+        chunk_queue = queue.Queue(maxsize=self.queue_size)
+        errors = []
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=self._produce, args=(sources, chunk_queue, errors, stop), daemon=True
+        )
+        
+        pool = None
+        try:
+            builder = StreamingIndexBuilder(self.model.dimension, index_type, **build_options)
+            chunk_type_list = []
+            if self.encode_processes > 1 and self.model.backend != "torch":
+                # ONNX Runtime already spreads each batch over all cores
+                print(f"  ⚠️  --encode-processes ignored with the {self.model.backend} backend")
+            elif self.encode_processes > 1:
+                pool = self.model.model.start_multi_process_pool(["cpu"] * self.encode_processes)
+            
+            start = time.perf_counter()
+            producer.start()
+            try:
+                with ChunkStoreWriter(str(metadata_dir)) as writer:
+                    finished = False
+                    while not finished:
+                        batch = []
+                        while len(batch) < self.batch_size:
+                            item = chunk_queue.get()
+                            if item is None:
+                                finished = True
+                                break
+                            batch.append(item)
+                        
+                        if not batch:
+                            continue
+                        
+                        builder.add(self._encode([chunk for chunk, _ in batch], pool))
+                        for chunk, meta in batch:
+                            writer.append(chunk, meta)
+                            chunk_type_list.append(meta["type"])
+                        self.chunks += len(batch)
+                    
+                    producer.join()
+                    if errors:
+                        raise errors[0]
+                    if not self.chunks:
+                        raise ValueError("No chunks were produced")
+            finally:
+                # If encoding or writing failed, stop the producer and empty the
+                # queue so it is not left blocked on put() holding its process pool
+                stop.set()
+                while producer.is_alive():
+                    try:
+                        chunk_queue.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+                if pool is not None:
+                    self.model.model.stop_multi_process_pool(pool)
+            
+            # Everything up to the manifest belongs to the unpublished version
+            index = builder.finish()
+            save_type_array(metadata_dir, chunk_type_list)
+            faiss.write_index(index, str(version.index_path))
+            version.publish(
+                index_type=index_type,
+                total_chunks=index.ntotal,
+                dimension=index.d,
+                sources=sorted({path.name for path, _, _ in sources})
+            )
+        except BaseException:
+            version.discard()
+            raise
+        
+        elapsed = time.perf_counter() - start
+        print(f"\n💾 FAISS index saved to: {version.index_path} ({index.ntotal} vectors, version {version.version})")
+        print(f"📊 {self.pages} pages, {self.chunks} chunks in {elapsed:.1f}s "
+              f"({self.pages / elapsed:.1f} pages/s, {self.chunks / elapsed:.1f} chunks/s)")
+        return index
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the manual RAG index")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat",
+                        help="FAISS index type to build (default: flat)")
+    parser.add_argument("--nlist", type=int, default=None,
+                        help="IVF cell count (default: ~4*sqrt(chunks))")
+    parser.add_argument("--pq-m", type=int, default=16,
+                        help="IVF-PQ sub-quantizers, must divide 384 (default: 16)")
+    parser.add_argument("--hnsw-m", type=int, default=32,
+                        help="HNSW graph degree (default: 32)")
+    parser.add_argument("--compare-index-types", action="store_true",
+                        help="Print a recall@k vs latency report for every index type")
+    parser.add_argument("--report-k", type=int, default=5,
+                        help="k used for the recall report (default: 5)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Streaming parallel ingestion with bounded memory")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="PDF extraction processes in pipeline mode (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=256,
+                        help="Chunks per encode/index batch in pipeline mode (default: 256)")
+    parser.add_argument("--queue-size", type=int, default=2048,
+                        help="Max chunks buffered between extraction and encoding (default: 2048)")
+    parser.add_argument("--encode-processes", type=int, default=0,
+                        help="Multi-process encode pool size in pipeline mode (default: off)")
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
+    build_options = {"nlist": args.nlist, "pq_m": args.pq_m, "hnsw_m": args.hnsw_m}
+    
     print("=" * 60)
     print("🚀 MANUAL PROCESSING & RAG SYSTEM SETUP")
     print("=" * 60)
     
+    if args.pipeline:
+        run_pipeline(args, build_options)
+        return
+    
     processor = ManualProcessor()
     
     # Process FX5U manuals
@@ -178,26 +421,18 @@ def main():
     datatype_file = MANUALS_PATH / "datatype_converted.txt"
     if datatype_file.exists():
         print(f"\n📁 Processing datatype conversion rules")
-        text = processor.extract_text_from_txt(datatype_file)
-        if text:
-            chunks = processor.chunk_text(text, chunk_size=300)
-            print(f"    ✅ Created {len(chunks)} chunks")
-            for i, chunk in enumerate(chunks):
-                processor.chunks.append(chunk)
-                processor.metadata.append({
-                    "source": "datatype_converted.txt",
-                    "type": "Datatype_Rules",
-                    "chunk_id": i,
-                    "total_chunks": len(chunks)
-                })
+        processor.chunk_file(datatype_file, "Datatype_Rules", chunk_size=300)
     
     # Create embeddings
     embeddings = processor.create_embeddings()
     
     if embeddings is not None:
+        if args.compare_index_types:
+            processor.report_index_types(embeddings, k=args.report_k, **build_options)
+        
         # Create and save FAISS index
-        index = processor.create_faiss_index(embeddings)
-        processor.save_index(index)
+        index = processor.create_faiss_index(embeddings, args.index_type, **build_options)
+        processor.save_index(index, args.index_type)
         
         print("\n" + "=" * 60)
         print("✅ RAG SYSTEM SETUP COMPLETE!")
@@ -212,5 +447,37 @@ def main():
         print(f"  - {datatype_file}")
 
 
+def run_pipeline(args, build_options):
+    """Streaming ingestion of every manual folder"""
+    sources = []
+    for folder, manual_type in ((MANUALS_PATH / "fx5u", "FX5U"), (MANUALS_PATH / "gx_works3", "GX_Works3")):
+        if folder.exists():
+            for file_path in sorted(folder.glob("*.pdf")) + sorted(folder.glob("*.txt")):
+                sources.append((file_path, manual_type, 500))
+    
+    datatype_file = MANUALS_PATH / "datatype_converted.txt"
+    if datatype_file.exists():
+        sources.append((datatype_file, "Datatype_Rules", 300))
+    
+    if not sources:
+        print("\n❌ No manuals found to process!")
+        return
+    
+    if args.compare_index_types:
+        print("⚠️  --compare-index-types needs all vectors in memory; skipped in pipeline mode")
+    
+    processor = PipelinedManualProcessor(
+        workers=args.workers,
+        batch_size=args.batch_size,
+        queue_size=args.queue_size,
+        encode_processes=args.encode_processes
+    )
+    processor.run(sources, args.index_type, **build_options)
+    
+    print("\n" + "=" * 60)
+    print("✅ RAG SYSTEM SETUP COMPLETE!")
+    print("=" * 60)
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file